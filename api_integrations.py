@@ -5,90 +5,328 @@ Functions for fetching market data and symbol search.
 """
 import yfinance as yf
 import ccxt
-import requests
+import numpy as np
+import pandas as pd
 from forex_python.converter import CurrencyRates
 import os
-from typing import List, Dict
+import re
+import threading
+import time
+from typing import List, Dict, Optional
 from datetime import datetime
 
+from fx_rates import FxRateService
+from history_cache import cached_history
+from database import load_symbols, upsert_symbols, get_watched_symbols
+from news_cache import NewsCache
+from symbol_index import SymbolIndex
+from quote_cache import QuoteCache
+from utils import get_redis_client, rate_limit
+
 # Load environment variable for News API
 NEWS_API_KEY = os.getenv("NEWS_API_KEY", "3d4047894a154d58bc3aa54377b63659")
 
+# Shared quote cache: every caller (websocket endpoints, broadcaster, pages) goes through it
+QUOTE_TTL = float(os.getenv("CROSSP_QUOTE_TTL", "5"))
+quote_cache = QuoteCache(ttl=QUOTE_TTL, redis_client=get_redis_client())
+
+# Max tickers per yf.download call
+YF_BATCH_SIZE = int(os.getenv("CROSSP_YF_BATCH_SIZE", "50"))
+
 # ---------------------------
 # Price & Market Data Helpers
 # ---------------------------
 def get_current_prices(symbols: List[str]) -> Dict[str, float]:
-    """Fetch current prices for a list of symbols using yfinance/ccxt."""
+    """Current prices for a list of symbols, served from the shared quote cache."""
+    return quote_cache.get_many(symbols, _fetch_current_prices)
+
+def _fetch_current_prices(symbols: List[str]) -> Dict[str, float]:
+    """Fetch current prices for a list of symbols using yfinance/ccxt (uncached)."""
     prices = {}
-    for sym in symbols:
+    crypto = {sym: _to_ccxt_symbol(sym) for sym in symbols if is_ccxt_symbol(sym)}
+    if crypto:
+        tickers = fetch_ccxt_tickers(list(crypto.values()))
+        for sym, market in crypto.items():
+            last = (tickers.get(market) or {}).get("last")
+            prices[sym] = round(last, 2) if last is not None else None
+    equities = [sym for sym in symbols if sym not in crypto]
+    if equities:
+        closes = fetch_yfinance_prices(equities)
+        for sym in equities:
+            last = closes.get(sym, np.nan)
+            prices[sym] = None if np.isnan(last) else round(float(last), 2)
+    return prices
+
+def fetch_yfinance_prices(symbols: List[str], batch_size: int=None) -> pd.Series:
+    """
+    Latest close for many stock/commodity/index symbols as a float Series indexed by symbol
+    (NaN where unknown). Symbols are resolved with one multi-ticker yf.download per batch of
+    `batch_size`; only symbols missing from a batch fall back to a per-symbol history call.
+    """
+    batch_size = batch_size or YF_BATCH_SIZE
+    symbols = list(dict.fromkeys(symbols))
+    closes = pd.Series(np.nan, index=symbols, dtype=float)
+    for i in range(0, len(symbols), batch_size):
+        chunk = symbols[i:i + batch_size]
         try:
-            # Check if it's crypto/forex (contains -) else treat as stock/commodity
-            if "-" in sym:
-                exchange = ccxt.binance()
-                ticker = exchange.fetch_ticker(sym)
-                prices[sym] = round(ticker["last"], 2)
-            else:
-                ticker = yf.Ticker(sym)
-                data = ticker.history(period="1d")
-                if not data.empty:
-                    prices[sym] = round(data["Close"].iloc[-1], 2)
+            df = yf.download(tickers=chunk, period="5d", interval="1d", group_by="column",
+                             auto_adjust=False, threads=True, progress=False)
+            if not df.empty:
+                if isinstance(df.columns, pd.MultiIndex):
+                    close = df["Close"]
+                else:
+                    close = df[["Close"]].set_axis(chunk[:1], axis=1)
+                last = close.ffill().iloc[-1]
+                closes.update(last.reindex(chunk))
         except Exception:
-            prices[sym] = None
-    return prices
+            pass
+    for sym in closes.index[closes.isna()]:
+        try:
+            data = yf.Ticker(sym).history(period="1d")
+            if not data.empty:
+                closes[sym] = data["Close"].iloc[-1]
+        except Exception:
+            pass
+    return closes
 
-def search_symbol(symbol: str) -> Dict:
-    """Resolve symbol info using yfinance."""
+# ---------------------------
+# ccxt exchange registry
+# ---------------------------
+class ExchangeRegistry:
+    """
+    Creates each ccxt exchange once and reuses it (and its HTTP session) for every call.
+    Market lists are loaded once and refreshed every `markets_ttl` seconds.
+    """
+    def __init__(self, markets_ttl: float=3600.0):
+        self.markets_ttl = markets_ttl
+        self._exchanges: Dict[str, "ccxt.Exchange"] = {}
+        self._loaded_at: Dict[str, float] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, name: str="binance"):
+        name = name.lower()
+        with self._lock:
+            exchange = self._exchanges.get(name)
+            if exchange is None:
+                exchange_cls = getattr(ccxt, name, None)
+                if exchange_cls is None:
+                    raise ValueError(f"Unknown ccxt exchange: {name}")
+                exchange = exchange_cls({"enableRateLimit": True})
+                self._exchanges[name] = exchange
+                self._locks[name] = threading.Lock()
+            lock = self._locks[name]
+        if time.monotonic() - self._loaded_at.get(name, float("-inf")) > self.markets_ttl:
+            with lock:
+                # re-check: another thread may have refreshed while we waited
+                if time.monotonic() - self._loaded_at.get(name, float("-inf")) > self.markets_ttl:
+                    exchange.load_markets(reload=name in self._loaded_at)
+                    self._loaded_at[name] = time.monotonic()
+        return exchange
+
+    def markets(self, name: str="binance") -> Dict:
+        return self.get(name).markets or {}
+
+exchanges = ExchangeRegistry(markets_ttl=float(os.getenv("CROSSP_MARKETS_TTL", "3600")))
+
+def is_ccxt_symbol(sym: str) -> bool:
+    """Crypto/forex pairs (contain / or -) are priced via ccxt; everything else via yfinance."""
+    return "/" in sym or "-" in sym
+
+def _to_ccxt_symbol(sym: str) -> str:
+    """Map 'BTC-USDT' style symbols to ccxt's unified 'BTC/USDT'."""
+    return sym.upper().replace("-", "/") if "/" not in sym else sym.upper()
+
+def fetch_ccxt_ticker(symbol: str, exchange_name: str='binance') -> Dict:
+    """Fetch a single ticker from a ccxt exchange. Returns {'error': ...} on failure."""
     try:
-        ticker = yf.Ticker(symbol)
-        info = ticker.info
-        return {
-            "symbol": symbol.upper(),
-            "name": info.get("shortName"),
-            "currency": info.get("currency"),
-            "exchange": info.get("exchange"),
-        }
-    except Exception:
-        return {"error": "Symbol not found"}
+        return exchanges.get(exchange_name).fetch_ticker(_to_ccxt_symbol(symbol))
+    except Exception as e:
+        return {"error": str(e)}
 
-def get_market_news(keyword: str = None) -> List[Dict]:
-    """Fetch recent market news from NewsAPI."""
-    base_url = "https://newsapi.org/v2/everything"
-    params = {
-        "apiKey": NEWS_API_KEY,
-        "language": "en",
-        "pageSize": 10,
-        "sortBy": "publishedAt"
-    }
-    if keyword:
-        params["q"] = keyword
-    else:
-        params["q"] = "stocks OR crypto OR finance"
+def fetch_ccxt_tickers(symbols: List[str], exchange_name: str='binance') -> Dict[str, Optional[Dict]]:
+    """
+    Fetch many tickers in one request with fetch_tickers where the exchange supports it.
+    Symbols the exchange does not list map to None instead of failing the whole batch.
+    """
+    result: Dict[str, Optional[Dict]] = {s: None for s in symbols}
+    try:
+        exchange = exchanges.get(exchange_name)
+        known = [s for s in symbols if s in (exchange.markets or {})]
+        if not known:
+            return result
+        if exchange.has.get("fetchTickers"):
+            tickers = exchange.fetch_tickers(known)
+            for s in known:
+                result[s] = tickers.get(s)
+        else:
+            for s in known:
+                try:
+                    result[s] = exchange.fetch_ticker(s)
+                except Exception:
+                    pass
+    except Exception:
+        pass
+    return result
 
+def fetch_ccxt_ohlcv(symbol: str, timeframe: str='1h', limit: int=100, exchange_name: str='binance') -> List[List[float]]:
+    """OHLCV candles ([ts, open, high, low, close, volume]) from a ccxt exchange; [] on failure."""
     try:
-        resp = requests.get(base_url, params=params)
-        if resp.status_code != 200:
-            return []
-        articles = resp.json().get("articles", [])
-        return [
-            {
-                "title": a["title"],
-                "summary": a.get("description"),
-                "url": a["url"],
-                "publishedAt": a["publishedAt"]
-            }
-            for a in articles
-        ]
+        return exchanges.get(exchange_name).fetch_ohlcv(_to_ccxt_symbol(symbol), timeframe=timeframe, limit=limit)
     except Exception:
         return []
 
 # ---------------------------
-# Currency Conversion
+# Historical candles
 # ---------------------------
-def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
-    """Convert amount from one currency to another using forex-python."""
+OHLCV_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+_INTERVAL_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+
+def fetch_yfinance_history(symbol: str, period: str='1mo', interval: str='1d', start: Optional[datetime]=None) -> pd.DataFrame:
+    """yfinance OHLCV history (Open/High/Low/Close/Volume); empty frame on failure."""
     try:
-        c = CurrencyRates()
-        rate = c.get_rate(from_currency, to_currency)
-        return round(amount * rate, 2)
+        if start is not None:
+            return yf.Ticker(symbol).history(start=start, interval=interval)
+        return yf.Ticker(symbol).history(period=period, interval=interval)
     except Exception:
-        return amount
+        return pd.DataFrame(columns=OHLCV_COLUMNS)
+
+def fetch_ohlcv_history(symbol: str, interval: str='1h', limit: int=100) -> pd.DataFrame:
+    """
+    The last `limit` candles for any symbol as an OHLCV DataFrame with a UTC DatetimeIndex.
+    Served from the persistent history cache; upstream is only asked for the missing tail.
+    """
+    return cached_history(symbol, interval, limit, _fetch_ohlcv_upstream)
+
+def _fetch_ohlcv_upstream(symbol: str, interval: str='1h', limit: int=100) -> pd.DataFrame:
+    """Uncached candles, routed to ccxt or yfinance like get_current_prices."""
+    if is_ccxt_symbol(symbol):
+        rows = fetch_ccxt_ohlcv(symbol, timeframe=interval, limit=limit)
+        if not rows:
+            return pd.DataFrame(columns=OHLCV_COLUMNS)
+        df = pd.DataFrame(rows, columns=["ts"] + OHLCV_COLUMNS)
+        df.index = pd.to_datetime(df.pop("ts"), unit="ms", utc=True)
+        return df
+    # markets are closed nights/weekends, so ask for ~2x the calendar span needed
+    span = pd.Timedelta(seconds=_INTERVAL_SECONDS.get(interval, 86400) * limit * 2)
+    df = fetch_yfinance_history(symbol, interval=interval, start=(pd.Timestamp.utcnow() - span).to_pydatetime())
+    if df.empty:
+        return df
+    return df[OHLCV_COLUMNS].tail(limit)
+
+# ---------------------------
+# Symbol Search
+# ---------------------------
+def _lookup_yfinance_symbol(symbol: str) -> Optional[Dict]:
+    """Slow path: resolve one symbol through yfinance's info endpoint."""
+    info = yf.Ticker(symbol).info or {}
+    name = info.get("shortName") or info.get("longName")
+    if not name:
+        return None
+    return {"symbol": symbol.upper(), "name": name, "currency": info.get("currency"),
+            "exchange": info.get("exchange"), "asset_type": (info.get("quoteType") or "equity").lower(),
+            "source": "yfinance"}
+
+def _ccxt_symbol_records(exchange_name: str='binance') -> List[Dict]:
+    """Every active market on the exchange (market list is already cached by the registry)."""
+    return [{"symbol": m["symbol"], "name": f"{m.get('base')} / {m.get('quote')}", "currency": m.get("quote"),
+             "exchange": exchange_name, "asset_type": "crypto", "source": "ccxt"}
+            for m in exchanges.markets(exchange_name).values() if m.get("active", True) is not False]
+
+def _forex_symbol_records() -> List[Dict]:
+    """Yahoo forex pairs (EURUSD=X) for every fiat currency in the FX table."""
+    crypto = set(fx_rates.crypto_codes) | set(fx_rates.pegs)
+    fiat = [c for c in fx_rates.currencies() if c not in crypto]
+    return [{"symbol": f"{a}{b}=X", "name": f"{a}/{b}", "currency": b, "exchange": "CCY",
+             "asset_type": "forex", "source": "yfinance"}
+            for a in fiat for b in fiat if a != b]
+
+symbol_index = SymbolIndex(
+    lookup=_lookup_yfinance_symbol,
+    sources=[_ccxt_symbol_records, _forex_symbol_records],
+    load=load_symbols,
+    save=upsert_symbols,
+    refresh_interval=float(os.getenv("CROSSP_SYMBOL_REFRESH", str(6 * 3600))),
+    negative_ttl=float(os.getenv("CROSSP_SYMBOL_NEGATIVE_TTL", "900")),
+)
+
+def search_symbol(symbol: str) -> Dict:
+    """Resolve symbol info from the local index (yfinance only on a first-time miss)."""
+    rec = symbol_index.resolve(symbol)
+    if not rec:
+        return {"error": "Symbol not found"}
+    return {k: rec.get(k) for k in ("symbol", "name", "currency", "exchange")}
+
+def smart_symbol_resolve(query: str) -> Dict:
+    """Best match for a ticker or name: exact/variant symbol first, then name search."""
+    rec = symbol_index.resolve(query) or next(iter(symbol_index.search(query, limit=1)), None)
+    return dict(rec) if rec else {"error": "Symbol not found", "query": query}
+
+def yahoo_symbol_search(query: str, limit: int=10) -> List[Dict]:
+    """Prefix/fuzzy search over the local symbol index."""
+    return [dict(r) for r in symbol_index.search(query, limit=limit)]
+
+# ---------------------------
+# News
+# ---------------------------
+NEWS_QUOTA = int(os.getenv("CROSSP_NEWS_QUOTA", "100"))                 # upstream calls ...
+NEWS_QUOTA_WINDOW = int(os.getenv("CROSSP_NEWS_QUOTA_WINDOW", "86400"))  # ... per window (seconds)
+
+# Shared news cache; the quota goes through utils.rate_limit so it is enforced across
+# processes whenever Redis is configured.
+news_cache = NewsCache(
+    api_key=NEWS_API_KEY,
+    base_url=os.getenv("CROSSP_NEWS_URL", "https://newsapi.org/v2/everything"),
+    ttl=float(os.getenv("CROSSP_NEWS_TTL", "300")),
+    timeout=float(os.getenv("CROSSP_NEWS_TIMEOUT", "5")),
+    quota_check=lambda: rate_limit("upstream:newsapi", NEWS_QUOTA, NEWS_QUOTA_WINDOW),
+)
+
+def get_market_news(keyword: str = None, page: int=1, page_size: int=10) -> List[Dict]:
+    """Recent market news for `keyword` (default: broad market query), served from the cache."""
+    return news_cache.get(keyword, page, page_size)["articles"]
+
+def fetch_news(query: str = None, page_size: int=10) -> List[Dict]:
+    """News in NewsAPI's article shape (description, source.name) for the dashboard."""
+    return [{**a, "description": a.get("summary"), "source": {"name": a.get("source")}}
+            for a in get_market_news(query, 1, page_size)]
+
+def watched_news_keywords(limit: int=20) -> List[str]:
+    """News keywords for the most-watched symbols: BTC/USDT -> BTC, EURUSD=X -> EURUSD."""
+    return [re.split(r"[/=\-]", s)[0] for s in get_watched_symbols(limit)]
+
+# ---------------------------
+# Currency Conversion
+# ---------------------------
+def _fetch_fiat_rates(base: str) -> Dict[str, float]:
+    """Whole fiat table for `base` in one forex-python call."""
+    return CurrencyRates().get_rates(base)
+
+def _fetch_crypto_usd(codes: List[str]) -> Dict[str, float]:
+    """USD price per coin (quoted against USDT) for crypto currency codes."""
+    markets = {c: f"{c}/USDT" for c in codes}
+    tickers = fetch_ccxt_tickers(list(markets.values()))
+    return {c: (tickers.get(m) or {}).get("last") for c, m in markets.items()}
+
+# Shared FX matrix: fiat refreshed once per TTL, crypto codes priced via ccxt,
+# stablecoins at par with USD. Set CROSSP_FX_FIXTURE to a JSON file to run offline.
+fx_rates = FxRateService(
+    base=os.getenv("CROSSP_FX_BASE", "USD"),
+    ttl=float(os.getenv("CROSSP_FX_TTL", "3600")),
+    fiat_fetcher=_fetch_fiat_rates,
+    crypto_fetcher=_fetch_crypto_usd,
+    crypto_codes=[c for c in os.getenv("CROSSP_FX_CRYPTO", "BTC,ETH").split(",") if c],
+    pegs={"USDT": "USD", "USDC": "USD", "BUSD": "USD", "DAI": "USD"},
+    fixture_path=os.getenv("CROSSP_FX_FIXTURE") or None,
+)
+
+def get_currency_rate(from_currency: str, to_currency: str) -> Optional[float]:
+    """Units of to_currency per unit of from_currency, or None if either is unknown."""
+    if from_currency.upper() == to_currency.upper():
+        return 1.0
+    return fx_rates.rate(from_currency, to_currency)
+
+def convert_currency(amount: float, from_currency: str, to_currency: str) -> float:
+    """Convert amount from one currency to another (unchanged if no rate is available)."""
+    converted = fx_rates.convert(amount, from_currency, to_currency)
+    return amount if converted is None else round(converted, 2)
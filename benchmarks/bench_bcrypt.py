@@ -0,0 +1,62 @@
+"""
+benchmarks/bench_bcrypt.py
+
+Login burst throughput: `--logins` concurrent password checks on an asyncio loop, calling
+bcrypt inline (blocks the loop) vs utils.check_password_async on bcrypt pools of growing
+size. Also reports the worst event-loop stall seen by a 10 ms heartbeat while the burst
+runs. Throughput scales with workers up to the number of cores (bcrypt releases the GIL).
+
+    python benchmarks/bench_bcrypt.py --logins 64 --rounds 12
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+async def _heartbeat(stop: asyncio.Event, lags: list):
+    while not stop.is_set():
+        t = time.perf_counter()
+        await asyncio.sleep(0.01)
+        lags.append(time.perf_counter() - t - 0.01)
+
+async def _burst(check, n: int):
+    stop, lags = asyncio.Event(), []
+    beat = asyncio.create_task(_heartbeat(stop, lags))
+    await asyncio.sleep(0)
+    t0 = time.perf_counter()
+    await asyncio.gather(*(check() for _ in range(n)))
+    elapsed = time.perf_counter() - t0
+    stop.set()
+    await beat
+    return elapsed, max(lags, default=0.0)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--logins", type=int, default=64)
+    parser.add_argument("--rounds", type=int, default=12)
+    args = parser.parse_args()
+
+    stored = utils.hash_password("correct horse", rounds=args.rounds)
+    cores = os.cpu_count() or 1
+    print(f"{args.logins} concurrent logins, bcrypt cost {args.rounds}, {cores} cores")
+
+    async def inline():
+        return utils.check_password("correct horse", stored)
+    elapsed, lag = asyncio.run(_burst(inline, args.logins))
+    print(f"  inline (blocks loop) : {args.logins / elapsed:7.1f} logins/s, worst loop stall {lag * 1000:7.1f} ms")
+
+    for workers in sorted({1, 2, 4, cores, cores * 2}):
+        utils._bcrypt_pool = ThreadPoolExecutor(max_workers=workers)
+        async def pooled():
+            return await utils.check_password_async("correct horse", stored)
+        elapsed, lag = asyncio.run(_burst(pooled, args.logins))
+        utils._bcrypt_pool.shutdown()
+        print(f"  pool x{workers:<2}             : {args.logins / elapsed:7.1f} logins/s, worst loop stall {lag * 1000:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
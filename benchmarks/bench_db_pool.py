@@ -0,0 +1,82 @@
+"""
+benchmarks/bench_db_pool.py
+
+Compares the old connect-per-call pattern against the pooled WAL connections in database.py.
+Run from the repository root:
+
+    python benchmarks/bench_db_pool.py --ops 5000
+"""
+import argparse
+import os
+import sqlite3
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _connect_per_call(path):
+    conn = sqlite3.connect(path, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    return conn
+
+def bench_legacy(path, user_id, ops):
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        conn = _connect_per_call(path)
+        cur = conn.cursor()
+        cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", (user_id, "USD"))
+        cur.fetchone()
+        conn.close()
+    reads = ops / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for i in range(ops):
+        conn = _connect_per_call(path)
+        cur = conn.cursor()
+        cur.execute("INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, "AAPL", "stock", "BUY", 1.0, 100.0 + i, "USD", str(i)))
+        conn.commit()
+        conn.close()
+    writes = ops / (time.perf_counter() - t0)
+    return reads, writes
+
+def bench_pooled(db, user_id, ops):
+    t0 = time.perf_counter()
+    for _ in range(ops):
+        db.get_balance(user_id, "USD")
+    reads = ops / (time.perf_counter() - t0)
+    t0 = time.perf_counter()
+    for i in range(ops):
+        db.add_transaction(user_id, "AAPL", "stock", "BUY", 1.0, 100.0 + i, "USD")
+    writes = ops / (time.perf_counter() - t0)
+    return reads, writes
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--ops", type=int, default=2000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        legacy_path = os.path.join(tmp, "legacy.db")
+        os.environ["CROSSP_DB"] = legacy_path
+        import database as db
+        uid = db.create_user("bench_legacy", b"x")
+        db.close_connections()
+        # legacy journal mode for a fair "before" number
+        conn = sqlite3.connect(legacy_path)
+        conn.execute("PRAGMA journal_mode=DELETE")
+        conn.close()
+        legacy = bench_legacy(legacy_path, uid, args.ops)
+
+        db.DB_PATH = os.path.join(tmp, "pooled.db")
+        db.init_db()
+        uid = db.create_user("bench_pooled", b"x")
+        pooled = bench_pooled(db, uid, args.ops)
+        db.close_connections()
+
+    print(f"{'mode':<20}{'reads/s':>14}{'writes/s':>14}")
+    print(f"{'connect-per-call':<20}{legacy[0]:>14,.0f}{legacy[1]:>14,.0f}")
+    print(f"{'pooled WAL':<20}{pooled[0]:>14,.0f}{pooled[1]:>14,.0f}")
+
+if __name__ == "__main__":
+    main()
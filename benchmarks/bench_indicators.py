@@ -0,0 +1,88 @@
+"""
+benchmarks/bench_indicators.py
+
+Cost of refreshing technical indicators across a watchlist: the old per-symbol
+pandas recompute (rolling/ewm over the whole history on every rerun) vs the
+indicators.py kernels over a (T, S) matrix vs IndicatorCache, which only folds
+in the bars appended since the previous call.
+
+    python benchmarks/bench_indicators.py --symbols 200 --bars 2000 --new-bars 1
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import indicators as ind
+
+def _frames(symbols: int, bars: int, seed: int=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=(bars, symbols)), axis=0)
+    index = pd.date_range("2020-01-01", periods=bars, freq="h")
+    frames = {}
+    for i in range(symbols):
+        c = close[:, i]
+        frames[f"SYM{i}"] = pd.DataFrame({"Open": c, "High": c + 0.5, "Low": c - 0.5,
+                                          "Close": c, "Volume": rng.random(bars) * 1000}, index=index)
+    return frames, close
+
+def _pandas_rsi(close: pd.Series, n: int=14) -> pd.Series:
+    delta = close.diff()
+    gain = delta.clip(lower=0).ewm(alpha=1 / n, adjust=False).mean()
+    loss = (-delta.clip(upper=0)).ewm(alpha=1 / n, adjust=False).mean()
+    return 100 - 100 / (1 + gain / loss)
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=200)
+    parser.add_argument("--bars", type=int, default=2000)
+    parser.add_argument("--new-bars", type=int, default=1)
+    parser.add_argument("--rounds", type=int, default=5)
+    args = parser.parse_args()
+
+    frames, matrix = _frames(args.symbols, args.bars + args.new_bars * args.rounds)
+    base = args.bars
+
+    # --- naive: full pandas recompute per symbol, every round
+    t0 = time.perf_counter()
+    for r in range(args.rounds):
+        end = base + args.new_bars * (r + 1)
+        for df in frames.values():
+            close = df["Close"].iloc[:end]
+            close.rolling(10).mean()
+            _pandas_rsi(close)
+    naive = (time.perf_counter() - t0) / args.rounds
+
+    # --- vectorized: one kernel call over the whole (T, S) matrix
+    t0 = time.perf_counter()
+    for r in range(args.rounds):
+        end = base + args.new_bars * (r + 1)
+        ind.sma(matrix[:end], 10)
+        ind.rsi(matrix[:end], 14)
+    vectorized = (time.perf_counter() - t0) / args.rounds
+
+    # --- incremental: warm the cache, then time only the appended bars
+    cache = ind.IndicatorCache(max_entries=args.symbols * 2, max_bars=base + args.new_bars * args.rounds)
+    for sym, df in frames.items():
+        cache.compute(sym, "1h", df.iloc[:base], "sma", n=10)
+        cache.compute(sym, "1h", df.iloc[:base], "rsi", n=14)
+    t0 = time.perf_counter()
+    for r in range(args.rounds):
+        end = base + args.new_bars * (r + 1)
+        for sym, df in frames.items():
+            cache.compute(sym, "1h", df.iloc[:end], "sma", n=10)
+            cache.compute(sym, "1h", df.iloc[:end], "rsi", n=14)
+    incremental = (time.perf_counter() - t0) / args.rounds
+
+    print(f"{args.symbols} symbols x {args.bars} bars, +{args.new_bars} bar(s)/round, SMA(10)+RSI(14)")
+    print(f"  pandas per symbol : {naive * 1000:9.1f} ms/round")
+    print(f"  vectorized (T, S) : {vectorized * 1000:9.1f} ms/round  ({naive / vectorized:.1f}x)")
+    print(f"  incremental cache : {incremental * 1000:9.1f} ms/round  ({naive / incremental:.1f}x)")
+    print(f"  cache stats       : {cache.stats}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+benchmarks/bench_ledger.py
+
+Compares per-order database.execute_order against the write-behind ledger (ledger.py),
+then times the ledger's flush and a crash-recovery replay of an unflushed journal.
+Run from the repository root:
+
+    python benchmarks/bench_ledger.py --orders 20000 --users 50
+    python benchmarks/bench_ledger.py --fsync
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+SYMBOLS = ["AAPL", "MSFT", "NVDA", "TSLA", "AMZN"]
+
+def make_orders(user_ids, n, seed=7):
+    rnd = random.Random(seed)
+    out = []
+    for i in range(n):
+        # buy-heavy so sells usually have something to sell
+        side = "BUY" if i % 3 else "SELL"
+        out.append((rnd.choice(user_ids), rnd.choice(SYMBOLS), "stock", side, 1.0,
+                    round(rnd.uniform(90, 110), 2), "USD", "USD"))
+    return out
+
+def run(execute, orders, OrderError):
+    rejected = 0
+    t0 = time.perf_counter()
+    for o in orders:
+        try:
+            execute(*o)
+        except OrderError:
+            rejected += 1
+    return time.perf_counter() - t0, rejected
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--orders", type=int, default=10000)
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--fsync", action="store_true", help="fsync the journal on every append")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CROSSP_DB"] = os.path.join(tmp, "direct.db")
+        import database as db
+        import ledger
+        uids = [db.create_user(f"direct{i}", b"x") for i in range(args.users)]
+        orders = make_orders(uids, args.orders)
+        direct, direct_rej = run(db.execute_order, orders, db.OrderError)
+        db.close_connections()
+
+        db.DB_PATH = os.path.join(tmp, "ledger.db")
+        db.init_db()
+        uids = [db.create_user(f"ledger{i}", b"x") for i in range(args.users)]
+        orders = make_orders(uids, args.orders)
+        journal = os.path.join(tmp, "ledger.journal")
+        led = ledger.Ledger(journal, fsync=args.fsync, max_pending=10 ** 9)
+        led.open()
+        applied, ledger_rej = run(led.execute_order, orders, db.OrderError)
+        t0 = time.perf_counter()
+        flushed = led.flush()
+        flush = time.perf_counter() - t0
+
+        # unflushed journal, then "crash" and recover
+        applied2, _ = run(led.execute_order, orders, db.OrderError)
+        led._journal.close()
+        led._lock_file.close()
+        recovered = ledger.Ledger(journal)
+        t0 = time.perf_counter()
+        replayed = recovered.open()
+        replay = time.perf_counter() - t0
+        recovered.close()
+        db.close_connections()
+
+    n = args.orders
+    print(f"{'mode':<28}{'orders/s':>14}{'us/order':>12}{'rejected':>10}")
+    print(f"{'execute_order (SQLite)':<28}{n / direct:>14,.0f}{direct / n * 1e6:>12.1f}{direct_rej:>10}")
+    label = "ledger (journal" + (" + fsync)" if args.fsync else ")")
+    print(f"{label:<28}{n / applied:>14,.0f}{applied / n * 1e6:>12.1f}{ledger_rej:>10}")
+    print(f"flush: {flushed} transactions in {flush * 1000:.1f} ms; "
+          f"recovery: {replayed} entries replayed in {replay * 1000:.1f} ms "
+          f"(second run {n / applied2:,.0f} orders/s)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,61 @@
+"""
+benchmarks/bench_portfolio_engine.py
+
+Per-tick cost of revaluing a portfolio: the old pages/portfolio.py loop (a df.loc
+assignment per symbol plus a full "Total Value" recompute each time) vs
+PortfolioEngine.set_prices (one scatter) and update_price (single-symbol tick).
+
+    python benchmarks/bench_portfolio_engine.py --symbols 500 --ticks 50
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from portfolio_engine import PortfolioEngine
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=500)
+    parser.add_argument("--ticks", type=int, default=50)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    holdings = [{"symbol": f"SYM{i}", "asset_type": "stock", "quantity": rng.randint(1, 100),
+                 "avg_price": rng.uniform(10, 500)} for i in range(args.symbols)]
+    ticks = [{h["symbol"]: rng.uniform(10, 500) for h in holdings} for _ in range(args.ticks)]
+
+    df = pd.DataFrame(holdings)
+    df["Current Price"] = 0.0
+    df["Total Value"] = 0.0
+    t0 = time.perf_counter()
+    for prices in ticks:
+        for symbol, price in prices.items():
+            df.loc[df["symbol"] == symbol, "Current Price"] = price
+            df["Total Value"] = df["Current Price"] * df["quantity"]
+    naive = (time.perf_counter() - t0) / args.ticks
+
+    engine = PortfolioEngine(holdings)
+    t0 = time.perf_counter()
+    for prices in ticks:
+        engine.set_prices(prices)
+        engine.totals()
+    batch = (time.perf_counter() - t0) / args.ticks
+
+    t0 = time.perf_counter()
+    for prices in ticks:
+        symbol = rng.choice(holdings)["symbol"]
+        engine.update_price(symbol, prices[symbol])
+    single = (time.perf_counter() - t0) / args.ticks
+
+    print(f"{args.symbols} holdings, full price vector per tick")
+    print(f"  pandas loop      : {naive * 1000:9.2f} ms/tick")
+    print(f"  engine.set_prices: {batch * 1000:9.2f} ms/tick  ({naive / batch:.0f}x)")
+    print(f"  engine.update_price (1 symbol): {single * 1e6:.1f} us")
+
+if __name__ == "__main__":
+    main()
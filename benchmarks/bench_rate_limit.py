@@ -0,0 +1,111 @@
+"""
+benchmarks/bench_rate_limit.py
+
+Checks per second for utils.check_rate_limit (one atomic Lua call, sliding-window log or
+GCRA) vs the previous rate_limit (a pipeline plus three more round trips per check).
+Runs against fakeredis by default (needs `lupa` for Lua), or a real server via --redis-url.
+--rtt-ms adds a simulated network round trip to every command sent to fakeredis.
+--memory instead compares the in-process fallbacks: the old list-of-timestamps per key
+vs MemoryRateLimiter, including memory held after `--keys` distinct clients.
+
+    python benchmarks/bench_rate_limit.py --checks 20000
+    python benchmarks/bench_rate_limit.py --checks 2000 --rtt-ms 0.5
+    python benchmarks/bench_rate_limit.py --memory --checks 200000 --keys 100000
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import utils
+
+def legacy_rate_limit(client, key: str, limit: int=10, per_seconds: int=60) -> bool:
+    """The rate_limit implementation this replaced, kept for comparison."""
+    now = int(time.time())
+    redis_key = f"rl-legacy:{key}"
+    pipe = client.pipeline()
+    pipe.zremrangebyscore(redis_key, 0, now - per_seconds)
+    pipe.zcard(redis_key)
+    pipe.execute()
+    client.zadd(redis_key, {str(now): now})
+    client.expire(redis_key, per_seconds + 5)
+    count = client.zcard(redis_key)
+    return count <= limit
+
+def legacy_memory_rate_limit(buckets: dict, key: str, limit: int=10, per_seconds: int=60) -> bool:
+    """The previous in-memory fallback: a timestamp list per key, never evicted."""
+    bucket = [t for t in buckets.get(key, []) if t > time.time() - per_seconds]
+    if len(bucket) >= limit:
+        buckets[key] = bucket
+        return False
+    bucket.append(time.time())
+    buckets[key] = bucket
+    return True
+
+def _client(args):
+    import redis
+    if args.redis_url:
+        return redis.from_url(args.redis_url)
+    import fakeredis
+    client = fakeredis.FakeStrictRedis()
+    if args.rtt_ms:
+        conn_cls = client.connection_pool.connection_class
+        original = conn_cls.send_packed_command
+        def delayed(self, *a, **kw):
+            time.sleep(args.rtt_ms / 1000.0)
+            return original(self, *a, **kw)
+        conn_cls.send_packed_command = delayed
+    return client
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--checks", type=int, default=20000)
+    parser.add_argument("--keys", type=int, default=100)
+    parser.add_argument("--limit", type=int, default=1000)
+    parser.add_argument("--redis-url")
+    parser.add_argument("--rtt-ms", type=float, default=0.0)
+    parser.add_argument("--memory", action="store_true", help="benchmark the in-process fallbacks")
+    parser.add_argument("--max-keys", type=int, default=10000, help="MemoryRateLimiter cap (--memory)")
+    args = parser.parse_args()
+
+    def run(label, check):
+        t0 = time.perf_counter()
+        for i in range(args.checks):
+            check(f"user:{i % args.keys}")
+        elapsed = time.perf_counter() - t0
+        print(f"  {label:<26}: {args.checks / elapsed:10,.0f} checks/s  ({elapsed / args.checks * 1e6:7.1f} us/check)")
+
+    if args.memory:
+        print(f"{args.checks} checks over {args.keys} keys, limit {args.limit}/60s, in-process")
+        def legacy():
+            buckets = {}
+            return lambda k: legacy_memory_rate_limit(buckets, k, args.limit, 60), buckets
+        def sliding():
+            limiter = utils.MemoryRateLimiter(max_keys=args.max_keys)
+            return lambda k: limiter.check(k, args.limit, 60), limiter._states
+        def gcra():
+            limiter = utils.MemoryRateLimiter(max_keys=args.max_keys)
+            return lambda k: limiter.check(k, args.limit, 60, "gcra"), limiter._states
+        for label, factory in [("legacy list per key", legacy), ("MemoryRateLimiter sliding", sliding),
+                               ("MemoryRateLimiter gcra", gcra)]:
+            run(label, factory()[0])
+            # memory is measured on a fresh instance so tracing does not skew the timing
+            tracemalloc.start()
+            check, state = factory()
+            for i in range(args.checks):
+                check(f"user:{i % args.keys}")
+            held = tracemalloc.get_traced_memory()[0]
+            tracemalloc.stop()
+            print(f"  {'':<26}  {len(state):,} keys held, {held / 1024:,.0f} KiB")
+        return
+
+    client = _client(args)
+    print(f"{args.checks} checks over {args.keys} keys, limit {args.limit}/60s, rtt {args.rtt_ms} ms")
+    run("legacy (4 round trips)", lambda k: legacy_rate_limit(client, k, args.limit, 60))
+    run("sliding log (1 script)", lambda k: utils.check_rate_limit(k, args.limit, 60, "sliding", client=client))
+    run("gcra (1 script)", lambda k: utils.check_rate_limit(k, args.limit, 60, "gcra", client=client))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+"""
+benchmarks/bench_symbol_index.py
+
+Search/resolve latency of the local symbol index once warm, over a synthetic universe of
+`--symbols` records (no network). Compare with a yfinance `Ticker(...).info` call, which
+typically takes seconds.
+
+    python benchmarks/bench_symbol_index.py --symbols 50000 --queries 20000
+"""
+import argparse
+import os
+import random
+import string
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from symbol_index import SymbolIndex
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=20000)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    words = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(4, 9))).title() for _ in range(5000)]
+    records = {}
+    while len(records) < args.symbols:
+        sym = "".join(rng.choices(string.ascii_uppercase, k=rng.randint(1, 5)))
+        records[sym] = {"symbol": sym, "name": " ".join(rng.sample(words, 2)) + " Inc.", "source": "yfinance"}
+    index = SymbolIndex(sources=[lambda: records.values()])
+    t0 = time.perf_counter()
+    index.refresh()
+    build = time.perf_counter() - t0
+
+    syms = list(records)
+    queries = [rng.choice(syms)[:rng.randint(1, 3)] if i % 2 else rng.choice(words)[:4] for i in range(args.queries)]
+    t0 = time.perf_counter()
+    for q in queries:
+        index.search(q, limit=10)
+    search = (time.perf_counter() - t0) / len(queries)
+
+    t0 = time.perf_counter()
+    for i in range(args.queries):
+        index.resolve(syms[i % len(syms)])
+    resolve = (time.perf_counter() - t0) / args.queries
+
+    print(f"{args.symbols} symbols: index built in {build * 1000:.0f} ms")
+    print(f"  search (prefix, top 10): {search * 1e6:8.1f} us/query")
+    print(f"  resolve (exact)        : {resolve * 1e6:8.1f} us/query")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+benchmarks/bench_transactions_page.py
+
+Builds a synthetic transactions table (1M rows by default) and times a full
+get_transactions() history load against keyset pages from get_transactions_page(),
+with and without the history indexes.
+
+    python benchmarks/bench_transactions_page.py --rows 1000000 --users 50
+"""
+import argparse
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+def _timeit(fn, repeat=5):
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=50)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        os.environ["CROSSP_DB"] = os.path.join(tmp, "bench.db")
+        import database as db
+        symbols = ["AAPL", "MSFT", "BTC/USDT", "ETH/USDT", "GC=F", "EURUSD=X"]
+        rng = random.Random(0)
+        with db.db_cursor(commit=True) as cur:
+            cur.executemany(
+                "INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                ((rng.randint(1, args.users), rng.choice(symbols), "stock", rng.choice(["BUY", "SELL"]), 1.0, 100.0,
+                  "USD", f"2024-01-01T00:00:{i:012d}") for i in range(args.rows)))
+            cur.execute("ANALYZE")
+        uid = 1
+        last = db.get_transactions_page(uid, limit=50)[-1]
+
+        def scenarios():
+            return {
+                "get_transactions (full)": lambda: db.get_transactions(uid),
+                "first page (50)": lambda: db.get_transactions_page(uid, limit=50),
+                "next page (50)": lambda: db.get_transactions_page(uid, before_ts=last['timestamp'], before_id=last['id'], limit=50),
+                "symbol page (50)": lambda: db.get_transactions_page(uid, limit=50, symbol="AAPL"),
+            }
+
+        indexed = {name: _timeit(fn) for name, fn in scenarios().items()}
+        with db.db_cursor(commit=True) as cur:
+            cur.execute("DROP INDEX idx_transactions_user_ts")
+            cur.execute("DROP INDEX idx_transactions_user_symbol_ts")
+        unindexed = {name: _timeit(fn, repeat=2) for name, fn in scenarios().items()}
+        db.close_connections()
+
+    print(f"{args.rows:,} rows, {args.users} users")
+    print(f"{'query':<28}{'no index ms':>14}{'indexed ms':>14}")
+    for name in indexed:
+        print(f"{name:<28}{unindexed[name]:>14.2f}{indexed[name]:>14.2f}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,68 @@
+"""
+benchmarks/bench_wire_format.py
+
+Bandwidth and encode CPU per tick for the market update stream: the legacy full
+{"type": "market_updates"} JSON payload vs per-tick deltas in each wire.py codec.
+Simulates `--clients` clients watching the same `--symbols` symbols, with
+`--change-ratio` of the prices moving each tick; deltas are encoded once and shared.
+
+    python benchmarks/bench_wire_format.py --symbols 50 --clients 1000 --change-ratio 0.1
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from wire import get_codec, msgpack
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--symbols", type=int, default=50)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=500)
+    parser.add_argument("--change-ratio", type=float, default=0.1)
+    args = parser.parse_args()
+
+    rng = random.Random(0)
+    symbols = [f"SYM{i}" for i in range(args.symbols)]
+    prices = {s: rng.uniform(10, 500) for s in symbols}
+    ticks = []
+    for _ in range(args.ticks):
+        changed = rng.sample(symbols, max(0, int(args.symbols * args.change_ratio)))
+        for s in changed:
+            prices[s] = round(prices[s] * rng.uniform(0.99, 1.01), 2)
+        ticks.append((dict(prices), {s: prices[s] for s in changed}))
+
+    results = []
+    t0 = time.perf_counter()
+    size = 0
+    for full, _ in ticks:
+        now = int(time.time())
+        payload = json.dumps({"type": "market_updates", "data": [{"symbol": s, "last": p, "ts": now} for s, p in full.items()]})
+        size += len(payload.encode("utf-8"))
+    results.append(("legacy full json", size, time.perf_counter() - t0))
+
+    codecs = ["json", "struct"] + (["msgpack"] if msgpack is not None else [])
+    for name in codecs:
+        codec = get_codec(name)
+        t0 = time.perf_counter()
+        size = 0
+        for seq, (_, delta) in enumerate(ticks, 1):
+            if delta:
+                data = codec.encode("prices", delta, seq)
+                size += len(data) if isinstance(data, bytes) else len(data.encode("utf-8"))
+        results.append((f"{name} delta", size, time.perf_counter() - t0))
+
+    print(f"{args.symbols} symbols, {args.clients} clients, {args.change_ratio:.0%} changed per tick")
+    print(f"{'format':<20}{'bytes/tick/client':>19}{'MB/s @1 tick/s':>16}{'encode us/tick':>16}")
+    for name, size, secs in results:
+        per_tick = size / args.ticks
+        print(f"{name:<20}{per_tick:>19,.0f}{per_tick * args.clients / 1e6:>16.2f}{secs / args.ticks * 1e6:>16.1f}")
+    if msgpack is None:
+        print("(msgpack not installed; skipped)")
+
+if __name__ == "__main__":
+    main()
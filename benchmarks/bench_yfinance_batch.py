@@ -0,0 +1,75 @@
+"""
+benchmarks/bench_yfinance_batch.py
+
+Latency of per-symbol yf.Ticker().history() lookups vs the batched fetch_yfinance_prices()
+path as the number of symbols grows. yfinance's network calls are replaced by a local stub
+transport that sleeps a fixed round-trip time per HTTP request, so results are repeatable.
+
+    python benchmarks/bench_yfinance_batch.py --rtt-ms 80
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import api_integrations
+from api_integrations import fetch_yfinance_prices, yf
+
+class StubTransport:
+    """Stands in for Yahoo: every request costs one round trip, regardless of ticker count."""
+    def __init__(self, rtt: float):
+        self.rtt = rtt
+        self.requests = 0
+
+    def _frame(self, symbols):
+        idx = pd.date_range("2024-01-01", periods=5, freq="D")
+        cols = pd.MultiIndex.from_product([["Close"], symbols])
+        return pd.DataFrame(np.random.rand(5, len(symbols)) * 100, index=idx, columns=cols)
+
+    def download(self, tickers, **kwargs):
+        self.requests += 1
+        time.sleep(self.rtt)
+        return self._frame(list(tickers))
+
+    def ticker(self, sym):
+        transport = self
+        class _Ticker:
+            def history(self, **kwargs):
+                transport.requests += 1
+                time.sleep(transport.rtt)
+                return transport._frame([sym])["Close"].rename(columns={sym: "Close"})
+        return _Ticker()
+
+def per_symbol(symbols):
+    out = {}
+    for sym in symbols:
+        data = yf.Ticker(sym).history(period="1d")
+        out[sym] = data["Close"].iloc[-1]
+    return out
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--rtt-ms", type=float, default=80.0)
+    parser.add_argument("--batch-size", type=int, default=50)
+    args = parser.parse_args()
+    transport = StubTransport(args.rtt_ms / 1000)
+    yf.download = transport.download
+    yf.Ticker = transport.ticker
+    print(f"{'symbols':>8}{'per-symbol ms':>16}{'batched ms':>14}{'requests':>10}")
+    for n in (1, 5, 10, 20, 40, 80, 160):
+        symbols = [f"SYM{i}" for i in range(n)]
+        t0 = time.perf_counter()
+        per_symbol(symbols)
+        seq = (time.perf_counter() - t0) * 1000
+        transport.requests = 0
+        t0 = time.perf_counter()
+        fetch_yfinance_prices(symbols, batch_size=args.batch_size)
+        batched = (time.perf_counter() - t0) * 1000
+        print(f"{n:>8}{seq:>16.0f}{batched:>14.0f}{transport.requests:>10}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,94 @@
+"""
+benchmarks/loadtest_realtime.py
+
+Load-test harness for realtime.app: starts the server in-process, connects thousands of
+local websocket clients subscribed to one symbol, publishes ticks through the shared
+ConnectionManager and reports p50/p99 fan-out latency (publish -> client receive).
+Each published "price" is the publish timestamp, so clients compute latency directly.
+
+    python benchmarks/loadtest_realtime.py --clients 2000 --ticks 20
+"""
+import argparse
+import asyncio
+import json
+import os
+import statistics
+import sys
+import time
+
+import uvicorn
+import websockets
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import realtime
+
+SYMBOL = "LOADTEST"
+
+async def client(uri, latencies, ready, stop):
+    async with websockets.connect(uri, max_queue=None) as ws:
+        await ws.send(json.dumps({"action": "subscribe", "symbols": [SYMBOL]}))
+        ready.release()
+        while not stop.is_set():
+            try:
+                msg = json.loads(await asyncio.wait_for(ws.recv(), 1.0))
+            except asyncio.TimeoutError:
+                continue
+            if msg.get("type") == "prices" and SYMBOL in msg["data"]:
+                latencies.append(time.time() - msg["data"][SYMBOL])
+
+def _pct(values, p):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(len(values) * p))] * 1000 if values else float("nan")
+
+async def run(args):
+    realtime.manager.autostart_poller = False  # ticks come from this harness, not upstream feeds
+    config = uvicorn.Config(realtime.app, host="127.0.0.1", port=args.port, log_level="warning")
+    server = uvicorn.Server(config)
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        await asyncio.sleep(0.05)
+
+    uri = f"ws://127.0.0.1:{args.port}/ws"
+    latencies, ready, stop = [], asyncio.Semaphore(0), asyncio.Event()
+    clients = []
+    for i in range(args.clients):
+        clients.append(asyncio.create_task(client(uri, latencies, ready, stop)))
+        if i % 200 == 199:
+            await asyncio.sleep(0.05)  # don't overflow the listen backlog
+    for _ in range(args.clients):
+        await ready.acquire()
+    print(f"{args.clients} clients connected, {len(realtime.manager.subscriptions)} subscribed")
+
+    per_tick = []
+    for _ in range(args.ticks):
+        before = len(latencies)
+        await realtime.manager.publish({SYMBOL: time.time()})
+        await realtime.manager.drain()
+        deadline = time.time() + 5
+        while len(latencies) - before < args.clients and time.time() < deadline:
+            await asyncio.sleep(0.005)
+        per_tick.append(latencies[before:])
+        await asyncio.sleep(args.interval)
+
+    stop.set()
+    await asyncio.gather(*clients, return_exceptions=True)
+    server.should_exit = True
+    await server_task
+
+    all_lat = [v for tick in per_tick for v in tick]
+    print(f"ticks={args.ticks} deliveries={len(all_lat)} expected={args.ticks * args.clients}")
+    print(f"fan-out latency p50={_pct(all_lat, 0.50):.1f}ms p99={_pct(all_lat, 0.99):.1f}ms "
+          f"max={max(all_lat) * 1000 if all_lat else float('nan'):.1f}ms")
+    print(f"per-tick p99 median={statistics.median(_pct(t, 0.99) for t in per_tick if t):.1f}ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--clients", type=int, default=1000)
+    parser.add_argument("--ticks", type=int, default=20)
+    parser.add_argument("--interval", type=float, default=0.2)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+    asyncio.run(run(args))
+
+if __name__ == "__main__":
+    main()
@@ -7,180 +7,441 @@ Updated with email verification, roles, and TOTP secret columns.
 
 import sqlite3
 from sqlite3 import Connection
-from typing import Optional, List, Dict, Any
+from typing import Optional, List, Dict, Any, Iterable, Iterator
+from contextlib import contextmanager
 import datetime
 import hashlib
 import os
+import threading
+import time
+import weakref
+from collections import OrderedDict
 
 DB_PATH = os.environ.get("CROSSP_DB", "crossp.db")
 
+# Connection tuning (overridable through the environment)
+DB_CACHE_SIZE_KB = int(os.environ.get("CROSSP_DB_CACHE_KB", "20000"))
+DB_MMAP_SIZE = int(os.environ.get("CROSSP_DB_MMAP", str(256 * 1024 * 1024)))
+DB_STATEMENT_CACHE = int(os.environ.get("CROSSP_DB_STMT_CACHE", "256"))
+DB_BUSY_TIMEOUT = float(os.environ.get("CROSSP_DB_BUSY_TIMEOUT", "30"))
+
 def get_conn() -> Connection:
-    conn = sqlite3.connect(DB_PATH, check_same_thread=False)
+    """Open a new tuned connection. Prefer `db_cursor()` which reuses pooled connections."""
+    conn = sqlite3.connect(DB_PATH, check_same_thread=False, timeout=DB_BUSY_TIMEOUT,
+                           cached_statements=DB_STATEMENT_CACHE)
     conn.row_factory = sqlite3.Row
+    cur = conn.cursor()
+    cur.execute("PRAGMA journal_mode=WAL")
+    cur.execute("PRAGMA synchronous=NORMAL")
+    cur.execute(f"PRAGMA cache_size=-{DB_CACHE_SIZE_KB}")
+    cur.execute(f"PRAGMA mmap_size={DB_MMAP_SIZE}")
+    cur.execute("PRAGMA temp_store=MEMORY")
+    cur.close()
     return conn
 
-def init_db():
-    conn = get_conn()
+class _ConnHolder:
+    """Thread-local handle on a pooled connection; collected (and the connection closed) when its thread exits."""
+    __slots__ = ("conn", "__weakref__")
+
+    def __init__(self, conn: Connection):
+        self.conn = conn
+
+class ConnectionPool:
+    """
+    Per-thread connection pool. Each thread keeps one long-lived connection to DB_PATH,
+    so the connect/PRAGMA/close cost is paid once per thread instead of once per query.
+    A thread's connection is closed when the thread exits (Streamlit runs every rerun on a
+    fresh thread), and connections are dropped after a fork so child processes never
+    share a handle.
+    """
+    def __init__(self):
+        self._local = threading.local()
+        self._lock = threading.RLock()  # reentrant: a finalizer may fire while it is held
+        self._all: Dict[Connection, weakref.finalize] = {}
+        self._pid = os.getpid()
+
+    def acquire(self) -> Connection:
+        if self._pid != os.getpid():
+            self._reset_after_fork()
+        holder = getattr(self._local, "holder", None)
+        if holder is None:
+            conn = get_conn()
+            holder = self._local.holder = _ConnHolder(conn)
+            with self._lock:
+                self._all[conn] = weakref.finalize(holder, self._release, conn)
+        return holder.conn
+
+    def _release(self, conn: Connection):
+        with self._lock:
+            self._all.pop(conn, None)
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def _reset_after_fork(self):
+        for fin in self._all.values():
+            fin.detach()  # the parent still owns those handles
+        self._local = threading.local()
+        self._lock = threading.RLock()
+        self._all = {}
+        self._pid = os.getpid()
+
+    def open_count(self) -> int:
+        with self._lock:
+            return len(self._all)
+
+    def close_all(self):
+        with self._lock:
+            pooled, self._all = self._all, {}
+        for conn, fin in pooled.items():
+            fin.detach()
+            try:
+                conn.close()
+            except Exception:
+                pass
+        self._local = threading.local()
+
+_pool = ConnectionPool()
+
+@contextmanager
+def db_cursor(commit: bool=False, immediate: bool=False) -> Iterator[sqlite3.Cursor]:
+    """
+    Yield a cursor on this thread's pooled connection.
+    commit=True commits on success and rolls back on error; immediate=True additionally
+    takes the write lock up front with BEGIN IMMEDIATE (use for read-modify-write).
+    Writing blocks must not be nested: they share the thread's connection, so an inner
+    commit or rollback would also end the outer block's transaction. Opening one while a
+    transaction is pending raises RuntimeError.
+    """
+    conn = _pool.acquire()
+    if (commit or immediate) and conn.in_transaction:
+        raise RuntimeError("db_cursor: a transaction is already open on this thread's connection")
     cur = conn.cursor()
-    # Users with email, is_verified, role, totp_secret
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS users (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        username TEXT UNIQUE NOT NULL,
-        password_hash TEXT NOT NULL,
-        email TEXT,
-        is_verified INTEGER DEFAULT 0,
-        totp_secret TEXT,
-        role TEXT DEFAULT 'user',
-        preferred_currency TEXT DEFAULT 'USD',
-        created_at TEXT
-    )
-    """)
-    # Balances (per user per currency)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS balances (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        currency TEXT NOT NULL,
-        amount REAL NOT NULL,
-        updated_at TEXT,
-        UNIQUE(user_id, currency),
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-    # Holdings (aggregated)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS holdings (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        symbol TEXT NOT NULL,
-        asset_type TEXT NOT NULL,
-        quantity REAL NOT NULL,
-        avg_price REAL NOT NULL,
-        last_updated TEXT,
-        UNIQUE(user_id, symbol, asset_type),
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-    # Transactions (order history)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS transactions (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        symbol TEXT NOT NULL,
-        asset_type TEXT NOT NULL,
-        side TEXT NOT NULL,
-        quantity REAL NOT NULL,
-        price REAL NOT NULL,
-        currency TEXT NOT NULL,
-        timestamp TEXT,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-    # Watchlist
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS watchlist (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        symbol TEXT NOT NULL,
-        asset_type TEXT NOT NULL,
-        added_at TEXT,
-        UNIQUE(user_id, symbol, asset_type),
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-    # Verification tokens table (simple)
-    cur.execute("""
-    CREATE TABLE IF NOT EXISTS email_tokens (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        user_id INTEGER NOT NULL,
-        token TEXT NOT NULL,
-        created_at TEXT,
-        FOREIGN KEY(user_id) REFERENCES users(id)
-    )
-    """)
-    conn.commit()
-    conn.close()
+    try:
+        if immediate:
+            cur.execute("BEGIN IMMEDIATE")
+        yield cur
+        if commit or immediate:
+            conn.commit()
+    except Exception:
+        if conn.in_transaction:
+            conn.rollback()
+        raise
+    finally:
+        cur.close()
+
+def close_connections():
+    """Close every pooled connection (e.g. on shutdown or before swapping DB_PATH)."""
+    _pool.close_all()
+
+def init_db():
+    with db_cursor(commit=True) as cur:
+        # Users with email, is_verified, role, totp_secret
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS users (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            username TEXT UNIQUE NOT NULL,
+            password_hash TEXT NOT NULL,
+            email TEXT,
+            is_verified INTEGER DEFAULT 0,
+            totp_secret TEXT,
+            role TEXT DEFAULT 'user',
+            preferred_currency TEXT DEFAULT 'USD',
+            created_at TEXT
+        )
+        """)
+        # Balances (per user per currency)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS balances (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            amount REAL NOT NULL,
+            updated_at TEXT,
+            UNIQUE(user_id, currency),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """)
+        # Holdings (aggregated)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS holdings (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            avg_price REAL NOT NULL,
+            last_updated TEXT,
+            UNIQUE(user_id, symbol, asset_type),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """)
+        # Transactions (order history)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS transactions (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            side TEXT NOT NULL,
+            quantity REAL NOT NULL,
+            price REAL NOT NULL,
+            currency TEXT NOT NULL,
+            timestamp TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """)
+        # Watchlist
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS watchlist (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            symbol TEXT NOT NULL,
+            asset_type TEXT NOT NULL,
+            added_at TEXT,
+            UNIQUE(user_id, symbol, asset_type),
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """)
+        # Verification tokens table (simple)
+        cur.execute("""
+        CREATE TABLE IF NOT EXISTS email_tokens (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            user_id INTEGER NOT NULL,
+            token TEXT NOT NULL,
+            created_at TEXT,
+            FOREIGN KEY(user_id) REFERENCES users(id)
+        )
+        """)
+        _migrate(cur)
+
+# --- Schema migrations ---
+# Each entry upgrades the schema by one version; PRAGMA user_version records how far an
+# existing database has been migrated, so old files pick up new indexes/tables on startup.
+MIGRATIONS = [
+    # 1: transaction history indexes (per-user timeline and per-user/symbol lookups)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_ts ON transactions(user_id, timestamp, id)",
+        "CREATE INDEX IF NOT EXISTS idx_transactions_user_symbol_ts ON transactions(user_id, symbol, timestamp, id)",
+    ],
+    # 2: persistent OHLCV history cache (bar start as unix seconds)
+    [
+        """CREATE TABLE IF NOT EXISTS ohlcv_bars (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            ts INTEGER NOT NULL,
+            open REAL, high REAL, low REAL, close REAL, volume REAL,
+            PRIMARY KEY(symbol, interval, ts)
+        ) WITHOUT ROWID""",
+        """CREATE TABLE IF NOT EXISTS ohlcv_meta (
+            symbol TEXT NOT NULL,
+            interval TEXT NOT NULL,
+            fetched_at REAL NOT NULL,
+            max_limit INTEGER NOT NULL,
+            PRIMARY KEY(symbol, interval)
+        )""",
+    ],
+    # 3: end-of-day per-account valuation snapshots (values in the user's preferred currency)
+    [
+        """CREATE TABLE IF NOT EXISTS valuation_snapshots (
+            as_of TEXT NOT NULL,
+            user_id INTEGER NOT NULL,
+            currency TEXT NOT NULL,
+            holdings_value REAL NOT NULL,
+            cash_value REAL NOT NULL,
+            total_value REAL NOT NULL,
+            unrealized_pnl REAL NOT NULL,
+            positions INTEGER NOT NULL,
+            unpriced INTEGER NOT NULL,
+            PRIMARY KEY(as_of, user_id)
+        )""",
+    ],
+    # 4: local symbol index (equities, ccxt markets, forex pairs) backing symbol search
+    [
+        """CREATE TABLE IF NOT EXISTS symbols (
+            symbol TEXT PRIMARY KEY,
+            name TEXT,
+            currency TEXT,
+            exchange TEXT,
+            asset_type TEXT,
+            source TEXT NOT NULL,
+            updated_at TEXT
+        ) WITHOUT ROWID""",
+    ],
+    # 5: write-behind ledger checkpoint (last journal sequence flushed into the tables)
+    [
+        """CREATE TABLE IF NOT EXISTS ledger_checkpoint (
+            id INTEGER PRIMARY KEY CHECK (id = 1),
+            seq INTEGER NOT NULL,
+            flushed_at TEXT
+        )""",
+    ],
+    # 6: latest transaction per symbol (valuation job's instrument currencies)
+    [
+        "CREATE INDEX IF NOT EXISTS idx_transactions_symbol_id ON transactions(symbol, id)",
+    ],
+]
+
+def _migrate(cur: sqlite3.Cursor):
+    cur.execute("PRAGMA user_version")
+    version = cur.fetchone()[0]
+    for target, statements in enumerate(MIGRATIONS[version:], start=version + 1):
+        for stmt in statements:
+            cur.execute(stmt)
+        cur.execute(f"PRAGMA user_version = {target}")
 
 # --- User functions ---
 def create_user(username: str, password_hash: str, email: Optional[str]=None, preferred_currency: str='USD', role: str='user', totp_secret: Optional[str]=None) -> int:
-    conn = get_conn()
-    cur = conn.cursor()
     now = datetime.datetime.utcnow().isoformat()
-    cur.execute("INSERT INTO users (username, password_hash, email, preferred_currency, role, totp_secret, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
-                (username, password_hash, email, preferred_currency, role, totp_secret, now))
-    user_id = cur.lastrowid
-    # seed demo balance USD 100000
-    cur.execute("INSERT INTO balances (user_id, currency, amount, updated_at) VALUES (?, ?, ?, ?)",
-                (user_id, 'USD', 100000.0, now))
-    conn.commit()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("INSERT INTO users (username, password_hash, email, preferred_currency, role, totp_secret, created_at) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (username, password_hash, email, preferred_currency, role, totp_secret, now))
+        user_id = cur.lastrowid
+        # seed demo balance USD 100000
+        cur.execute("INSERT INTO balances (user_id, currency, amount, updated_at) VALUES (?, ?, ?, ?)",
+                    (user_id, 'USD', 100000.0, now))
     return user_id
 
+class UserCache:
+    """
+    Per-process TTL cache of users rows, keyed by id with a username -> id index.
+    Every users UPDATE in this module calls invalidate(); the TTL bounds how long a
+    write made by another process can go unnoticed. Misses (unknown users) are not cached.
+    """
+    def __init__(self, ttl: float=30.0, max_entries: int=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._rows: "OrderedDict[int, tuple]" = OrderedDict()  # id -> (expires_at, row)
+        self._ids: Dict[str, int] = {}
+        self._generation = 0  # bumped by invalidate(); rows read before a bump are not cached
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0}
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    def get(self, user_id: Optional[int]=None, username: Optional[str]=None) -> Optional[sqlite3.Row]:
+        now = time.monotonic()
+        with self._lock:
+            if user_id is None:
+                user_id = self._ids.get(username)
+            entry = self._rows.get(user_id) if user_id is not None else None
+            if entry is None or entry[0] <= now or (username is not None and entry[1]['username'] != username):
+                self.stats["misses"] += 1
+                return None
+            self._rows.move_to_end(user_id)
+            self.stats["hits"] += 1
+            return entry[1]
+
+    def put(self, row: Optional[sqlite3.Row], generation: int) -> Optional[sqlite3.Row]:
+        """Cache `row` unless an invalidation happened since `generation` was read."""
+        if row is None or self.ttl <= 0:
+            return row
+        with self._lock:
+            if generation != self._generation:
+                return row
+            self._rows[row['id']] = (time.monotonic() + self.ttl, row)
+            self._rows.move_to_end(row['id'])
+            self._ids[row['username']] = row['id']
+            while len(self._rows) > self.max_entries:
+                _, (_, old) = self._rows.popitem(last=False)
+                if self._ids.get(old['username']) == old['id']:
+                    del self._ids[old['username']]
+        return row
+
+    def invalidate(self, user_id: Optional[int]=None):
+        """Drop one user (or everything when user_id is None)."""
+        with self._lock:
+            self._generation += 1
+            self.stats["invalidations"] += 1
+            if user_id is None:
+                self._rows.clear()
+                self._ids.clear()
+                return
+            entry = self._rows.pop(user_id, None)
+            if entry and self._ids.get(entry[1]['username']) == user_id:
+                del self._ids[entry[1]['username']]
+
+user_cache = UserCache(ttl=float(os.environ.get("CROSSP_USER_CACHE_TTL", "30")))
+
 def get_user_by_username(username: str) -> Optional[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE username = ?", (username,))
-    r = cur.fetchone()
-    conn.close()
-    return r
+    cached = user_cache.get(username=username)
+    if cached is not None:
+        return cached
+    generation = user_cache.generation
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE username = ?", (username,))
+        return user_cache.put(cur.fetchone(), generation)
 
 def get_user_by_id(user_id: int) -> Optional[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
-    r = cur.fetchone()
-    conn.close()
-    return r
+    cached = user_cache.get(user_id=user_id)
+    if cached is not None:
+        return cached
+    generation = user_cache.generation
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM users WHERE id = ?", (user_id,))
+        return user_cache.put(cur.fetchone(), generation)
+
+def update_password_hash(user_id: int, password_hash: bytes):
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE users SET password_hash = ? WHERE id = ?", (password_hash, user_id))
+    user_cache.invalidate(user_id)
 
 def set_preferred_currency(user_id: int, currency: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET preferred_currency = ? WHERE id = ?", (currency, user_id))
-    conn.commit()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE users SET preferred_currency = ? WHERE id = ?", (currency, user_id))
+    user_cache.invalidate(user_id)
 
 def set_email_verification(user_id: int, verified: bool=True):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("UPDATE users SET is_verified = ? WHERE id = ?", (1 if verified else 0, user_id))
-    conn.commit()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE users SET is_verified = ? WHERE id = ?", (1 if verified else 0, user_id))
+    user_cache.invalidate(user_id)
+
+def set_user_role(user_id: int, role: str):
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE users SET role = ? WHERE id = ?", (role, user_id))
+    user_cache.invalidate(user_id)
+
+def set_totp_secret(user_id: int, secret: Optional[str]):
+    with db_cursor(commit=True) as cur:
+        cur.execute("UPDATE users SET totp_secret = ? WHERE id = ?", (secret, user_id))
+    user_cache.invalidate(user_id)
 
 def store_email_token(user_id: int, token: str):
-    conn = get_conn()
-    cur = conn.cursor()
     now = datetime.datetime.utcnow().isoformat()
-    cur.execute("INSERT INTO email_tokens (user_id, token, created_at) VALUES (?, ?, ?)", (user_id, token, now))
-    conn.commit()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("INSERT INTO email_tokens (user_id, token, created_at) VALUES (?, ?, ?)", (user_id, token, now))
 
 def pop_email_token(user_id: int, token: str) -> bool:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT id FROM email_tokens WHERE user_id = ? AND token = ?", (user_id, token))
-    r = cur.fetchone()
-    if r:
-        cur.execute("DELETE FROM email_tokens WHERE id = ?", (r['id'],))
-        conn.commit()
-        conn.close()
-        return True
-    conn.close()
+    with db_cursor(immediate=True) as cur:
+        cur.execute("SELECT id FROM email_tokens WHERE user_id = ? AND token = ?", (user_id, token))
+        r = cur.fetchone()
+        if r:
+            cur.execute("DELETE FROM email_tokens WHERE id = ?", (r['id'],))
+            return True
     return False
 
 # --- Balance / holdings / transactions / watchlist ---
+# While a write-behind ledger (ledger.py) is attached it owns balances, holdings and new
+# transactions: the functions below read and write through it instead of the tables.
+_ledger = None
+
+def set_ledger(ledger):
+    """Attach (or with None, detach) the in-process ledger."""
+    global _ledger
+    _ledger = ledger
+
 def get_balance(user_id: int, currency: str='USD') -> float:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", (user_id, currency))
-    r = cur.fetchone()
-    conn.close()
+    if _ledger is not None:
+        return _ledger.get_balance(user_id, currency)
+    with db_cursor() as cur:
+        cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", (user_id, currency))
+        r = cur.fetchone()
     return float(r['amount']) if r else 0.0
 
-def update_balance(user_id: int, currency: str, amount_delta: float):
-    conn = get_conn()
-    cur = conn.cursor()
-    now = datetime.datetime.utcnow().isoformat()
+def _apply_balance_delta(cur: sqlite3.Cursor, user_id: int, currency: str, amount_delta: float, now: str) -> float:
     cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", (user_id, currency))
     r = cur.fetchone()
     if r:
@@ -188,39 +449,40 @@ def update_balance(user_id: int, currency: str, amount_delta: float):
         cur.execute("UPDATE balances SET amount = ?, updated_at = ? WHERE user_id = ? AND currency = ?",
                     (new_amt, now, user_id, currency))
     else:
+        new_amt = amount_delta
         cur.execute("INSERT INTO balances (user_id, currency, amount, updated_at) VALUES (?, ?, ?, ?)",
                     (user_id, currency, amount_delta, now))
-    conn.commit()
-    conn.close()
+    return new_amt
+
+def update_balance(user_id: int, currency: str, amount_delta: float):
+    if _ledger is not None:
+        return _ledger.update_balance(user_id, currency, amount_delta)
+    now = datetime.datetime.utcnow().isoformat()
+    with db_cursor(immediate=True) as cur:
+        _apply_balance_delta(cur, user_id, currency, amount_delta, now)
 
 def list_balances(user_id: int) -> List[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM balances WHERE user_id = ?", (user_id,))
-    r = cur.fetchall()
-    conn.close()
-    return r
+    if _ledger is not None:
+        return _ledger.list_balances(user_id)
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM balances WHERE user_id = ?", (user_id,))
+        return cur.fetchall()
 
 def get_holdings(user_id: int) -> List[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM holdings WHERE user_id = ?", (user_id,))
-    r = cur.fetchall()
-    conn.close()
-    return r
+    if _ledger is not None:
+        return _ledger.get_holdings(user_id)
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM holdings WHERE user_id = ?", (user_id,))
+        return cur.fetchall()
 
 def get_holding(user_id: int, symbol: str, asset_type: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
-    r = cur.fetchone()
-    conn.close()
-    return r
+    if _ledger is not None:
+        return _ledger.get_holding(user_id, symbol, asset_type)
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
+        return cur.fetchone()
 
-def upsert_holding(user_id: int, symbol: str, asset_type: str, quantity_delta: float, price: float):
-    conn = get_conn()
-    cur = conn.cursor()
-    now = datetime.datetime.utcnow().isoformat()
+def _apply_holding_delta(cur: sqlite3.Cursor, user_id: int, symbol: str, asset_type: str, quantity_delta: float, price: float, now: str):
     cur.execute("SELECT * FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
     existing = cur.fetchone()
     if existing:
@@ -239,52 +501,378 @@ def upsert_holding(user_id: int, symbol: str, asset_type: str, quantity_delta: f
     else:
         cur.execute("INSERT INTO holdings (user_id, symbol, asset_type, quantity, avg_price, last_updated) VALUES (?, ?, ?, ?, ?, ?)",
                     (user_id, symbol, asset_type, quantity_delta, price, now))
-    conn.commit()
-    conn.close()
+
+def upsert_holding(user_id: int, symbol: str, asset_type: str, quantity_delta: float, price: float):
+    if _ledger is not None:
+        return _ledger.upsert_holding(user_id, symbol, asset_type, quantity_delta, price)
+    now = datetime.datetime.utcnow().isoformat()
+    with db_cursor(immediate=True) as cur:
+        _apply_holding_delta(cur, user_id, symbol, asset_type, quantity_delta, price, now)
 
 def add_transaction(user_id: int, symbol: str, asset_type: str, side: str, quantity: float, price: float, currency: str):
-    conn = get_conn()
-    cur = conn.cursor()
+    if _ledger is not None:
+        return _ledger.add_transaction(user_id, symbol, asset_type, side, quantity, price, currency)
+    now = datetime.datetime.utcnow().isoformat()
+    with db_cursor(commit=True) as cur:
+        cur.execute("INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, symbol, asset_type, side, quantity, price, currency, now))
+
+# --- Order execution ---
+class OrderError(Exception):
+    """Raised when an order is rejected (bad input, insufficient balance or holdings)."""
+
+def execute_order(user_id: int, symbol: str, asset_type: str, side: str, qty: float, price: float,
+                  tx_currency: str, pref_currency: str, fx_rate: float=1.0) -> Dict[str, Any]:
+    """
+    Execute a buy or sell atomically: balance check, balance update, holding upsert and
+    transaction insert all run inside one BEGIN IMMEDIATE transaction with a single commit.
+    fx_rate converts tx_currency into pref_currency (the currency the balance is debited in).
+    Raises OrderError if the order is rejected; nothing is written in that case.
+    """
+    if _ledger is not None:
+        return _ledger.execute_order(user_id, symbol, asset_type, side, qty, price, tx_currency, pref_currency, fx_rate)
+    side = side.upper()
+    if side not in ("BUY", "SELL"):
+        raise OrderError(f"Unknown order side: {side}")
+    if qty <= 0 or price <= 0:
+        raise OrderError("Quantity and price must be positive.")
+    cost_in_pref = qty * price * fx_rate
     now = datetime.datetime.utcnow().isoformat()
-    cur.execute("INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
-                (user_id, symbol, asset_type, side, quantity, price, currency, now))
-    conn.commit()
-    conn.close()
+    with db_cursor(immediate=True) as cur:
+        if side == "BUY":
+            cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", (user_id, pref_currency))
+            r = cur.fetchone()
+            bal = float(r['amount']) if r else 0.0
+            if bal < cost_in_pref:
+                raise OrderError(f"Insufficient balance: have {bal} {pref_currency}, need {cost_in_pref:.2f} {pref_currency}")
+            new_balance = _apply_balance_delta(cur, user_id, pref_currency, -cost_in_pref, now)
+            _apply_holding_delta(cur, user_id, symbol, asset_type, qty, price, now)
+        else:
+            cur.execute("SELECT quantity FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
+            h = cur.fetchone()
+            if not h or h['quantity'] < qty:
+                raise OrderError("Not enough holdings to sell.")
+            new_balance = _apply_balance_delta(cur, user_id, pref_currency, cost_in_pref, now)
+            _apply_holding_delta(cur, user_id, symbol, asset_type, -qty, price, now)
+        cur.execute("INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                    (user_id, symbol, asset_type, side, qty, price, tx_currency, now))
+        tx_id = cur.lastrowid
+    return {"transaction_id": tx_id, "side": side, "cost": cost_in_pref, "currency": pref_currency, "balance": new_balance}
+
+def normalize_order(o: Dict[str, Any]) -> tuple:
+    side = str(o['side']).upper()
+    qty = float(o.get('qty', o.get('quantity')))
+    price = float(o['price'])
+    if side not in ("BUY", "SELL"):
+        raise OrderError(f"Unknown order side: {side}")
+    if qty <= 0 or price <= 0:
+        raise OrderError("Quantity and price must be positive.")
+    tx_currency = o.get('tx_currency') or o.get('currency') or 'USD'
+    pref_currency = o.get('pref_currency') or tx_currency
+    fx_rate = float(o.get('fx_rate') or 1.0)
+    # a blank CSV cell means "not given", same as a missing key
+    return (int(o['user_id']), o['symbol'], o.get('asset_type') or 'stock', side, qty, price,
+            tx_currency, pref_currency, fx_rate)
+
+def _flush_order_batch(batch: List[Dict[str, Any]], stats: Dict[str, int]):
+    """Apply one batch of orders in memory, then write the net result in a single transaction."""
+    now = datetime.datetime.utcnow().isoformat()
+    balances: Dict[tuple, list] = {}   # (user_id, currency) -> [amount, exists]
+    holdings: Dict[tuple, list] = {}   # (user_id, symbol, asset_type) -> [quantity, avg_price, row id]
+    tx_rows = []
+    with db_cursor(immediate=True) as cur:
+        for raw in batch:
+            try:
+                user_id, symbol, asset_type, side, qty, price, tx_currency, pref, fx_rate = normalize_order(raw)
+            except (OrderError, KeyError, TypeError, ValueError):
+                stats['rejected'] += 1
+                continue
+            bkey = (user_id, pref)
+            if bkey not in balances:
+                cur.execute("SELECT amount FROM balances WHERE user_id = ? AND currency = ?", bkey)
+                r = cur.fetchone()
+                balances[bkey] = [float(r['amount']), True] if r else [0.0, False]
+            hkey = (user_id, symbol, asset_type)
+            if hkey not in holdings:
+                cur.execute("SELECT id, quantity, avg_price FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", hkey)
+                r = cur.fetchone()
+                holdings[hkey] = [r['quantity'], r['avg_price'], r['id']] if r else [0.0, 0.0, None]
+            bal, hold = balances[bkey], holdings[hkey]
+            cost = qty * price * fx_rate
+            if side == "BUY":
+                if bal[0] < cost:
+                    stats['rejected'] += 1
+                    continue
+                bal[0] -= cost
+                hold[1] = ((hold[0] * hold[1]) + (qty * price)) / (hold[0] + qty)
+                hold[0] += qty
+            else:
+                if hold[0] < qty:
+                    stats['rejected'] += 1
+                    continue
+                bal[0] += cost
+                hold[0] -= qty
+                if hold[0] <= 0:
+                    hold[0], hold[1] = 0.0, 0.0
+            tx_rows.append((user_id, symbol, asset_type, side, qty, price, tx_currency, now))
+        if not tx_rows:
+            return
+        cur.executemany("UPDATE balances SET amount = ?, updated_at = ? WHERE user_id = ? AND currency = ?",
+                        [(v[0], now, k[0], k[1]) for k, v in balances.items() if v[1]])
+        cur.executemany("INSERT INTO balances (user_id, currency, amount, updated_at) VALUES (?, ?, ?, ?)",
+                        [(k[0], k[1], v[0], now) for k, v in balances.items() if not v[1] and v[0] != 0.0])
+        cur.executemany("DELETE FROM holdings WHERE id = ?",
+                        [(v[2],) for v in holdings.values() if v[2] is not None and v[0] <= 0])
+        cur.executemany("UPDATE holdings SET quantity = ?, avg_price = ?, last_updated = ? WHERE id = ?",
+                        [(v[0], v[1], now, v[2]) for v in holdings.values() if v[2] is not None and v[0] > 0])
+        cur.executemany("INSERT INTO holdings (user_id, symbol, asset_type, quantity, avg_price, last_updated) VALUES (?, ?, ?, ?, ?, ?)",
+                        [(k[0], k[1], k[2], v[0], v[1], now) for k, v in holdings.items() if v[2] is None and v[0] > 0])
+        cur.executemany("INSERT INTO transactions (user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        tx_rows)
+    stats['accepted'] += len(tx_rows)
+
+def execute_orders_bulk(orders: Iterable[Dict[str, Any]], batch_size: int=1000) -> Dict[str, int]:
+    """
+    Stream orders (dicts with the execute_order fields) into the database in batches.
+    Each batch is one transaction: balance/holding deltas are aggregated per (user, symbol)
+    in memory and transactions are inserted with executemany. Orders that would fail
+    execute_order's checks are counted as rejected and skipped.
+    """
+    if _ledger is not None:
+        return _ledger.apply_orders(orders, batch_size)
+    stats = {"accepted": 0, "rejected": 0, "batches": 0}
+    batch: List[Dict[str, Any]] = []
+    for o in orders:
+        batch.append(o)
+        if len(batch) >= batch_size:
+            _flush_order_batch(batch, stats)
+            stats['batches'] += 1
+            batch = []
+    if batch:
+        _flush_order_batch(batch, stats)
+        stats['batches'] += 1
+    return stats
 
 def get_transactions(user_id: int) -> List[sqlite3.Row]:
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
+        return cur.fetchall()
+
+def get_transactions_page(user_id: int, before_ts: Optional[str]=None, limit: int=50,
+                          symbol: Optional[str]=None, side: Optional[str]=None,
+                          before_id: Optional[int]=None) -> List[sqlite3.Row]:
+    """
+    Keyset-paginated transaction history, newest first.
+    Pass the last row's timestamp (and id, to break ties between fills with the same
+    timestamp) as before_ts/before_id to fetch the next page.
+    """
+    sql = "SELECT * FROM transactions WHERE user_id = ?"
+    params: List[Any] = [user_id]
+    if symbol:
+        sql += " AND symbol = ?"
+        params.append(symbol)
+    if side:
+        sql += " AND side = ?"
+        params.append(side.upper())
+    if before_ts is not None:
+        if before_id is not None:
+            sql += " AND (timestamp, id) < (?, ?)"
+            params.extend([before_ts, before_id])
+        else:
+            sql += " AND timestamp < ?"
+            params.append(before_ts)
+    sql += " ORDER BY timestamp DESC, id DESC LIMIT ?"
+    params.append(limit)
+    with db_cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+def iter_transactions(user_id: int, chunk_size: int=1000, newest_first: bool=True) -> Iterator[sqlite3.Row]:
+    """
+    Stream a user's full history (newest-first by default) without materialising it: rows
+    are pulled with fetchmany on a dedicated connection (closed when the iterator finishes),
+    so a long export or replay never ties up this thread's pooled connection.
+    """
+    order = "DESC" if newest_first else "ASC"
+    yield from _iter_query(f"SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp {order}, id {order}",
+                           (user_id,), chunk_size)
+
+def _iter_query(sql: str, params: tuple, chunk_size: int) -> Iterator[sqlite3.Row]:
     conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM transactions WHERE user_id = ? ORDER BY timestamp DESC", (user_id,))
-    r = cur.fetchall()
-    conn.close()
-    return r
+    try:
+        cur = conn.cursor()
+        cur.execute(sql, params)
+        while True:
+            chunk = cur.fetchmany(chunk_size)
+            if not chunk:
+                break
+            yield from chunk
+    finally:
+        conn.close()
+
+# --- Write-behind ledger persistence (used by ledger.py, bypassing the routing above) ---
+def load_account(user_id: int) -> tuple:
+    """(balances rows, holdings rows) for one user, read straight from the tables."""
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM balances WHERE user_id = ?", (user_id,))
+        balances = cur.fetchall()
+        cur.execute("SELECT * FROM holdings WHERE user_id = ?", (user_id,))
+        return balances, cur.fetchall()
+
+def get_max_transaction_id() -> int:
+    with db_cursor() as cur:
+        cur.execute("SELECT MAX(id) FROM transactions")
+        return cur.fetchone()[0] or 0
+
+def get_ledger_checkpoint() -> int:
+    """Last ledger journal sequence already reflected in the tables (0 if none)."""
+    with db_cursor() as cur:
+        cur.execute("SELECT seq FROM ledger_checkpoint WHERE id = 1")
+        r = cur.fetchone()
+    return r['seq'] if r else 0
+
+def write_ledger_batch(balances: Iterable[tuple], holdings: Iterable[tuple], deleted_holdings: Iterable[tuple],
+                       transactions: Iterable[tuple], seq: int):
+    """
+    Write one ledger flush in a single transaction: absolute balances
+    (user_id, currency, amount, updated_at), holdings (user_id, symbol, asset_type, quantity,
+    avg_price, last_updated), deleted holding keys, transactions with their ledger-assigned
+    ids, and the journal sequence they cover.
+    """
+    now = datetime.datetime.utcnow().isoformat()
+    with db_cursor(immediate=True) as cur:
+        cur.executemany("INSERT INTO balances (user_id, currency, amount, updated_at) VALUES (?, ?, ?, ?) "
+                        "ON CONFLICT(user_id, currency) DO UPDATE SET amount = excluded.amount, updated_at = excluded.updated_at",
+                        balances)
+        cur.executemany("DELETE FROM holdings WHERE user_id = ? AND symbol = ? AND asset_type = ?", deleted_holdings)
+        cur.executemany("INSERT INTO holdings (user_id, symbol, asset_type, quantity, avg_price, last_updated) VALUES (?, ?, ?, ?, ?, ?) "
+                        "ON CONFLICT(user_id, symbol, asset_type) DO UPDATE SET quantity = excluded.quantity, "
+                        "avg_price = excluded.avg_price, last_updated = excluded.last_updated",
+                        holdings)
+        cur.executemany("INSERT INTO transactions (id, user_id, symbol, asset_type, side, quantity, price, currency, timestamp) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                        transactions)
+        cur.execute("INSERT INTO ledger_checkpoint (id, seq, flushed_at) VALUES (1, ?, ?) "
+                    "ON CONFLICT(id) DO UPDATE SET seq = excluded.seq, flushed_at = excluded.flushed_at", (seq, now))
+
+# --- Batch valuation (whole-book streaming reads) ---
+def get_user_id_bounds() -> tuple:
+    """(min, max) user id, or (0, -1) when there are no users."""
+    with db_cursor() as cur:
+        cur.execute("SELECT MIN(id), MAX(id) FROM users")
+        lo, hi = cur.fetchone()
+    return (lo, hi) if lo is not None else (0, -1)
+
+def get_held_symbols() -> Dict[str, str]:
+    """Every symbol currently held by anyone -> currency of its latest transaction (USD if none)."""
+    with db_cursor() as cur:
+        # one index seek per held symbol on idx_transactions_symbol_id, not a scan of all history
+        cur.execute("""SELECT h.symbol,
+                              (SELECT t.currency FROM transactions t WHERE t.symbol = h.symbol
+                               ORDER BY t.id DESC LIMIT 1) AS currency
+                       FROM (SELECT DISTINCT symbol FROM holdings) h""")
+        return {r['symbol']: r['currency'] or 'USD' for r in cur.fetchall()}
+
+def get_account_currencies() -> set:
+    """Every preferred currency and balance currency in use."""
+    with db_cursor() as cur:
+        cur.execute("SELECT preferred_currency FROM users UNION SELECT currency FROM balances")
+        return {r[0] for r in cur.fetchall() if r[0]}
+
+def iter_users_range(lo: int, hi: int, chunk_size: int=5000) -> Iterator[sqlite3.Row]:
+    return _iter_query("SELECT id, preferred_currency FROM users WHERE id BETWEEN ? AND ? ORDER BY id",
+                       (lo, hi), chunk_size)
+
+def iter_holdings_range(lo: int, hi: int, chunk_size: int=5000) -> Iterator[sqlite3.Row]:
+    return _iter_query("SELECT user_id, symbol, quantity, avg_price FROM holdings WHERE user_id BETWEEN ? AND ? ORDER BY user_id",
+                       (lo, hi), chunk_size)
+
+def iter_balances_range(lo: int, hi: int, chunk_size: int=5000) -> Iterator[sqlite3.Row]:
+    return _iter_query("SELECT user_id, currency, amount FROM balances WHERE user_id BETWEEN ? AND ? ORDER BY user_id",
+                       (lo, hi), chunk_size)
+
+def save_valuation_snapshots(as_of: str, rows: Iterable[tuple]) -> int:
+    """Replace snapshots for `as_of`. rows: (user_id, currency, holdings_value, cash_value,
+    total_value, unrealized_pnl, positions, unpriced)."""
+    rows = [(as_of,) + tuple(r) for r in rows]
+    with db_cursor(immediate=True) as cur:
+        cur.execute("DELETE FROM valuation_snapshots WHERE as_of = ?", (as_of,))
+        cur.executemany("INSERT INTO valuation_snapshots VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+def get_valuation_snapshot(user_id: int, as_of: Optional[str]=None) -> Optional[sqlite3.Row]:
+    """A user's snapshot for `as_of`, or their latest one."""
+    with db_cursor() as cur:
+        if as_of is None:
+            cur.execute("SELECT * FROM valuation_snapshots WHERE user_id = ? ORDER BY as_of DESC LIMIT 1", (user_id,))
+        else:
+            cur.execute("SELECT * FROM valuation_snapshots WHERE user_id = ? AND as_of = ?", (user_id, as_of))
+        return cur.fetchone()
+
+# --- Symbol index ---
+SYMBOL_FIELDS = ("symbol", "name", "currency", "exchange", "asset_type", "source")
+
+def load_symbols() -> List[sqlite3.Row]:
+    with db_cursor() as cur:
+        cur.execute("SELECT symbol, name, currency, exchange, asset_type, source FROM symbols")
+        return cur.fetchall()
+
+def upsert_symbols(records: Iterable[Dict[str, Any]]) -> int:
+    """Insert or refresh symbol records (dicts with SYMBOL_FIELDS keys)."""
+    now = datetime.datetime.utcnow().isoformat()
+    rows = [tuple(r.get(f) for f in SYMBOL_FIELDS) + (now,) for r in records]
+    with db_cursor(immediate=True) as cur:
+        cur.executemany("INSERT OR REPLACE INTO symbols (symbol, name, currency, exchange, asset_type, source, updated_at) VALUES (?, ?, ?, ?, ?, ?, ?)", rows)
+    return len(rows)
+
+# --- OHLCV history cache ---
+def get_ohlcv_bars(symbol: str, interval: str, limit: int) -> List[sqlite3.Row]:
+    """The most recent `limit` cached bars, oldest first."""
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM (SELECT ts, open, high, low, close, volume FROM ohlcv_bars WHERE symbol = ? AND interval = ? ORDER BY ts DESC LIMIT ?) ORDER BY ts",
+                    (symbol, interval, limit))
+        return cur.fetchall()
+
+def get_ohlcv_meta(symbol: str, interval: str) -> Optional[sqlite3.Row]:
+    """Last fetch time, widest limit fetched and newest bar for a cached series."""
+    with db_cursor() as cur:
+        cur.execute("""SELECT m.fetched_at, m.max_limit,
+                              (SELECT MAX(ts) FROM ohlcv_bars b WHERE b.symbol = m.symbol AND b.interval = m.interval) AS last_ts
+                       FROM ohlcv_meta m WHERE m.symbol = ? AND m.interval = ?""", (symbol, interval))
+        return cur.fetchone()
+
+def upsert_ohlcv_bars(symbol: str, interval: str, rows: Iterable[tuple], fetched_at: float, limit: int):
+    """Merge fetched bars (ts, open, high, low, close, volume); newer data replaces overlapping bars."""
+    with db_cursor(immediate=True) as cur:
+        cur.executemany("INSERT OR REPLACE INTO ohlcv_bars (symbol, interval, ts, open, high, low, close, volume) VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                        ((symbol, interval) + tuple(r) for r in rows))
+        cur.execute("""INSERT INTO ohlcv_meta (symbol, interval, fetched_at, max_limit) VALUES (?, ?, ?, ?)
+                       ON CONFLICT(symbol, interval) DO UPDATE SET fetched_at = excluded.fetched_at,
+                       max_limit = MAX(max_limit, excluded.max_limit)""",
+                    (symbol, interval, fetched_at, limit))
 
 def add_watch(user_id: int, symbol: str, asset_type: str):
-    conn = get_conn()
-    cur = conn.cursor()
     now = datetime.datetime.utcnow().isoformat()
     try:
-        cur.execute("INSERT INTO watchlist (user_id, symbol, asset_type, added_at) VALUES (?, ?, ?, ?)",
-                    (user_id, symbol, asset_type, now))
-        conn.commit()
+        with db_cursor(commit=True) as cur:
+            cur.execute("INSERT INTO watchlist (user_id, symbol, asset_type, added_at) VALUES (?, ?, ?, ?)",
+                        (user_id, symbol, asset_type, now))
     except sqlite3.IntegrityError:
         pass
-    conn.close()
 
 def remove_watch(user_id: int, symbol: str, asset_type: str):
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("DELETE FROM watchlist WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
-    conn.commit()
-    conn.close()
+    with db_cursor(commit=True) as cur:
+        cur.execute("DELETE FROM watchlist WHERE user_id = ? AND symbol = ? AND asset_type = ?", (user_id, symbol, asset_type))
+
+def get_watched_symbols(limit: int=20) -> List[str]:
+    """The most-watched symbols across all users."""
+    with db_cursor() as cur:
+        cur.execute("SELECT symbol FROM watchlist GROUP BY symbol ORDER BY COUNT(*) DESC, symbol LIMIT ?", (limit,))
+        return [r['symbol'] for r in cur.fetchall()]
 
 def list_watchlist(user_id: int) -> List[sqlite3.Row]:
-    conn = get_conn()
-    cur = conn.cursor()
-    cur.execute("SELECT * FROM watchlist WHERE user_id = ?", (user_id,))
-    r = cur.fetchall()
-    conn.close()
-    return r
+    with db_cursor() as cur:
+        cur.execute("SELECT * FROM watchlist WHERE user_id = ?", (user_id,))
+        return cur.fetchall()
 
 # initialize DB on import
 init_db()
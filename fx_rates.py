@@ -0,0 +1,152 @@
+"""
+fx_rates.py
+
+Cached FX rate matrix. The full rate table for one base currency is fetched once per TTL
+(fiat from forex-python, optional crypto codes priced in USD via ccxt) and kept as an
+N x N matrix, so any cross rate is a single index lookup and whole arrays of amounts can
+be converted in one vectorized operation. A JSON fixture file can stand in for the
+network entirely (CROSSP_FX_FIXTURE), e.g.:
+
+    {"base": "USD", "rates": {"EUR": 0.92, "GBP": 0.79}, "crypto_usd": {"BTC": 65000}}
+
+where "rates" are units of each currency per one unit of base.
+"""
+import json
+import threading
+import time
+from typing import Callable, Dict, Iterable, Optional, Sequence, Tuple
+
+import numpy as np
+
+FiatFetcher = Callable[[str], Dict[str, float]]             # base -> units per base
+CryptoFetcher = Callable[[Sequence[str]], Dict[str, float]]  # codes -> USD price per coin
+
+def load_fixture(path: str) -> Dict:
+    with open(path, encoding="utf-8") as f:
+        data = json.load(f)
+    return {"base": data.get("base", "USD"), "rates": data.get("rates", {}),
+            "crypto_usd": data.get("crypto_usd", {})}
+
+class FxRateService:
+    """
+    rate(a, b) is how many units of b one unit of a buys. `pegs` adds currencies valued
+    at par with another (stablecoins quoted against USD). Refresh failures keep serving
+    the previous table (and are retried after `retry_after` seconds), and a currency
+    missing from one fetch keeps its previous rate; with no table at all, lookups return
+    None and callers fall back as they see fit.
+    """
+    def __init__(self, base: str="USD", ttl: float=3600.0, fiat_fetcher: Optional[FiatFetcher]=None,
+                 crypto_fetcher: Optional[CryptoFetcher]=None, crypto_codes: Iterable[str]=(),
+                 pegs: Optional[Dict[str, str]]=None, fixture_path: Optional[str]=None,
+                 retry_after: float=30.0):
+        self.base = base.upper()
+        self.ttl = ttl
+        self.retry_after = retry_after
+        self.fiat_fetcher = fiat_fetcher
+        self.crypto_fetcher = crypto_fetcher
+        self.crypto_codes = [c.upper() for c in crypto_codes]
+        self.pegs = {k.upper(): v.upper() for k, v in (pegs or {}).items()}  # e.g. USDT -> USD at par
+        self.fixture_path = fixture_path
+        # (index, matrix), swapped as one object so readers never pair a new matrix with an old index
+        self._table: Tuple[Dict[str, int], np.ndarray] = ({}, np.empty((0, 0)))
+        self._expires_at = 0.0
+        self._lock = threading.Lock()
+        self.stats = {"refreshes": 0, "refresh_errors": 0, "lookups": 0, "misses": 0}
+
+    # --- table maintenance ---
+    def _fetch_units(self) -> Dict[str, float]:
+        """Units of every known currency per one unit of base."""
+        if self.fixture_path:
+            fx = load_fixture(self.fixture_path)
+            if fx["base"].upper() != self.base:
+                raise ValueError(f"fixture base {fx['base']} != service base {self.base}")
+            units, crypto_usd = dict(fx["rates"]), fx["crypto_usd"]
+        else:
+            units = dict(self.fiat_fetcher(self.base)) if self.fiat_fetcher else {}
+            crypto_usd = self.crypto_fetcher(self.crypto_codes) if self.crypto_fetcher and self.crypto_codes else {}
+        units = {c.upper(): float(v) for c, v in units.items() if v}
+        units[self.base] = 1.0
+        usd_per_base = 1.0 / units["USD"] if "USD" in units else None
+        if usd_per_base:
+            for code, usd_price in crypto_usd.items():
+                if usd_price:
+                    # coins per base = (USD per base) / (USD per coin)
+                    units[code.upper()] = usd_per_base / float(usd_price)
+        for code, target in self.pegs.items():
+            if target in units:
+                units.setdefault(code, units[target])
+        return units
+
+    def refresh(self) -> bool:
+        """Fetch a new table now; returns False (keeping the old one) on failure."""
+        try:
+            units = self._fetch_units()
+        except Exception:
+            self.stats["refresh_errors"] += 1
+            self._expires_at = time.monotonic() + self.retry_after
+            return False
+        index, matrix = self._table
+        if self.base in index:
+            # a coin without a price (or every coin, if USD is missing) keeps its last rate
+            row = matrix[index[self.base]]
+            for code, i in index.items():
+                units.setdefault(code, float(row[i]))
+        codes = sorted(units)
+        u = np.array([units[c] for c in codes])
+        # matrix[i, j] = units of j per unit of i
+        self._table = ({c: i for i, c in enumerate(codes)}, u[None, :] / u[:, None])
+        self._expires_at = time.monotonic() + self.ttl
+        self.stats["refreshes"] += 1
+        return True
+
+    def _current(self):
+        if time.monotonic() >= self._expires_at:
+            with self._lock:
+                if time.monotonic() >= self._expires_at:
+                    self.refresh()
+        return self._table
+
+    # --- lookups ---
+    def currencies(self) -> list:
+        return list(self._current()[0])
+
+    def rate(self, from_currency: str, to_currency: str) -> Optional[float]:
+        """Cross rate from_currency -> to_currency, or None if either is unknown."""
+        index, matrix = self._current()
+        self.stats["lookups"] += 1
+        i, j = index.get(from_currency.upper()), index.get(to_currency.upper())
+        if i is None or j is None:
+            self.stats["misses"] += 1
+            return None
+        return float(matrix[i, j])
+
+    def convert(self, amount: float, from_currency: str, to_currency: str) -> Optional[float]:
+        if from_currency.upper() == to_currency.upper():
+            return amount
+        r = self.rate(from_currency, to_currency)
+        return None if r is None else amount * r
+
+    def convert_many(self, amounts, from_currencies, to_currency: str) -> np.ndarray:
+        """
+        Convert an array of amounts, each in its own currency, into to_currency in one
+        operation. Entries in unknown currencies come back as NaN.
+        """
+        index, matrix = self._current()
+        amounts = np.asarray(amounts, dtype=float)
+        codes = np.broadcast_to(np.asarray(from_currencies, dtype=object), amounts.shape)
+        j = index.get(to_currency.upper())
+        if j is None:
+            return np.full(amounts.shape, np.nan)
+        # map each distinct code once, then gather the matching column entries
+        uniq, inverse = np.unique(codes.astype(str), return_inverse=True)
+        col = np.array([matrix[index[c.upper()], j] if c.upper() in index else np.nan for c in uniq])
+        return amounts * col[inverse.reshape(amounts.shape)]
+
+    def rates_to(self, to_currency: str, currencies: Iterable[str]) -> Dict[str, float]:
+        """{currency: rate into to_currency} for every known currency in `currencies`."""
+        out = {}
+        for c in currencies:
+            r = self.rate(c, to_currency)
+            if r is not None:
+                out[c] = r
+        return out
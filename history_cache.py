@@ -0,0 +1,67 @@
+"""
+history_cache.py
+
+Persistent OHLCV history cache backed by the ohlcv_bars table in the app database.
+Charts read candles from SQLite; upstream (yfinance/ccxt) is only asked for the bars
+after the last stored one (plus that bar, which may still have been forming), so
+history survives restarts and is shared by every user of the same database.
+"""
+import math
+import time
+from typing import Callable
+
+import pandas as pd
+
+import database
+
+INTERVAL_SECONDS = {"1m": 60, "5m": 300, "15m": 900, "1h": 3600, "1d": 86400}
+COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+# Re-check upstream at most this often (seconds), even for long intervals
+MAX_STALENESS = 60.0
+# An upstream that returned nothing for a new series (unknown or delisted symbol) is not
+# asked again for this long (seconds)
+NEGATIVE_TTL = 300.0
+
+Fetcher = Callable[[str, str, int], pd.DataFrame]
+
+def _to_rows(df: pd.DataFrame):
+    index = pd.DatetimeIndex(df.index)
+    index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    ts = index.asi8 // 10**9
+    values = df.reindex(columns=COLUMNS).to_numpy(dtype=float)
+    return [(int(t),) + tuple(None if math.isnan(v) else float(v) for v in row) for t, row in zip(ts, values)]
+
+def _to_frame(rows) -> pd.DataFrame:
+    if not rows:
+        return pd.DataFrame(columns=COLUMNS, index=pd.DatetimeIndex([], tz="UTC"))
+    df = pd.DataFrame([tuple(r) for r in rows], columns=["ts"] + COLUMNS)
+    df.index = pd.to_datetime(df.pop("ts"), unit="s", utc=True)
+    df.index.name = None
+    return df
+
+def cached_history(symbol: str, interval: str, limit: int, fetch: Fetcher) -> pd.DataFrame:
+    """
+    The last `limit` bars of symbol/interval, fetching only the missing tail from upstream.
+    A series is fully (re)fetched the first time, or when more bars are requested than
+    were ever fetched for it. A first fetch that comes back empty is remembered as a
+    negative entry (meta without bars) for NEGATIVE_TTL seconds.
+    """
+    seconds = INTERVAL_SECONDS.get(interval, 86400)
+    now = time.time()
+    meta = database.get_ohlcv_meta(symbol, interval)
+    if meta is not None and meta["last_ts"] is None and now - meta["fetched_at"] < NEGATIVE_TTL:
+        need = 0
+    elif meta is None or meta["last_ts"] is None or limit > meta["max_limit"]:
+        need = limit
+    elif now - meta["fetched_at"] < min(seconds, MAX_STALENESS):
+        need = 0
+    else:
+        need = min(limit, int((now - meta["last_ts"]) // seconds) + 1)
+    if need:
+        df = fetch(symbol, interval, need)
+        if df is not None and not df.empty:
+            database.upsert_ohlcv_bars(symbol, interval, _to_rows(df), now, limit if need == limit else 0)
+        else:
+            # nothing new: record the attempt so the next call honours the freshness window
+            database.upsert_ohlcv_bars(symbol, interval, [], now, 0)
+    return _to_frame(database.get_ohlcv_bars(symbol, interval, limit))
@@ -0,0 +1,396 @@
+"""
+indicators.py
+
+Technical indicators for the dashboard charts.
+
+Two flavours share the same definitions:
+- vectorized kernels (sma, ema, rsi, macd, bollinger, vwap, atr) take (bars x symbols)
+  NumPy arrays, so many symbols are computed in one pass;
+- streaming indicators update in O(1) per new bar, and IndicatorCache keeps one per
+  (symbol, interval, indicator, params) so a chart rerun only pays for bars it has not seen.
+
+Conventions: EMA seeds with the first value (pandas ewm(adjust=False)); RSI and ATR use
+Wilder smoothing seeded with the simple mean of the first n values; Bollinger bands use the
+population standard deviation. Warm-up values are NaN.
+
+Missing bars (NaN, e.g. gaps in a multi-symbol matrix) never poison later values: window
+indicators are NaN while a NaN is inside the window (pandas rolling), and recursive ones
+skip the bar and carry their last value (pandas ewm(ignore_na=True)).
+"""
+import math
+import threading
+from collections import OrderedDict, deque
+from typing import Tuple
+
+import numpy as np
+import pandas as pd
+from numpy.lib.stride_tricks import sliding_window_view
+
+# ---------------------------
+# Vectorized kernels
+# ---------------------------
+def _2d(x) -> np.ndarray:
+    x = np.asarray(x, dtype=float)
+    return x[:, None] if x.ndim == 1 else x
+
+def _shape_like(out: np.ndarray, x) -> np.ndarray:
+    return out[:, 0] if np.ndim(x) == 1 else out
+
+def sma(close, n: int) -> np.ndarray:
+    c = _2d(close)
+    out = np.full_like(c, np.nan)
+    if len(c) >= n:
+        valid = ~np.isnan(c)
+        zero = np.zeros((1, c.shape[1]))
+        csum = np.cumsum(np.vstack([zero, np.where(valid, c, 0.0)]), axis=0)
+        ccount = np.cumsum(np.vstack([zero, valid]), axis=0)
+        full = (ccount[n:] - ccount[:-n]) == n
+        out[n - 1:] = np.where(full, (csum[n:] - csum[:-n]) / n, np.nan)
+    return _shape_like(out, close)
+
+def _recursive(x: np.ndarray, alpha: float, seed_len: int) -> np.ndarray:
+    """
+    y[t] = y[t-1] + alpha * (x[t] - y[t-1]), seeded with the mean of the first seed_len
+    values; loops over time only. NaN inputs are skipped per column and carry y forward.
+    """
+    out = np.full_like(x, np.nan)
+    if len(x) < seed_len:
+        return out
+    if not np.isnan(x).any():
+        prev = x[:seed_len].mean(axis=0)
+        out[seed_len - 1] = prev
+        for t in range(seed_len, len(x)):
+            prev = prev + alpha * (x[t] - prev)
+            out[t] = prev
+        return out
+    prev = np.full(x.shape[1], np.nan)
+    total = np.zeros(x.shape[1])
+    count = np.zeros(x.shape[1], dtype=int)
+    for t in range(len(x)):
+        xt = x[t]
+        valid = ~np.isnan(xt)
+        seeded = count >= seed_len
+        step = valid & seeded
+        prev[step] += alpha * (xt[step] - prev[step])
+        fill = valid & ~seeded
+        total[fill] += xt[fill]
+        count[fill] += 1
+        done = fill & (count == seed_len)
+        prev[done] = total[done] / seed_len
+        out[t] = prev
+    return out
+
+def ema(close, n: int) -> np.ndarray:
+    return _shape_like(_recursive(_2d(close), 2.0 / (n + 1), 1), close)
+
+def rsi(close, n: int=14) -> np.ndarray:
+    c = _2d(close)
+    out = np.full_like(c, np.nan)
+    if len(c) <= n:
+        return _shape_like(out, close)
+    diff = np.diff(c, axis=0)
+    avg_gain = _recursive(np.clip(diff, 0, None), 1.0 / n, n)
+    avg_loss = _recursive(np.clip(-diff, 0, None), 1.0 / n, n)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        rs = avg_gain / avg_loss
+        out[1:] = np.where(avg_loss == 0, 100.0, 100.0 - 100.0 / (1.0 + rs))
+    out[1:][np.isnan(avg_gain)] = np.nan
+    return _shape_like(out, close)
+
+def macd(close, fast: int=12, slow: int=26, signal: int=9) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    line = ema(close, fast) - ema(close, slow)
+    sig = ema(line, signal)
+    return line, sig, line - sig
+
+def bollinger(close, n: int=20, k: float=2.0) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    c = _2d(close)
+    mid = np.full_like(c, np.nan)
+    std = np.full_like(c, np.nan)
+    if len(c) >= n:
+        windows = sliding_window_view(c, n, axis=0)
+        mid[n - 1:] = windows.mean(axis=-1)
+        std[n - 1:] = windows.std(axis=-1)
+    return _shape_like(mid, close), _shape_like(mid + k * std, close), _shape_like(mid - k * std, close)
+
+def vwap(high, low, close, volume) -> np.ndarray:
+    typical = (_2d(high) + _2d(low) + _2d(close)) / 3.0
+    v = _2d(volume)
+    pv = typical * v
+    valid = ~np.isnan(pv)
+    with np.errstate(divide="ignore", invalid="ignore"):
+        out = np.cumsum(np.where(valid, pv, 0.0), axis=0) / np.cumsum(np.where(valid, v, 0.0), axis=0)
+    return _shape_like(out, close)
+
+def atr(high, low, close, n: int=14) -> np.ndarray:
+    h, l, c = _2d(high), _2d(low), _2d(close)
+    prev_close = np.vstack([c[:1], c[:-1]])
+    # fmax: a missing previous close falls back to the bar's own range
+    tr = np.fmax(h - l, np.fmax(np.abs(h - prev_close), np.abs(l - prev_close)))
+    return _shape_like(_recursive(tr, 1.0 / n, n), close)
+
+# ---------------------------
+# Streaming (O(1) per bar) indicators
+# ---------------------------
+# Each takes a bar (open, high, low, close, volume) and returns a tuple of outputs.
+# update() commits the bar; peek() evaluates a still-forming bar without committing it.
+NAN = float("nan")
+
+class _Wilder:
+    """Recursive smoother seeded with the mean of the first `seed` values; NaN inputs are skipped."""
+    __slots__ = ("alpha", "seed", "count", "total", "value")
+    def __init__(self, alpha: float, seed: int):
+        self.alpha, self.seed = alpha, seed
+        self.count, self.total, self.value = 0, 0.0, NAN
+    def next(self, x: float, commit: bool=True) -> float:
+        if math.isnan(x):
+            return self.value
+        count = self.count + 1
+        if count < self.seed:
+            value, total = NAN, self.total + x
+        elif count == self.seed:
+            total = self.total + x
+            value = total / self.seed
+        else:
+            total, value = self.total, self.value + self.alpha * (x - self.value)
+        if commit:
+            self.count, self.total, self.value = count, total, value
+        return value
+
+class _WindowSums:
+    """Sum and sum of squares over the last n values; NaNs are counted, never summed."""
+    __slots__ = ("n", "window", "total", "total_sq", "nans")
+    def __init__(self, n: int):
+        self.n, self.window = n, deque()
+        self.total = self.total_sq = 0.0
+        self.nans = 0
+    def calc(self, x: float) -> tuple:
+        """(total, total_sq, nans, full) after appending x, without committing."""
+        full = len(self.window) == self.n
+        old = self.window[0] if full else 0.0
+        old_nan, x_nan = math.isnan(old), math.isnan(x)
+        if old_nan:
+            old = 0.0
+        xv = 0.0 if x_nan else x
+        nans = self.nans + x_nan - (full and old_nan)
+        filled = len(self.window) + (0 if full else 1) >= self.n
+        return self.total + xv - old, self.total_sq + xv * xv - old * old, nans, filled
+    def commit(self, x: float, state: tuple):
+        self.total, self.total_sq, self.nans, _ = state
+        if len(self.window) == self.n:
+            self.window.popleft()
+        self.window.append(x)
+
+class SMAStream:
+    outputs = ("sma",)
+    def __init__(self, n: int=10):
+        self.n, self.sums = n, _WindowSums(n)
+    def _calc(self, x):
+        state = self.sums.calc(x)
+        total, _, nans, filled = state
+        return state, (total / self.n if filled and not nans else NAN)
+    def update(self, bar):
+        state, value = self._calc(bar[3])
+        self.sums.commit(bar[3], state)
+        return (value,)
+    def peek(self, bar):
+        return (self._calc(bar[3])[1],)
+
+class EMAStream:
+    outputs = ("ema",)
+    def __init__(self, n: int=20):
+        self.ema = _Wilder(2.0 / (n + 1), 1)
+    def update(self, bar):
+        return (self.ema.next(bar[3]),)
+    def peek(self, bar):
+        return (self.ema.next(bar[3], commit=False),)
+
+class RSIStream:
+    outputs = ("rsi",)
+    def __init__(self, n: int=14):
+        self.gain, self.loss, self.prev = _Wilder(1.0 / n, n), _Wilder(1.0 / n, n), None
+    def _calc(self, close, commit):
+        if self.prev is None:
+            if commit:
+                self.prev = close
+            return (NAN,)
+        diff = close - self.prev
+        if math.isnan(diff):  # a missing bar on either side: carry the averages
+            g, l = self.gain.value, self.loss.value
+        else:
+            g = self.gain.next(max(diff, 0.0), commit)
+            l = self.loss.next(max(-diff, 0.0), commit)
+        if commit:
+            self.prev = close
+        if math.isnan(g):
+            return (NAN,)
+        return (100.0 if l == 0 else 100.0 - 100.0 / (1.0 + g / l),)
+    def update(self, bar):
+        return self._calc(bar[3], True)
+    def peek(self, bar):
+        return self._calc(bar[3], False)
+
+class MACDStream:
+    outputs = ("macd", "signal", "hist")
+    def __init__(self, fast: int=12, slow: int=26, signal: int=9):
+        self.fast, self.slow = _Wilder(2.0 / (fast + 1), 1), _Wilder(2.0 / (slow + 1), 1)
+        self.signal = _Wilder(2.0 / (signal + 1), 1)
+    def _calc(self, close, commit):
+        line = self.fast.next(close, commit) - self.slow.next(close, commit)
+        sig = self.signal.next(line, commit)
+        return (line, sig, line - sig)
+    def update(self, bar):
+        return self._calc(bar[3], True)
+    def peek(self, bar):
+        return self._calc(bar[3], False)
+
+class BollingerStream:
+    outputs = ("mid", "upper", "lower")
+    def __init__(self, n: int=20, k: float=2.0):
+        self.n, self.k, self.sums = n, k, _WindowSums(n)
+    def _calc(self, x):
+        state = self.sums.calc(x)
+        total, total_sq, nans, filled = state
+        if not filled or nans:
+            return state, (NAN, NAN, NAN)
+        mid = total / self.n
+        std = math.sqrt(max(total_sq / self.n - mid * mid, 0.0))
+        return state, (mid, mid + self.k * std, mid - self.k * std)
+    def update(self, bar):
+        state, out = self._calc(bar[3])
+        self.sums.commit(bar[3], state)
+        return out
+    def peek(self, bar):
+        return self._calc(bar[3])[1]
+
+class VWAPStream:
+    outputs = ("vwap",)
+    def __init__(self):
+        self.pv = self.v = 0.0
+    def _calc(self, bar):
+        bar_pv = (bar[1] + bar[2] + bar[3]) / 3.0 * bar[4]
+        if math.isnan(bar_pv):
+            return self.pv, self.v, (self.pv / self.v if self.v else NAN,)
+        pv = self.pv + bar_pv
+        v = self.v + bar[4]
+        return pv, v, (pv / v if v else NAN,)
+    def update(self, bar):
+        self.pv, self.v, out = self._calc(bar)
+        return out
+    def peek(self, bar):
+        return self._calc(bar)[2]
+
+class ATRStream:
+    outputs = ("atr",)
+    def __init__(self, n: int=14):
+        self.tr, self.prev_close = _Wilder(1.0 / n, n), None
+    def _calc(self, bar, commit):
+        pc = bar[3] if self.prev_close is None else self.prev_close
+        ranges = [r for r in (bar[1] - bar[2], abs(bar[1] - pc), abs(bar[2] - pc)) if not math.isnan(r)]
+        tr = max(ranges) if ranges else NAN
+        value = self.tr.next(tr, commit)
+        if commit:
+            self.prev_close = bar[3]
+        return (value,)
+    def update(self, bar):
+        return self._calc(bar, True)
+    def peek(self, bar):
+        return self._calc(bar, False)
+
+STREAMS = {"sma": SMAStream, "ema": EMAStream, "rsi": RSIStream, "macd": MACDStream,
+           "bollinger": BollingerStream, "vwap": VWAPStream, "atr": ATRStream}
+
+# ---------------------------
+# Per-(symbol, interval, params) cache
+# ---------------------------
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+def _bar_matrix(df: pd.DataFrame, start: int) -> np.ndarray:
+    """Rows `start:` of df as an (n, 5) float array in BAR_COLUMNS order; missing Volume is 0."""
+    n = len(df) - start
+    out = np.full((max(n, 0), len(BAR_COLUMNS)), np.nan)
+    for j, col in enumerate(BAR_COLUMNS):
+        if col in df.columns:
+            out[:, j] = df[col].to_numpy(dtype=float)[start:]
+    vol = out[:, 4]
+    vol[np.isnan(vol)] = 0.0
+    return out
+
+class _Entry:
+    __slots__ = ("stream", "last_ts", "values", "count")
+    def __init__(self, stream, width: int, capacity: int):
+        self.stream = stream
+        self.last_ts = None  # timestamp of the newest committed (closed) bar
+        self.values = np.full((capacity, width), np.nan)
+        self.count = 0       # committed rows held in `values`
+
+    def append(self, row):
+        if self.count == len(self.values):
+            keep = len(self.values) // 2
+            self.values[:keep] = self.values[self.count - keep:self.count]
+            self.count = keep
+        self.values[self.count] = row
+        self.count += 1
+
+class IndicatorCache:
+    """
+    Keeps a streaming indicator per (symbol, interval, name, params). On each call the
+    bars after the last committed one are folded in; the final bar is treated as still
+    forming and only peeked, so it can change on the next call without a recompute.
+    A full recompute happens only when the cached series no longer lines up with `df`.
+    """
+    def __init__(self, max_entries: int=256, max_bars: int=5000):
+        self.max_entries = max_entries
+        self.max_bars = max_bars
+        self._entries: "OrderedDict[tuple, _Entry]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"rebuilds": 0, "incremental": 0}
+
+    def compute(self, symbol: str, interval: str, df: pd.DataFrame, name: str, **params) -> pd.DataFrame:
+        """Indicator `name` for OHLCV frame `df` (Open/High/Low/Close/Volume), aligned to df.index."""
+        cls = STREAMS[name]
+        columns = list(cls.outputs)
+        key = (symbol, interval, name, tuple(sorted(params.items())))
+        n = len(df)
+        if not n:
+            return pd.DataFrame(columns=columns, index=df.index)
+        with self._lock:
+            entry = self._entries.get(key)
+            start = None
+            if entry is not None:
+                if entry.last_ts is None:
+                    start = 0
+                else:
+                    try:
+                        loc = df.index.get_loc(entry.last_ts)
+                    except KeyError:
+                        loc = None
+                    if isinstance(loc, (int, np.integer)):
+                        start = int(loc) + 1
+            if start is None:
+                entry = _Entry(cls(**params), len(columns), 2 * self.max_bars)
+                start = 0
+                self.stats["rebuilds"] += 1
+            else:
+                self.stats["incremental"] += 1
+            # only the unseen tail is converted; the last bar may still be forming
+            tail = _bar_matrix(df, start)
+            for bar in tail[:-1]:
+                entry.append(entry.stream.update(bar))
+            if len(tail) > 1:
+                entry.last_ts = df.index[n - 2]
+            last = entry.stream.peek(tail[-1]) if len(tail) else None
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            # committed rows end just before the final bar of df
+            out = np.full((n, len(columns)), np.nan)
+            end = max(start, n - 1) if len(tail) else start
+            k = min(entry.count, end, self.max_bars)
+            if k:
+                out[end - k:end] = entry.values[entry.count - k:entry.count]
+            if last is not None:
+                out[n - 1] = last
+        return pd.DataFrame(out, index=df.index, columns=columns)
+
+indicator_cache = IndicatorCache()
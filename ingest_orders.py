@@ -0,0 +1,49 @@
+"""
+ingest_orders.py
+
+Command-line bulk order loader. Reads orders from a CSV or JSONL file and pushes them
+through database.execute_orders_bulk, reporting the achieved throughput.
+
+CSV/JSONL fields: user_id, symbol, asset_type, side, qty (or quantity), price,
+tx_currency (or currency), pref_currency, fx_rate.
+
+    python ingest_orders.py orders.jsonl --batch-size 5000
+"""
+import argparse
+import csv
+import json
+import time
+from typing import Dict, Iterator
+
+from database import execute_orders_bulk
+import ledger
+
+def read_orders(path: str) -> Iterator[Dict]:
+    """Yield orders one at a time so large files are never fully loaded."""
+    with open(path, newline='', encoding='utf-8') as f:
+        if path.endswith(".csv"):
+            for row in csv.DictReader(f):
+                yield row
+        else:
+            for line in f:
+                line = line.strip()
+                if line:
+                    yield json.loads(line)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk-load orders into Cross-P.")
+    parser.add_argument("path", help="CSV or JSONL file of orders")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args(argv)
+    # in ledger mode this either becomes the ledger process or fails fast if another one is running
+    ledger.enable_from_env()
+    t0 = time.perf_counter()
+    stats = execute_orders_bulk(read_orders(args.path), batch_size=args.batch_size)
+    elapsed = time.perf_counter() - t0
+    total = stats['accepted'] + stats['rejected']
+    print(f"{stats['accepted']} accepted, {stats['rejected']} rejected in {stats['batches']} batches "
+          f"({elapsed:.2f}s, {total / elapsed if elapsed else 0:,.0f} orders/s)")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,515 @@
+"""
+ledger.py
+
+Optional write-behind ledger for high-frequency simulated trading. While enabled, per-user
+balances and holdings are held in memory as the authoritative state: an order is checked
+and applied against plain dicts, appended to a write-ahead journal (one JSON line per
+mutation) and acknowledged, and a background thread writes the net effect of everything
+since the last flush to SQLite in one transaction. Each flush records the last journal
+sequence it covered (ledger_checkpoint), so on startup every journal entry past that
+checkpoint is replayed into the tables before the ledger serves again.
+
+Enable with CROSSP_LEDGER_JOURNAL=/var/lib/crossp/ledger.journal (plus
+CROSSP_LEDGER_FLUSH_INTERVAL seconds and CROSSP_LEDGER_FSYNC=1 to fsync every append).
+Only the process that places orders enables it (the Streamlit trade and portfolio pages,
+ingest_orders.py); the FastAPI workers keep reading the tables. The ledger must be the
+only writer of balances, holdings and transactions while it is attached, so open() takes
+an exclusive lock on <journal>.lock and fails fast if another process holds it.
+Transaction history, /export and the valuation job read the tables and trail the ledger
+by at most one flush.
+"""
+import atexit
+import datetime
+import fcntl
+import glob
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+
+import database
+
+class _Account:
+    __slots__ = ("balances", "holdings")
+
+    def __init__(self):
+        self.balances: Dict[str, list] = {}    # currency -> [amount, row id, updated_at]
+        self.holdings: Dict[tuple, list] = {}  # (symbol, asset_type) -> [quantity, avg_price, row id, last_updated]
+
+    def copy(self) -> "_Account":
+        other = _Account()
+        other.balances = {k: list(v) for k, v in self.balances.items()}
+        other.holdings = {k: list(v) for k, v in self.holdings.items()}
+        return other
+
+class Ledger:
+    """
+    Accounts are loaded from the tables on first touch and kept (up to `max_accounts`,
+    least recently used clean accounts evicted first). Mutations are journalled before
+    they are applied; `fsync=True` makes each append survive power loss, otherwise it
+    survives a process crash. A flush starts once `flush_interval` seconds have passed or
+    `max_pending` entries are waiting, whichever comes first.
+    """
+    def __init__(self, journal_path: str, flush_interval: float=1.0, max_pending: int=10000,
+                 fsync: bool=False, max_accounts: int=100000):
+        self.journal_path = journal_path
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.fsync = fsync
+        self.max_accounts = max_accounts
+        self._accounts: "OrderedDict[int, _Account]" = OrderedDict()
+        self._dirty_users: set = set()
+        self._flushing: set = set()    # users in the flush being written: never evicted
+        self._dirty_bal: set = set()   # (user_id, currency)
+        self._dirty_hold: set = set()  # (user_id, symbol, asset_type)
+        self._tx_rows: List[tuple] = []
+        self._undo: Optional[Dict[int, Optional[_Account]]] = None
+        self._seq = 0
+        self._next_tx_id = 1
+        self._pending = 0
+        self._journal = None
+        self._lock_file = None
+        self._closed = False
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._flusher: Optional[threading.Thread] = None
+        self.stats = {"orders": 0, "rejected": 0, "flushes": 0, "flush_errors": 0,
+                      "transactions_flushed": 0, "replayed": 0}
+
+    # --- journal ---
+    def _segments(self) -> List[tuple]:
+        """Rotated journal files as (last seq, path), oldest first."""
+        out = []
+        for path in glob.glob(glob.escape(self.journal_path) + ".*"):
+            suffix = path[len(self.journal_path) + 1:]
+            if suffix.isdigit():
+                out.append((int(suffix), path))
+        return sorted(out)
+
+    def _read_journal(self) -> Iterator[Dict[str, Any]]:
+        paths = [p for _, p in self._segments()]
+        if os.path.exists(self.journal_path):
+            paths.append(self.journal_path)
+        for path in paths:
+            with open(path, encoding="utf-8") as f:
+                for line in f:
+                    try:
+                        yield json.loads(line)
+                    except ValueError:
+                        continue  # torn write from a crash mid-append: that entry was never acknowledged
+
+    def _truncate_torn_tail(self):
+        """Cut a partial last line off the live journal so new appends start on a fresh line."""
+        if not os.path.exists(self.journal_path):
+            return
+        with open(self.journal_path, "rb+") as f:
+            size = pos = f.seek(0, os.SEEK_END)
+            while pos > 0:
+                step = min(4096, pos)
+                f.seek(pos - step)
+                i = f.read(step).rfind(b"\n")
+                if i >= 0:
+                    pos = pos - step + i + 1
+                    break
+                pos -= step
+            if pos != size:
+                f.truncate(pos)
+
+    def _open_journal(self):
+        # unbuffered, so bytes from a failed append are never written out by a later one
+        return open(self.journal_path, "ab", buffering=0)
+
+    def _append(self, lines: List[str]):
+        """Write lines to the journal; on failure the journal is cut back to where it was."""
+        data = memoryview("".join(lines).encode("utf-8"))
+        start = self._journal.tell()
+        try:
+            while data:
+                data = data[self._journal.write(data):]
+            if self.fsync:
+                os.fsync(self._journal.fileno())
+        except BaseException:
+            self._reset_journal(start)
+            raise
+
+    def _reset_journal(self, size: int):
+        """Reopen the journal truncated to `size` bytes; if that fails the ledger closes."""
+        try:
+            self._journal.close()
+        except OSError:
+            pass
+        try:
+            os.truncate(self.journal_path, size)
+            self._journal = self._open_journal()
+        except OSError:
+            # the journal may still hold a rolled-back entry: refuse writes rather than reuse its seq
+            self._closed = True
+            raise
+
+    def _rotate(self):
+        """Close off the current journal as a segment named by the last seq it holds."""
+        if not self._journal.closed:
+            if self._journal.tell() == 0:
+                return
+            os.fsync(self._journal.fileno())
+            self._journal.close()
+        # a journal left closed by a failed reset is still rotated, so the flush drops its stray tail
+        os.replace(self.journal_path, f"{self.journal_path}.{self._seq:020d}")
+        self._journal = self._open_journal()
+
+    def _drop_segments(self, upto: int):
+        for seq, path in self._segments():
+            if seq <= upto:
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+
+    # --- state ---
+    def _account(self, user_id: int) -> _Account:
+        acct = self._accounts.get(user_id)
+        if acct is not None:
+            self._accounts.move_to_end(user_id)
+            return acct
+        balances, holdings = database.load_account(user_id)
+        acct = _Account()
+        for r in balances:
+            acct.balances[r['currency']] = [float(r['amount']), r['id'], r['updated_at']]
+        for r in holdings:
+            acct.holdings[(r['symbol'], r['asset_type'])] = [float(r['quantity']), float(r['avg_price']),
+                                                             r['id'], r['last_updated']]
+        self._accounts[user_id] = acct
+        if len(self._accounts) > self.max_accounts:
+            for uid in list(self._accounts):
+                if len(self._accounts) <= self.max_accounts:
+                    break
+                if (uid != user_id and uid not in self._dirty_users and uid not in self._flushing
+                        and not (self._undo and uid in self._undo)):
+                    del self._accounts[uid]
+        return acct
+
+    def _apply(self, entry: Dict[str, Any]):
+        """Apply one journal entry to memory (no checks: it was validated when first logged)."""
+        op, user_id, ts = entry["op"], entry["user_id"], entry["ts"]
+        if self._undo is not None and user_id not in self._undo:
+            acct = self._accounts.get(user_id)
+            self._undo[user_id] = acct.copy() if acct is not None else None
+        acct = self._account(user_id)
+        if op in ("order", "balance"):
+            cur = entry["currency"]
+            bal = acct.balances.get(cur)
+            if bal is None:
+                bal = acct.balances[cur] = [0.0, None, ts]
+            bal[0] += entry["amount"]
+            bal[2] = ts
+            self._dirty_bal.add((user_id, cur))
+        if op in ("order", "holding"):
+            key, delta, price = (entry["symbol"], entry["asset_type"]), entry["qty_delta"], entry["price"]
+            h = acct.holdings.get(key)
+            if h is None:
+                if delta > 0:
+                    acct.holdings[key] = [delta, price, None, ts]
+            else:
+                # same average-cost rule as database._apply_holding_delta
+                new_qty = h[0] + delta
+                if new_qty <= 0:
+                    del acct.holdings[key]
+                else:
+                    if delta > 0:
+                        h[1] = ((h[0] * h[1]) + (delta * price)) / new_qty
+                    h[0], h[3] = new_qty, ts
+            self._dirty_hold.add((user_id,) + key)
+        if op in ("order", "tx"):
+            self._tx_rows.append((entry["tx"], user_id, entry["symbol"], entry["asset_type"], entry["side"],
+                                  entry["qty"], entry["price"], entry["tx_currency"], ts))
+            self._next_tx_id = max(self._next_tx_id, entry["tx"] + 1)
+        self._dirty_users.add(user_id)
+        self._seq = entry["seq"]
+        self._pending += 1
+        if self._pending >= self.max_pending:
+            self._wake.set()
+
+    def _log(self, entry: Dict[str, Any]):
+        """Journal one entry, then apply it (caller holds the lock)."""
+        if self._closed:
+            raise RuntimeError("ledger is closed")
+        entry["seq"] = self._seq + 1
+        self._append([json.dumps(entry, separators=(",", ":")) + "\n"])
+        self._apply(entry)
+
+    def _order_entry(self, user_id: int, symbol: str, asset_type: str, side: str, qty: float, price: float,
+                     tx_currency: str, pref_currency: str, fx_rate: float, ts: str) -> Dict[str, Any]:
+        """Check an order against current state (raising OrderError) and build its journal entry."""
+        acct = self._account(user_id)
+        cost = qty * price * fx_rate
+        if side == "BUY":
+            bal = acct.balances.get(pref_currency)
+            have = bal[0] if bal else 0.0
+            if have < cost:
+                raise database.OrderError(f"Insufficient balance: have {have} {pref_currency}, need {cost:.2f} {pref_currency}")
+        else:
+            h = acct.holdings.get((symbol, asset_type))
+            if not h or h[0] < qty:
+                raise database.OrderError("Not enough holdings to sell.")
+        return {"seq": self._seq + 1, "op": "order", "ts": ts, "tx": self._next_tx_id, "user_id": user_id,
+                "symbol": symbol, "asset_type": asset_type, "side": side, "qty": qty, "price": price,
+                "tx_currency": tx_currency, "currency": pref_currency,
+                "amount": -cost if side == "BUY" else cost, "qty_delta": qty if side == "BUY" else -qty}
+
+    # --- writes ---
+    def execute_order(self, user_id: int, symbol: str, asset_type: str, side: str, qty: float, price: float,
+                      tx_currency: str, pref_currency: str, fx_rate: float=1.0) -> Dict[str, Any]:
+        """Same contract as database.execute_order, applied in memory."""
+        side = side.upper()
+        if side not in ("BUY", "SELL"):
+            raise database.OrderError(f"Unknown order side: {side}")
+        if qty <= 0 or price <= 0:
+            raise database.OrderError("Quantity and price must be positive.")
+        ts = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            try:
+                entry = self._order_entry(user_id, symbol, asset_type, side, qty, price, tx_currency,
+                                          pref_currency, fx_rate, ts)
+            except database.OrderError:
+                self.stats["rejected"] += 1
+                raise
+            self._log(entry)
+            self.stats["orders"] += 1
+            balance = self._accounts[user_id].balances[pref_currency][0]
+        return {"transaction_id": entry["tx"], "side": side, "cost": abs(entry["amount"]),
+                "currency": pref_currency, "balance": balance}
+
+    def apply_orders(self, orders: Iterable[Dict[str, Any]], batch_size: int=1000) -> Dict[str, int]:
+        """
+        Same contract as database.execute_orders_bulk. Each batch is applied under one lock
+        hold and journalled with one write; if that write fails the batch is rolled back.
+        """
+        stats = {"accepted": 0, "rejected": 0, "batches": 0}
+        batch: List[Dict[str, Any]] = []
+        for o in orders:
+            batch.append(o)
+            if len(batch) >= batch_size:
+                self._apply_batch(batch, stats)
+                batch = []
+        if batch:
+            self._apply_batch(batch, stats)
+        return stats
+
+    def _apply_batch(self, batch: List[Dict[str, Any]], stats: Dict[str, int]):
+        ts = datetime.datetime.utcnow().isoformat()
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("ledger is closed")
+            mark = (self._seq, self._next_tx_id, len(self._tx_rows), self._pending)
+            self._undo = {}
+            lines, accepted = [], 0
+            try:
+                for raw in batch:
+                    try:
+                        entry = self._order_entry(*database.normalize_order(raw), ts)
+                    except (database.OrderError, KeyError, TypeError, ValueError):
+                        stats['rejected'] += 1
+                        continue
+                    self._apply(entry)
+                    lines.append(json.dumps(entry, separators=(",", ":")) + "\n")
+                    accepted += 1
+                if lines:
+                    self._append(lines)
+            except BaseException:
+                # memory ran ahead of the journal: put every touched account back
+                for uid, acct in self._undo.items():
+                    if acct is None:
+                        self._accounts.pop(uid, None)
+                    else:
+                        self._accounts[uid] = acct
+                self._seq, self._next_tx_id, n_tx, self._pending = mark
+                del self._tx_rows[n_tx:]
+                raise
+            finally:
+                self._undo = None
+            stats['accepted'] += accepted
+            stats['batches'] += 1
+            self.stats["orders"] += accepted
+            self.stats["rejected"] += len(batch) - accepted
+
+    def update_balance(self, user_id: int, currency: str, amount_delta: float):
+        with self._lock:
+            self._log({"op": "balance", "ts": datetime.datetime.utcnow().isoformat(), "user_id": user_id,
+                       "currency": currency, "amount": amount_delta})
+
+    def upsert_holding(self, user_id: int, symbol: str, asset_type: str, quantity_delta: float, price: float):
+        with self._lock:
+            self._log({"op": "holding", "ts": datetime.datetime.utcnow().isoformat(), "user_id": user_id,
+                       "symbol": symbol, "asset_type": asset_type, "qty_delta": quantity_delta, "price": price})
+
+    def add_transaction(self, user_id: int, symbol: str, asset_type: str, side: str, quantity: float,
+                        price: float, currency: str):
+        with self._lock:
+            self._log({"op": "tx", "ts": datetime.datetime.utcnow().isoformat(), "tx": self._next_tx_id,
+                       "user_id": user_id, "symbol": symbol, "asset_type": asset_type, "side": side,
+                       "qty": quantity, "price": price, "tx_currency": currency})
+
+    # --- reads (rows shaped like the balances / holdings tables) ---
+    def get_balance(self, user_id: int, currency: str='USD') -> float:
+        with self._lock:
+            bal = self._account(user_id).balances.get(currency)
+        return bal[0] if bal else 0.0
+
+    def list_balances(self, user_id: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            acct = self._account(user_id)
+            return [{"id": v[1], "user_id": user_id, "currency": cur, "amount": v[0], "updated_at": v[2]}
+                    for cur, v in acct.balances.items()]
+
+    def get_holdings(self, user_id: int) -> List[Dict[str, Any]]:
+        with self._lock:
+            acct = self._account(user_id)
+            return [{"id": v[2], "user_id": user_id, "symbol": sym, "asset_type": at, "quantity": v[0],
+                     "avg_price": v[1], "last_updated": v[3]} for (sym, at), v in acct.holdings.items()]
+
+    def get_holding(self, user_id: int, symbol: str, asset_type: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            v = self._account(user_id).holdings.get((symbol, asset_type))
+            if v is None:
+                return None
+            return {"id": v[2], "user_id": user_id, "symbol": symbol, "asset_type": asset_type,
+                    "quantity": v[0], "avg_price": v[1], "last_updated": v[3]}
+
+    # --- persistence ---
+    def open(self) -> int:
+        """Replay journal entries the tables have not seen, checkpoint them, and start journalling."""
+        with self._lock:
+            directory = os.path.dirname(os.path.abspath(self.journal_path))
+            os.makedirs(directory, exist_ok=True)
+            self._lock_file = open(self.journal_path + ".lock", "a")
+            try:
+                fcntl.flock(self._lock_file.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except OSError:
+                self._lock_file.close()
+                self._lock_file = None
+                raise RuntimeError(f"ledger journal {self.journal_path} is in use by another process")
+            checkpoint = database.get_ledger_checkpoint()
+            self._seq = checkpoint
+            self._next_tx_id = database.get_max_transaction_id() + 1
+            replayed = 0
+            for entry in self._read_journal():
+                if entry["seq"] <= self._seq:
+                    continue  # already in the tables, or a duplicate of an applied seq
+                self._apply(entry)
+                replayed += 1
+            self.stats["replayed"] += replayed
+            self._truncate_torn_tail()
+            self._journal = self._open_journal()
+        if replayed or self._segments() or self._journal.tell():
+            self.flush(force=True)
+        return replayed
+
+    def flush(self, force: bool=False) -> int:
+        """Write everything changed since the last flush in one transaction; returns transactions written."""
+        with self._flush_lock:
+            with self._lock:
+                if not (self._dirty_users or force):
+                    return 0
+                seq = self._seq
+                balances, holdings, deleted = [], [], []
+                for user_id, cur in self._dirty_bal:
+                    v = self._accounts[user_id].balances.get(cur) if user_id in self._accounts else None
+                    if v is not None:  # None: created by a batch that was rolled back
+                        balances.append((user_id, cur, v[0], v[2]))
+                for user_id, sym, at in self._dirty_hold:
+                    if user_id not in self._accounts:
+                        continue  # only a rolled-back batch drops a dirty account
+                    v = self._accounts[user_id].holdings.get((sym, at))
+                    if v is None:
+                        deleted.append((user_id, sym, at))
+                    else:
+                        holdings.append((user_id, sym, at, v[0], v[1], v[3]))
+                txs, self._tx_rows = self._tx_rows, []
+                dirty = (self._dirty_users, self._dirty_bal, self._dirty_hold)
+                self._flushing = self._dirty_users
+                self._dirty_users, self._dirty_bal, self._dirty_hold = set(), set(), set()
+                self._pending = 0
+                self._rotate()
+            try:
+                database.write_ledger_batch(balances, holdings, deleted, txs, seq)
+            except Exception:
+                with self._lock:
+                    # values are re-read at the next flush, so only the keys need restoring
+                    self._dirty_users |= dirty[0]
+                    self._dirty_bal |= dirty[1]
+                    self._dirty_hold |= dirty[2]
+                    self._tx_rows[:0] = txs
+                    self._flushing = set()
+                self.stats["flush_errors"] += 1
+                raise
+            with self._lock:
+                self._flushing = set()
+            self._drop_segments(seq)
+            self.stats["flushes"] += 1
+            self.stats["transactions_flushed"] += len(txs)
+            return len(txs)
+
+    def start(self):
+        """Flush every flush_interval seconds (or sooner under load) on a daemon thread."""
+        if self._flusher and self._flusher.is_alive():
+            return
+        def run():
+            while not self._stop.is_set():
+                self._wake.wait(self.flush_interval)
+                self._wake.clear()
+                try:
+                    self.flush()
+                except Exception:
+                    pass  # counted in stats; the journal keeps the data until a flush succeeds
+        self._flusher = threading.Thread(target=run, name="ledger-flush", daemon=True)
+        self._flusher.start()
+
+    def close(self):
+        """Stop the flusher, flush what is left and refuse further writes."""
+        self._stop.set()
+        self._wake.set()
+        if self._flusher:
+            self._flusher.join()
+        self.flush()
+        with self._lock:
+            self._closed = True
+            if self._journal:
+                self._journal.close()
+            if self._lock_file:
+                self._lock_file.close()  # releases the flock
+                self._lock_file = None
+
+# --- process-wide switch ---
+_active: Optional[Ledger] = None
+
+def enable(journal_path: str, flush_interval: float=1.0, fsync: bool=False, **kwargs) -> Ledger:
+    """Recover, start and attach the process ledger (idempotent)."""
+    global _active
+    if _active is None:
+        ledger = Ledger(journal_path, flush_interval, fsync=fsync, **kwargs)
+        ledger.open()
+        ledger.start()
+        database.set_ledger(ledger)
+        _active = ledger
+        atexit.register(disable)
+    return _active
+
+def enable_from_env() -> Optional[Ledger]:
+    """enable() when CROSSP_LEDGER_JOURNAL is set; otherwise the tables are written directly."""
+    path = os.environ.get("CROSSP_LEDGER_JOURNAL")
+    if not path:
+        return None
+    return enable(path, float(os.environ.get("CROSSP_LEDGER_FLUSH_INTERVAL", "1.0")),
+                  os.environ.get("CROSSP_LEDGER_FSYNC", "0") == "1")
+
+def disable():
+    """Final flush, then detach so the tables are written directly again."""
+    global _active
+    if _active is None:
+        return
+    _active.close()
+    database.set_ledger(None)
+    _active = None
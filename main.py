@@ -4,16 +4,20 @@ main.py (updated)
 Entry point that starts Streamlit UI and optionally starts the realtime websocket server in the background.
 Also integrates 2FA and email verification flows.
 """
+import contextlib
+
 import streamlit as st
 from pages import dashboard, portfolio, trade, watchlist, news
 
 # FastAPI imports
-from fastapi import FastAPI, WebSocket, Query
+from fastapi import FastAPI, WebSocket, Query, HTTPException
 from fastapi.middleware.cors import CORSMiddleware
-import json
-import asyncio
-
-from api_integrations import get_current_prices, search_symbol, get_market_news
+from fastapi.responses import StreamingResponse
+from api_integrations import (search_symbol, yahoo_symbol_search, symbol_index, get_market_news, news_cache,
+                              watched_news_keywords, quote_cache)
+from realtime import serve_client, lifespan as realtime_lifespan
+from database import iter_transactions, get_holdings, list_balances
+from utils import confirm_email_token, stream_portfolio_export
 
 # ---------------------------
 # Streamlit UI
@@ -38,7 +42,19 @@ elif page == "News":
 # ---------------------------
 # FastAPI backend
 # ---------------------------
-app = FastAPI(title="Cross-P API")
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Background work for the API process: symbol refresh, news prefetch and the price poller."""
+    symbol_index.start_background_refresh()
+    news_cache.start_prefetch(watched_news_keywords)
+    try:
+        async with realtime_lifespan(app):
+            yield
+    finally:
+        symbol_index.stop()
+        news_cache.stop()
+
+app = FastAPI(title="Cross-P API", lifespan=lifespan)
 
 # CORS middleware for Streamlit frontend
 app.add_middleware(
@@ -49,28 +65,49 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Blocking upstream calls: plain `def` endpoints run in FastAPI's threadpool, off the event loop
 @app.get("/search")
-async def search(symbol: str):
+def search(symbol: str):
     """Search for symbol info."""
     return search_symbol(symbol)
 
+@app.get("/symbols")
+def symbols(q: str, limit: int = Query(10, ge=1, le=50)):
+    """Prefix/fuzzy symbol suggestions from the local index (no upstream calls)."""
+    return yahoo_symbol_search(q, limit)
+
 @app.get("/news")
-async def news(keyword: str = Query(None)):
-    """Fetch market news."""
-    return get_market_news(keyword)
+def news(keyword: str = Query(None), page: int = Query(1, ge=1), page_size: int = Query(10, ge=1, le=100)):
+    """Market news from the shared cache, newest first."""
+    return get_market_news(keyword, page, page_size)
 
-@app.websocket("/ws/prices")
-async def websocket_prices(websocket: WebSocket):
-    """Stream live prices for a list of symbols."""
-    await websocket.accept()
+@app.get("/stats/quotes")
+async def quote_stats():
+    """Quote cache hit/miss/latency counters."""
+    return quote_cache.snapshot()
+
+@app.get("/export")
+def export_portfolio(token: str, fmt: str = Query("csv")):
+    """
+    Stream a portfolio export. `token` is a signed, short-lived token from
+    utils.generate_email_token(user_id, salt='portfolio-export').
+    """
+    user_id = confirm_email_token(token, max_age=300, salt='portfolio-export')
+    if not user_id:
+        raise HTTPException(status_code=401, detail="Invalid or expired export token")
     try:
-        data = await websocket.receive_text()
-        payload = json.loads(data)
-        symbols = payload.get("symbols", [])
+        filename, media_type, chunks = stream_portfolio_export(
+            iter_transactions(user_id), get_holdings(user_id), list_balances(user_id), fmt)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return StreamingResponse(chunks, media_type=media_type,
+                             headers={"Content-Disposition": f'attachment; filename="{filename}"'})
 
-        while True:
-            prices = get_current_prices(symbols)
-            await websocket.send_text(json.dumps(prices))
-            await asyncio.sleep(5)  # every 5 seconds
-    except Exception:
-        await websocket.close()
+@app.websocket("/ws/prices")
+async def websocket_prices(websocket: WebSocket):
+    """
+    Stream live prices for subscribed symbols. Send {"action": "subscribe", "symbols": [...]}
+    (or "unsubscribe"); updates arrive as {"type": "prices", "data": {symbol: price}} and only
+    carry symbols whose price changed. All clients share realtime.manager's single poller.
+    """
+    await serve_client(websocket)
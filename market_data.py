@@ -0,0 +1,110 @@
+"""
+market_data.py
+
+Async market-data service for the FastAPI/websocket side. Upstream lookups are blocking
+(yfinance/ccxt), so they run on a bounded worker pool with per-source concurrency limits
+and timeouts; all symbols are fetched concurrently and the event loop is never blocked.
+A fetch that times out still holds its source's slot until its worker thread returns, so
+a hung upstream cannot pile up more calls than source_limits allows.
+"""
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+PriceFetcher = Callable[[List[str]], Dict[str, Optional[float]]]
+
+def _default_classifier(sym: str) -> str:
+    from api_integrations import is_ccxt_symbol
+    return "ccxt" if is_ccxt_symbol(sym) else "yfinance"
+
+class AsyncMarketData:
+    def __init__(self, fetcher: Optional[PriceFetcher]=None, classifier: Optional[Callable[[str], str]]=None,
+                 max_workers: int=16, source_limits: Optional[Dict[str, int]]=None,
+                 batch_sizes: Optional[Dict[str, int]]=None, timeout: float=10.0):
+        self._fetcher = fetcher
+        self._classifier = classifier or _default_classifier
+        self.max_workers = max_workers
+        self.source_limits = source_limits or {"ccxt": 4, "yfinance": 4}
+        self.batch_sizes = batch_sizes or {"ccxt": 100, "yfinance": 50}
+        self.timeout = timeout
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._loop = None
+        self.stats = {"requests": 0, "timeouts": 0, "errors": 0, "fetch_seconds": 0.0}
+
+    @property
+    def fetcher(self) -> PriceFetcher:
+        if self._fetcher is None:
+            from api_integrations import get_current_prices
+            self._fetcher = get_current_prices
+        return self._fetcher
+
+    def _semaphore(self, source: str) -> asyncio.Semaphore:
+        loop = asyncio.get_running_loop()
+        if loop is not self._loop:
+            # semaphores are bound to the loop that first awaits them
+            self._semaphores = {}
+            self._loop = loop
+        if source not in self._semaphores:
+            self._semaphores[source] = asyncio.Semaphore(self.source_limits.get(source, 2))
+        return self._semaphores[source]
+
+    def _pool(self) -> ThreadPoolExecutor:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="market-data")
+        return self._executor
+
+    async def _fetch_batch(self, source: str, symbols: List[str]) -> Dict[str, Optional[float]]:
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + self.timeout
+        semaphore = self._semaphore(source)
+        t0 = time.perf_counter()
+        try:
+            await asyncio.wait_for(semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1  # every slot is still held by a running (maybe hung) fetch
+            return {s: None for s in symbols}
+        self.stats["requests"] += 1
+        try:
+            future = loop.run_in_executor(self._pool(), self.fetcher, symbols)
+        except BaseException:
+            semaphore.release()
+            raise
+        # a timed-out fetch keeps its worker thread busy, so it keeps its slot until it really ends
+        future.add_done_callback(lambda f: (semaphore.release(), f.cancelled() or f.exception()))
+        try:
+            return await asyncio.wait_for(asyncio.shield(future), max(0.0, deadline - loop.time()))
+        except asyncio.TimeoutError:
+            self.stats["timeouts"] += 1
+        except Exception:
+            self.stats["errors"] += 1
+        finally:
+            self.stats["fetch_seconds"] += time.perf_counter() - t0
+        return {s: None for s in symbols}
+
+    async def get_prices(self, symbols: List[str]) -> Dict[str, Optional[float]]:
+        """Fetch all symbols concurrently, batched per source; failed/timed-out symbols map to None."""
+        symbols = list(dict.fromkeys(symbols))
+        by_source: Dict[str, List[str]] = {}
+        for s in symbols:
+            by_source.setdefault(self._classifier(s), []).append(s)
+        jobs = []
+        for source, syms in by_source.items():
+            size = self.batch_sizes.get(source, 50)
+            jobs.extend(self._fetch_batch(source, syms[i:i + size]) for i in range(0, len(syms), size))
+        prices: Dict[str, Optional[float]] = {}
+        for part in await asyncio.gather(*jobs):
+            prices.update(part)
+        return {s: prices.get(s) for s in symbols}
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+
+market_data = AsyncMarketData(
+    max_workers=int(os.getenv("CROSSP_MARKET_DATA_WORKERS", "16")),
+    timeout=float(os.getenv("CROSSP_MARKET_DATA_TIMEOUT", "10")),
+)
@@ -0,0 +1,199 @@
+"""
+news_cache.py
+
+Cached NewsAPI client behind /news. Results are kept per normalized keyword for `ttl`
+seconds (least recently read keywords evicted first) and paginated locally, articles are stored once per (normalized) URL however
+many queries return them, concurrent misses for the same keyword share one upstream
+call, and every upstream call must pass a central quota check first. When the quota is
+spent or the upstream fails, the last (possibly expired) result is served instead.
+A background thread keeps popular and watchlisted keywords warm.
+"""
+import threading
+import time
+from collections import Counter, OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+import requests
+
+DEFAULT_QUERY = "stocks OR crypto OR finance"
+
+def normalize_query(keyword: Optional[str]) -> str:
+    """The query sent upstream: whitespace collapsed, case kept (NewsAPI's AND/OR/NOT are uppercase)."""
+    return " ".join((keyword or "").split()) or DEFAULT_QUERY
+
+def normalize_keyword(keyword: Optional[str]) -> str:
+    """Case/whitespace-insensitive cache key; empty means the default market query."""
+    return normalize_query(keyword).casefold()
+
+def normalize_url(url: str) -> str:
+    """Drop fragments and utm_* tracking parameters so syndicated copies collapse."""
+    parts = urlsplit(url.strip())
+    query = urlencode([(k, v) for k, v in parse_qsl(parts.query) if not k.lower().startswith("utm_")])
+    return urlunsplit((parts.scheme.lower(), parts.netloc.lower(), parts.path.rstrip("/") or "/", query, ""))
+
+class NewsCache:
+    def __init__(self, api_key: str, base_url: str="https://newsapi.org/v2/everything", ttl: float=300.0,
+                 upstream_page_size: int=100, timeout: float=5.0, max_keywords: int=500,
+                 quota_check: Optional[Callable[[], bool]]=None, session: Optional[requests.Session]=None,
+                 max_popular: int=1000):
+        self.api_key = api_key
+        self.base_url = base_url
+        self.ttl = ttl
+        self.upstream_page_size = upstream_page_size
+        self.timeout = timeout
+        self.max_keywords = max_keywords
+        self.max_popular = max_popular
+        self.quota_check = quota_check or (lambda: True)
+        self.session = session or requests.Session()
+        self._entries: "OrderedDict[str, tuple]" = OrderedDict()  # key -> (fetched_at, [url, ...])
+        self._articles: Dict[str, Dict] = {}                      # normalized url -> article
+        self._refs: Counter = Counter()                           # normalized url -> entries using it
+        self._key_locks: Dict[str, list] = {}  # key -> [lock, callers using it]; only while refreshing
+        self._lock = threading.Lock()
+        self.popularity: Counter = Counter()
+        self._queries: Dict[str, str] = {}  # popular key -> query as last typed, for prefetching
+        self._prefetcher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"hits": 0, "misses": 0, "upstream_calls": 0, "upstream_errors": 0,
+                      "quota_rejections": 0, "stale_served": 0, "duplicates_dropped": 0}
+
+    # --- upstream ---
+    def _fetch(self, query: str) -> Optional[List[Dict]]:
+        """One upstream call; None on quota exhaustion or failure."""
+        if not self.quota_check():
+            self.stats["quota_rejections"] += 1
+            return None
+        self.stats["upstream_calls"] += 1
+        params = {"apiKey": self.api_key, "language": "en", "pageSize": self.upstream_page_size,
+                  "sortBy": "publishedAt", "q": query}
+        try:
+            resp = self.session.get(self.base_url, params=params, timeout=self.timeout)
+            if resp.status_code != 200:
+                self.stats["upstream_errors"] += 1
+                return None
+            raw = resp.json().get("articles", [])
+        except Exception:
+            self.stats["upstream_errors"] += 1
+            return None
+        return [{"title": a.get("title"), "summary": a.get("description"), "url": a["url"],
+                 "publishedAt": a.get("publishedAt"), "source": (a.get("source") or {}).get("name")}
+                for a in raw if a.get("url")]
+
+    def _store(self, key: str, articles: List[Dict]):
+        urls, seen = [], set()
+        with self._lock:
+            for a in articles:
+                nurl = normalize_url(a["url"])
+                if nurl in seen:
+                    self.stats["duplicates_dropped"] += 1
+                    continue
+                seen.add(nurl)
+                self._articles[nurl] = a  # newest copy wins; every query shares it
+                urls.append(nurl)
+            urls.sort(key=lambda u: self._articles[u].get("publishedAt") or "", reverse=True)
+            self._refs.update(urls)  # before releasing the old entry, which may share urls
+            self._release(key)
+            self._entries[key] = (time.monotonic(), urls)
+            while len(self._entries) > self.max_keywords:
+                oldest = next(iter(self._entries))
+                self._release(oldest)
+
+    def _release(self, key: str):
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for u in entry[1]:
+            self._refs[u] -= 1
+            if self._refs[u] <= 0:
+                del self._refs[u]
+                self._articles.pop(u, None)
+
+    def _fresh(self, key: str) -> bool:
+        entry = self._entries.get(key)
+        return entry is not None and time.monotonic() - entry[0] < self.ttl
+
+    def refresh(self, keyword: Optional[str]) -> bool:
+        """Fetch `keyword` now unless another caller just did; False if nothing new was stored."""
+        key = normalize_keyword(keyword)
+        with self._lock:
+            slot = self._key_locks.setdefault(key, [threading.Lock(), 0])
+            slot[1] += 1
+        try:
+            with slot[0]:
+                if self._fresh(key):
+                    return True  # filled by a concurrent caller while we waited
+                articles = self._fetch(normalize_query(keyword))
+                if articles is None:
+                    return False
+                self._store(key, articles)
+                return True
+        finally:
+            with self._lock:
+                slot[1] -= 1
+                if not slot[1]:
+                    del self._key_locks[key]
+
+    def _count_popular(self, key: str, query: str):
+        """Bump `key`; past 2 * max_popular keys only the top max_popular are kept."""
+        with self._lock:
+            self.popularity[key] += 1
+            self._queries[key] = query
+            if len(self.popularity) > 2 * self.max_popular:
+                self.popularity = Counter(dict(self.popularity.most_common(self.max_popular)))
+                self._queries = {k: self._queries[k] for k in self.popularity}
+
+    # --- reads ---
+    def get(self, keyword: Optional[str]=None, page: int=1, page_size: int=10) -> Dict:
+        """One page of articles for `keyword`, newest first."""
+        key = normalize_keyword(keyword)
+        self._count_popular(key, normalize_query(keyword))
+        if self._fresh(key):
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            if not self.refresh(keyword) and key in self._entries:
+                self.stats["stale_served"] += 1
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry:
+                self._entries.move_to_end(key)  # eviction drops the least recently read keyword
+            urls = entry[1] if entry else []
+            start = (max(page, 1) - 1) * page_size
+            articles = [self._articles[u] for u in urls[start:start + page_size] if u in self._articles]
+        return {"articles": articles, "page": max(page, 1), "page_size": page_size, "total": len(urls)}
+
+    # --- prefetch ---
+    def prefetch(self, keywords: Iterable[str], max_calls: int=10) -> int:
+        """Refresh up to max_calls of `keywords` that are missing or expired."""
+        done = 0
+        queries: Dict[str, str] = {}
+        for k in keywords:
+            queries.setdefault(normalize_keyword(k), k)
+        for key, kw in queries.items():
+            if done >= max_calls:
+                break
+            if not self._fresh(key):
+                if not self.refresh(kw):
+                    break  # quota spent or upstream down: try again next cycle
+                done += 1
+        return done
+
+    def start_prefetch(self, keywords_source: Callable[[], Iterable[str]], interval: float=None,
+                       top_popular: int=10, max_calls: int=10):
+        """Every `interval` seconds (default: ttl) refresh popular keywords plus keywords_source()."""
+        if self._prefetcher and self._prefetcher.is_alive():
+            return
+        interval = interval or self.ttl
+        def run():
+            while not self._stop.wait(interval):
+                try:
+                    popular = [self._queries.get(k, k) for k, _ in self.popularity.most_common(top_popular)]
+                    self.prefetch(popular + list(keywords_source()), max_calls)
+                except Exception:
+                    pass
+        self._prefetcher = threading.Thread(target=run, name="news-prefetch", daemon=True)
+        self._prefetcher.start()
+
+    def stop(self):
+        self._stop.set()
@@ -6,14 +6,16 @@ to receive live messages from the FastAPI realtime server at ws://127.0.0.1:8000
 """
 
 import streamlit as st
-from api_integrations import fetch_yfinance_ticker_snapshot, fetch_ccxt_ticker, fetch_news, fetch_yfinance_history, fetch_ccxt_ohlcv, get_currency_rate, smart_symbol_resolve, yahoo_symbol_search
+from api_integrations import fetch_yfinance_ticker_snapshot, fetch_ccxt_ticker, fetch_news, fetch_ohlcv_history, get_currency_rate, smart_symbol_resolve, yahoo_symbol_search
+from tick_store import tick_store
+from indicators import indicator_cache
 import plotly.graph_objects as go
 import pandas as pd
 from database import list_watchlist, add_watch, remove_watch, get_user_by_id
 from utils import valid_currency_code
 import datetime
 
-def _plot_candles_from_df(df: pd.DataFrame, symbol: str, show_sma: bool=True):
+def _plot_candles_from_df(df: pd.DataFrame, symbol: str, show_sma: bool=True, interval: str='1h'):
     fig = go.Figure()
     fig.add_trace(go.Candlestick(
         x=df.index,
@@ -24,7 +26,8 @@ def _plot_candles_from_df(df: pd.DataFrame, symbol: str, show_sma: bool=True):
         name="OHLC"
     ))
     if show_sma and 'Close' in df.columns:
-        sma = df['Close'].rolling(10).mean()
+        # cached per (symbol, interval): reruns only fold in bars not seen before
+        sma = indicator_cache.compute(symbol, interval, df, 'sma', n=10)['sma']
         fig.add_trace(go.Scatter(x=df.index, y=sma, name='SMA(10)'))
     fig.update_layout(title=f"{symbol} price", xaxis_title="Time", yaxis_title="Price")
     return fig
@@ -60,12 +63,10 @@ def app(st, auth):
                 last = ticker.get('last', None)
                 st.metric(label=final_symbol, value=last)
                 st.json(ticker)
-                ohlcv = fetch_ccxt_ohlcv(final_symbol, timeframe='1h', limit=100)
-                if ohlcv:
-                    df = pd.DataFrame(ohlcv, columns=['ts','open','high','low','close','vol'])
-                    df['ts'] = pd.to_datetime(df['ts'], unit='ms')
-                    df.set_index('ts', inplace=True)
-                    fig = _plot_candles_from_df(df.rename(columns={'open':'Open','high':'High','low':'Low','close':'Close'}), final_symbol)
+                # served from the in-memory tick store where the poller feeds it; otherwise from a cached backfill
+                df = tick_store.get_bars_or_backfill(final_symbol, '1h', 100, fetch_ohlcv_history)
+                if not df.empty:
+                    fig = _plot_candles_from_df(df, final_symbol)
                     st.plotly_chart(fig, use_container_width=True)
     else:
         with st.spinner("Fetching stock/commodity/indices data..."):
@@ -74,10 +75,9 @@ def app(st, auth):
             st.metric(label=final_symbol, value=last)
             st.write("Info:")
             st.json({k: snap['info'].get(k) for k in ['shortName','longName','previousClose','currency'] if k in snap['info']})
-            hist = fetch_yfinance_history(final_symbol, period='1mo', interval='1d')
+            hist = tick_store.get_bars_or_backfill(final_symbol, '1d', 30, fetch_ohlcv_history)
             if not hist.empty:
-                hist = hist.rename(columns={'Open':'Open','High':'High','Low':'Low','Close':'Close'})
-                fig = _plot_candles_from_df(hist.tail(90), final_symbol)
+                fig = _plot_candles_from_df(hist, final_symbol, interval='1d')
                 st.plotly_chart(fig, use_container_width=True)
     # Watchlist
     if user:
@@ -6,11 +6,12 @@ st.set_page_config(page_title="Market News", page_icon="📰", layout="wide")
 st.title("📰 Latest Market News")
 
 keyword = st.text_input("Filter by keyword (optional):", "")
+page = st.number_input("Page", min_value=1, value=1, step=1)
 
+params = {"page": int(page), "page_size": 10}
 if keyword:
-    res = requests.get(f"http://localhost:8000/news?keyword={keyword}")
-else:
-    res = requests.get("http://localhost:8000/news")
+    params["keyword"] = keyword
+res = requests.get("http://localhost:8000/news", params=params, timeout=10)
 
 if res.status_code != 200:
     st.error("Failed to fetch news.")
@@ -1,11 +1,13 @@
 import streamlit as st
 import requests
-import pandas as pd
 import json
 import asyncio
 import websockets
 from utils import get_user_id_from_session, format_currency
-from database import get_portfolio_positions
+from database import get_user_by_id
+from api_integrations import fx_rates
+from portfolio_engine import PortfolioEngine
+import ledger
 
 st.set_page_config(page_title="Portfolio", page_icon="📊", layout="wide")
 
@@ -17,28 +19,36 @@ if not user_id:
     st.error("You must be logged in to view your portfolio.")
     st.stop()
 
-# Fetch portfolio from database
-positions = get_portfolio_positions(user_id)
+# Same process as the Trade page: read through its ledger when one is configured
+ledger.enable_from_env()
 
-if not positions:
+# Load holdings into the valuation engine (prices arrive over the websocket),
+# valued in the user's preferred currency via the shared FX matrix
+user = get_user_by_id(user_id)
+base_currency = user['preferred_currency'] if user else "USD"
+engine = PortfolioEngine.from_user(user_id, base_currency)
+engine.set_fx_rates(fx_rates.rates_to(base_currency, set(engine.currencies)))
+
+if not engine.symbols:
     st.info("Your portfolio is empty. Go to the Trade page to add assets.")
     st.stop()
 
-df = pd.DataFrame(positions)
-
-# Calculate total value
-df["Current Price"] = 0.0
-df["Total Value"] = 0.0
+summary = st.empty()
+table = st.empty()
 
 async def fetch_live_prices():
     uri = "ws://localhost:8000/ws/prices"
     async with websockets.connect(uri) as websocket:
-        await websocket.send(json.dumps({"symbols": df["symbol"].tolist()}))
+        await websocket.send(json.dumps({"action": "subscribe", "symbols": sorted(set(engine.symbols))}))
         while True:
             update = json.loads(await websocket.recv())
-            for symbol, price in update.items():
-                df.loc[df["symbol"] == symbol, "Current Price"] = price
-                df["Total Value"] = df["Current Price"] * df["quantity"]
-                st.dataframe(df)
+            if update.get("type") != "prices":
+                continue
+            # one vectorized apply and one redraw per message, not per symbol
+            engine.set_prices(update["data"])
+            totals = engine.totals()
+            summary.metric("Total Value", f"{totals['market_value']:,.2f} {totals['currency']}",
+                           f"{totals['unrealized_pnl']:+,.2f} unrealized")
+            table.dataframe(engine.frame())
 
 asyncio.run(fetch_live_prices())
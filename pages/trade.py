@@ -4,13 +4,16 @@ pages/trade.py (updated: simple permission check)
 
 import streamlit as st
 from api_integrations import fetch_yfinance_ticker_snapshot, fetch_ccxt_ticker, get_currency_rate
-from database import get_user_by_id, get_balance, update_balance, add_transaction, upsert_holding
+from database import get_user_by_id, execute_order, OrderError
+import ledger
 import math
 
 ASSET_TYPES = ["stock", "crypto", "forex", "commodity", "index"]
 
 def app(st, auth):
     st.title("Trade")
+    # orders are placed from this (Streamlit) process, so it owns the optional write-behind ledger
+    ledger.enable_from_env()
     if not auth.get('user_id'):
         st.info("Please sign in to trade.")
         return
@@ -47,29 +50,15 @@ def app(st, auth):
         if not price or price <= 0:
             st.error("Could not determine price.")
             return
-        cost = price * qty
         pref = user['preferred_currency']
-        if pref != tx_currency:
-            rate = get_currency_rate(tx_currency, pref)
-            cost_in_pref = cost * rate
-        else:
-            cost_in_pref = cost
-        if side == "Buy":
-            bal = get_balance(user['id'], pref)
-            if bal < cost_in_pref:
-                st.error(f"Insufficient balance: have {bal} {pref}, need {cost_in_pref:.2f} {pref}")
-                return
-            update_balance(user['id'], pref, -cost_in_pref)
-            upsert_holding(user['id'], symbol, asset_type, quantity_delta=qty, price=price)
-            add_transaction(user['id'], symbol, asset_type, "BUY", qty, price, tx_currency)
-            st.success(f"Bought {qty} {symbol} @ {price} {tx_currency} (≈ {cost_in_pref:.2f} {pref})")
-        else:
-            from database import get_holding
-            h = get_holding(user['id'], symbol, asset_type)
-            if not h or h['quantity'] < qty:
-                st.error("Not enough holdings to sell.")
-                return
-            update_balance(user['id'], pref, cost_in_pref)
-            upsert_holding(user['id'], symbol, asset_type, quantity_delta=-qty, price=price)
-            add_transaction(user['id'], symbol, asset_type, "SELL", qty, price, tx_currency)
-            st.success(f"Sold {qty} {symbol} @ {price} {tx_currency} (≈ {cost_in_pref:.2f} {pref})")
+        rate = get_currency_rate(tx_currency, pref)
+        if rate is None:
+            st.error(f"No exchange rate available for {tx_currency} → {pref}.")
+            return
+        try:
+            result = execute_order(user['id'], symbol, asset_type, side, qty, price, tx_currency, pref, rate)
+        except OrderError as e:
+            st.error(str(e))
+            return
+        verb = "Bought" if result['side'] == "BUY" else "Sold"
+        st.success(f"{verb} {qty} {symbol} @ {price} {tx_currency} (≈ {result['cost']:.2f} {pref})")
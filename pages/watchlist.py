@@ -33,10 +33,12 @@ df["Current Price"] = 0.0
 async def stream_watchlist_prices():
     uri = "ws://localhost:8000/ws/prices"
     async with websockets.connect(uri) as websocket:
-        await websocket.send(json.dumps({"symbols": df["symbol"].tolist()}))
+        await websocket.send(json.dumps({"action": "subscribe", "symbols": df["symbol"].tolist()}))
         while True:
             update = json.loads(await websocket.recv())
-            for symbol, price in update.items():
+            if update.get("type") != "prices":
+                continue
+            for symbol, price in update["data"].items():
                 df.loc[df["symbol"] == symbol, "Current Price"] = price
                 st.dataframe(df)
 
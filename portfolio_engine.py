@@ -0,0 +1,175 @@
+"""
+portfolio_engine.py
+
+Vectorized portfolio valuation. Holdings are kept in aligned NumPy arrays (one row per
+holding, looked up by symbol) so a full price update is a single scatter and the totals
+are array reductions; a single-symbol tick adjusts the running totals in O(1).
+Realized P&L is replayed from the transaction log with the same average-cost rule as
+database._apply_holding_delta.
+"""
+import threading
+from typing import Dict, Iterable, List, Mapping, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+def realized_pnl(transactions: Iterable) -> Tuple[Dict[tuple, float], Dict[str, str]]:
+    """
+    Replay transactions (oldest first) with average-cost accounting, one cost basis per
+    (symbol, asset_type) like the holdings table.
+    Returns (realized P&L per (symbol, asset_type), last seen transaction currency per symbol).
+    """
+    qty: Dict[tuple, float] = {}
+    avg: Dict[tuple, float] = {}
+    realized: Dict[tuple, float] = {}
+    currency: Dict[str, str] = {}
+    for tx in transactions:
+        key, q, p = (tx["symbol"], tx["asset_type"]), float(tx["quantity"]), float(tx["price"])
+        currency[tx["symbol"]] = tx["currency"]
+        held, cost = qty.get(key, 0.0), avg.get(key, 0.0)
+        if str(tx["side"]).upper() == "BUY":
+            avg[key] = (held * cost + q * p) / (held + q) if held + q > 0 else p
+            qty[key] = held + q
+        else:
+            q = min(q, held)
+            realized[key] = realized.get(key, 0.0) + (p - cost) * q
+            qty[key] = held - q
+            if qty[key] <= 0:
+                qty.pop(key)
+                avg.pop(key, None)
+    return realized, currency
+
+class PortfolioEngine:
+    """
+    Valuation state for one portfolio. `currencies` maps symbol -> quote currency and
+    `fx_rates` maps currency -> rate into `base_currency`; symbols without a known
+    currency are treated as already in the base currency. Unpriced holdings (NaN) are
+    left out of the totals until a price arrives.
+    """
+    def __init__(self, holdings: Iterable, base_currency: str="USD",
+                 currencies: Optional[Mapping[str, str]]=None,
+                 realized: Optional[Mapping[tuple, float]]=None,
+                 fx_rates: Optional[Mapping[str, float]]=None):
+        rows = list(holdings)
+        self.base_currency = base_currency
+        self.symbols: List[str] = [r["symbol"] for r in rows]
+        self.asset_types: List[str] = [r["asset_type"] for r in rows]
+        self.quantity = np.array([float(r["quantity"]) for r in rows], dtype=float)
+        self.avg_price = np.array([float(r["avg_price"]) for r in rows], dtype=float)
+        self.price = np.full(len(rows), np.nan)
+        self._currency_of = dict(currencies or {})
+        self.currencies: List[str] = [self._currency_of.get(s, base_currency) for s in self.symbols]
+        self._currency_arr = np.array(self.currencies, dtype=object)
+        self.fx = np.ones(len(rows))
+        self.fx_rates: Dict[str, float] = {base_currency: 1.0}
+        rows_of: Dict[str, List[int]] = {}
+        for i, s in enumerate(self.symbols):
+            rows_of.setdefault(s, []).append(i)
+        self._index: Dict[str, np.ndarray] = {s: np.array(ix) for s, ix in rows_of.items()}
+        self._realized = dict(realized or {})
+        self._lock = threading.Lock()
+        self.set_fx_rates(fx_rates or {})
+
+    @classmethod
+    def from_user(cls, user_id: int, base_currency: str="USD",
+                  fx_rates: Optional[Mapping[str, float]]=None) -> "PortfolioEngine":
+        """Load holdings and replay the user's transactions for realized P&L."""
+        from database import get_holdings, iter_transactions
+        realized, currencies = realized_pnl(iter_transactions(user_id, newest_first=False))
+        return cls(get_holdings(user_id), base_currency, currencies, realized, fx_rates)
+
+    # --- inputs ---
+    def set_fx_rates(self, rates: Mapping[str, float]):
+        """Rates from each quote currency into base_currency; missing currencies keep 1.0."""
+        with self._lock:
+            for cur, rate in rates.items():
+                if cur == self.base_currency or rate is None:
+                    continue
+                self.fx_rates[cur] = float(rate)
+                self.fx[self._currency_arr == cur] = float(rate)
+            self._recompute()
+
+    def set_prices(self, prices: Mapping[str, Optional[float]]):
+        """Apply a batch of prices in one scatter; unknown symbols and None are ignored."""
+        idx, vals = [], []
+        for sym, price in prices.items():
+            ix = self._index.get(sym)
+            if ix is None or price is None:
+                continue
+            idx.append(ix)
+            vals.append(np.full(len(ix), float(price)))
+        if not idx:
+            return
+        with self._lock:
+            self.price[np.concatenate(idx)] = np.concatenate(vals)
+            self._recompute()
+
+    def update_price(self, symbol: str, price: float) -> bool:
+        """Single-symbol tick: adjust the running totals without touching other rows."""
+        ix = self._index.get(symbol)
+        if ix is None or price is None:
+            return False
+        with self._lock:
+            old = self.price[ix]
+            old_value = np.where(np.isnan(old), 0.0, self.quantity[ix] * old * self.fx[ix])
+            newly = np.isnan(old)
+            self.price[ix] = float(price)
+            new_value = self.quantity[ix] * float(price) * self.fx[ix]
+            self._total_value += float(new_value.sum() - old_value.sum())
+            self._priced_cost += float((self.quantity[ix] * self.avg_price[ix] * self.fx[ix])[newly].sum())
+        return True
+
+    def _recompute(self):
+        priced = ~np.isnan(self.price)
+        self._total_value = float(np.sum(self.quantity[priced] * self.price[priced] * self.fx[priced]))
+        self._priced_cost = float(np.sum((self.quantity * self.avg_price * self.fx)[priced]))
+
+    # --- outputs (quote currency per row unless noted) ---
+    @property
+    def market_value(self) -> np.ndarray:
+        return self.quantity * self.price
+
+    @property
+    def cost_basis(self) -> np.ndarray:
+        return self.quantity * self.avg_price
+
+    @property
+    def unrealized_pnl(self) -> np.ndarray:
+        return self.market_value - self.cost_basis
+
+    @property
+    def weights(self) -> np.ndarray:
+        """Share of the priced portfolio value (base currency) held in each row."""
+        total = self._total_value
+        if not total:
+            return np.zeros(len(self.symbols))
+        return np.nan_to_num(self.market_value * self.fx / total)
+
+    def totals(self) -> Dict[str, float]:
+        """Portfolio totals converted into base_currency."""
+        realized = sum(pnl * self.fx_rates.get(self._currency_of.get(s, self.base_currency), 1.0)
+                       for (s, _), pnl in self._realized.items())
+        return {
+            "currency": self.base_currency,
+            "market_value": self._total_value,
+            "cost_basis": float(np.sum(self.cost_basis * self.fx)),
+            "unrealized_pnl": self._total_value - self._priced_cost,
+            "realized_pnl": float(realized),
+            "priced": int(np.count_nonzero(~np.isnan(self.price))),
+            "positions": len(self.symbols),
+        }
+
+    def frame(self) -> pd.DataFrame:
+        """One row per holding, ready for st.dataframe."""
+        return pd.DataFrame({
+            "symbol": self.symbols,
+            "asset_type": self.asset_types,
+            "currency": self.currencies,
+            "quantity": self.quantity,
+            "avg_price": self.avg_price,
+            "Current Price": self.price,
+            "Total Value": self.market_value,
+            "Unrealized P&L": self.unrealized_pnl,
+            "Realized P&L": [self._realized.get(key, 0.0) for key in zip(self.symbols, self.asset_types)],
+            "Weight": self.weights,
+        })
@@ -0,0 +1,139 @@
+"""
+quote_cache.py
+
+Shared TTL quote cache in front of the upstream price lookups (yfinance / ccxt).
+An in-process LRU is consulted first, then an optional Redis backend shared between
+processes; concurrent misses for the same symbol are coalesced into one upstream fetch.
+A quote taken from Redis keeps only the TTL it has left there, so it is never served
+older than `ttl` whichever cache it came through.
+"""
+import json
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Fetcher = Callable[[List[str]], Dict[str, Optional[float]]]
+
+class QuoteCache:
+    def __init__(self, ttl: float=5.0, max_entries: int=10000, redis_client=None,
+                 redis_prefix: str="quote:", wait_timeout: float=30.0):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.redis = redis_client
+        self.redis_prefix = redis_prefix
+        self.wait_timeout = wait_timeout
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()  # symbol -> (expires_at, price)
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "coalesced": 0, "redis_hits": 0,
+                      "fetches": 0, "fetched_symbols": 0, "fetch_seconds": 0.0}
+
+    def get_many(self, symbols: Iterable[str], fetcher: Fetcher) -> Dict[str, Optional[float]]:
+        """Return prices for `symbols`, calling fetcher(missing_symbols) at most once per miss."""
+        symbols = list(dict.fromkeys(symbols))
+        result: Dict[str, Optional[float]] = {}
+        owned: List[str] = []
+        waiting: Dict[str, Future] = {}
+        now = time.monotonic()
+        with self._lock:
+            for s in symbols:
+                entry = self._data.get(s)
+                if entry and entry[0] > now:
+                    self._data.move_to_end(s)
+                    result[s] = entry[1]
+                    self.stats["hits"] += 1
+                elif s in self._inflight:
+                    waiting[s] = self._inflight[s]
+                    self.stats["coalesced"] += 1
+                else:
+                    self._inflight[s] = Future()
+                    owned.append(s)
+                    self.stats["misses"] += 1
+        if owned:
+            try:
+                fetched, expiry = self._load(owned, fetcher)
+            except BaseException as e:
+                with self._lock:
+                    for s in owned:
+                        self._inflight.pop(s).set_exception(e)
+                raise
+            with self._lock:
+                expires = time.monotonic() + self.ttl
+                for s in owned:
+                    price = fetched.get(s)
+                    self._data[s] = (expiry.get(s, expires), price)
+                    self._data.move_to_end(s)
+                    self._inflight.pop(s).set_result(price)
+                    result[s] = price
+                while len(self._data) > self.max_entries:
+                    self._data.popitem(last=False)
+        for s, fut in waiting.items():
+            result[s] = fut.result(timeout=self.wait_timeout)
+        return {s: result.get(s) for s in symbols}
+
+    def get(self, symbol: str, fetcher: Fetcher) -> Optional[float]:
+        return self.get_many([symbol], fetcher).get(symbol)
+
+    def invalidate(self, symbol: Optional[str]=None):
+        """Drop one symbol (or everything) from the local cache."""
+        with self._lock:
+            if symbol is None:
+                self._data.clear()
+            else:
+                self._data.pop(symbol, None)
+
+    def snapshot(self) -> Dict[str, float]:
+        """Counters plus derived hit ratio and mean upstream latency."""
+        with self._lock:
+            stats = dict(self.stats)
+            stats["entries"] = len(self._data)
+        lookups = stats["hits"] + stats["misses"] + stats["coalesced"]
+        stats["hit_ratio"] = (stats["hits"] + stats["coalesced"]) / lookups if lookups else 0.0
+        stats["avg_fetch_ms"] = 1000 * stats["fetch_seconds"] / stats["fetches"] if stats["fetches"] else 0.0
+        return stats
+
+    def _load(self, symbols: List[str], fetcher: Fetcher) -> Tuple[Dict[str, Optional[float]], Dict[str, float]]:
+        """Prices for `symbols`, plus the local expiry of those read from Redis."""
+        found: Dict[str, Optional[float]] = {}
+        expiry: Dict[str, float] = {}
+        missing = symbols
+        if self.redis is not None:
+            try:
+                pipe = self.redis.pipeline(transaction=False)
+                for s in symbols:
+                    pipe.get(self.redis_prefix + s)
+                    pipe.pttl(self.redis_prefix + s)
+                raw = pipe.execute()
+                now = time.monotonic()
+                missing, found = [], {}
+                for s, v, pttl in zip(symbols, raw[0::2], raw[1::2]):
+                    if v is None:
+                        missing.append(s)
+                    else:
+                        found[s] = json.loads(v)
+                        # -1: no expiry set on the key; a full local TTL is the most it gets
+                        expiry[s] = now + (pttl / 1000.0 if pttl >= 0 else self.ttl)
+                with self._lock:
+                    self.stats["redis_hits"] += len(found)
+            except Exception:
+                found, expiry, missing = {}, {}, symbols
+        if missing:
+            t0 = time.perf_counter()
+            fetched = fetcher(missing)
+            elapsed = time.perf_counter() - t0
+            with self._lock:
+                self.stats["fetches"] += 1
+                self.stats["fetched_symbols"] += len(missing)
+                self.stats["fetch_seconds"] += elapsed
+            found.update(fetched)
+            if self.redis is not None:
+                try:
+                    pipe = self.redis.pipeline()
+                    for s in missing:
+                        pipe.set(self.redis_prefix + s, json.dumps(fetched.get(s)), px=max(1, int(self.ttl * 1000)))
+                    pipe.execute()
+                except Exception:
+                    pass
+        return found, expiry
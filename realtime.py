@@ -9,35 +9,344 @@ so the Streamlit app can start the websocket server automatically (optional).
 """
 
 import asyncio
+import contextlib
 import json
+import logging
+import re
 from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.responses import HTMLResponse
 import uvicorn
 import threading
-from typing import List
+from typing import Deque, Dict, List, Optional, Set, Union
+from collections import deque
 import time
 
-from api_integrations import fetch_yfinance_ticker_snapshot, fetch_ccxt_ticker
+from market_data import market_data
+from tick_store import tick_store
+from wire import get_codec
+
+logger = logging.getLogger(__name__)
+
+# tickers as the data sources spell them: AAPL, BRK.B, BTC/USDT, EURUSD=X, ^GSPC, GC=F
+_SYMBOL_RE = re.compile(r"^[A-Za-z0-9.^=/:_-]+$")
+
+@contextlib.asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Run the shared price poller for as long as the app serves (main.py's app nests this)."""
+    manager.ensure_poller()
+    try:
+        yield
+    finally:
+        await manager.stop_poller()
+
+app = FastAPI(lifespan=lifespan)
+
+class ClientChannel:
+    """
+    Bounded outbound queue plus writer task for one websocket. Price updates are coalesced
+    (latest price per symbol wins) and other messages are dropped oldest-first once
+    `max_queue` is reached, so a slow client can fall behind by at most one queue's worth.
+    A client that stays saturated for `max_saturated` seconds, or times out `max_timeouts`
+    sends in a row, is disconnected.
+    """
+    def __init__(self, websocket: WebSocket, on_close, max_queue: int=100, send_timeout: float=2.0,
+                 max_saturated: float=10.0, max_timeouts: int=3, codec=None):
+        self.websocket = websocket
+        self.codec = codec or get_codec("json")
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.max_saturated = max_saturated
+        self.max_timeouts = max_timeouts
+        self.messages: Deque[str] = deque()
+        self.pending_prices: Dict[str, Optional[float]] = {}
+        self.pending_encoded: Optional[Union[str, bytes]] = None
+        self.pending_seq = 0
+        self.dropped = 0
+        self.saturated_since: Optional[float] = None
+        self.closed = False
+        self._timeouts = 0
+        self._on_close = on_close
+        self._wakeup = asyncio.Event()
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._task = asyncio.get_running_loop().create_task(self._writer())
+
+    def _mark_saturated(self):
+        self.dropped += 1
+        if self.saturated_since is None:
+            self.saturated_since = time.monotonic()
+        elif time.monotonic() - self.saturated_since > self.max_saturated:
+            self.close()
+
+    def send(self, message: Union[str, bytes]):
+        if self.closed:
+            return
+        if len(self.messages) >= self.max_queue:
+            self.messages.popleft()
+            self._mark_saturated()
+        self.messages.append(message)
+        self._kick()
+
+    def send_prices(self, prices: Dict[str, Optional[float]], encoded: Union[str, bytes], seq: int=0):
+        """Queue a price delta; `encoded` is the shared serialisation used if nothing is pending."""
+        if self.closed:
+            return
+        self.pending_seq = seq
+        if self.pending_prices:
+            self.pending_prices.update(prices)
+            self.pending_encoded = None
+            self._mark_saturated()
+        else:
+            self.pending_prices = dict(prices)
+            self.pending_encoded = encoded
+        self._kick()
+
+    def send_snapshot(self, encoded: Union[str, bytes]):
+        """Queue a full snapshot; it supersedes any pending delta."""
+        self.pending_prices, self.pending_encoded = {}, None
+        self.send(encoded)
+
+    def _kick(self):
+        self._idle.clear()
+        self._wakeup.set()
+
+    async def _send(self, data: Union[str, bytes]) -> bool:
+        # asyncio.wait rather than wait_for: wait_for can swallow a cancellation that races
+        # with the send completing, which would leave this writer running after shutdown
+        if isinstance(data, bytes):
+            send = asyncio.ensure_future(self.websocket.send_bytes(data))
+        else:
+            send = asyncio.ensure_future(self.websocket.send_text(data))
+        try:
+            done, _ = await asyncio.wait({send}, timeout=self.send_timeout)
+        finally:
+            if not send.done():
+                send.cancel()
+        if not done:
+            self._timeouts += 1
+            if self._timeouts >= self.max_timeouts:
+                self.close()
+            return not self.closed
+        if send.exception() is not None:
+            self.close()
+            return False
+        self._timeouts = 0
+        return True
+
+    async def _writer(self):
+        while not self.closed:
+            await self._wakeup.wait()
+            self._wakeup.clear()
+            while self.messages or self.pending_prices:
+                if self.messages:
+                    text = self.messages.popleft()
+                else:
+                    text = self.pending_encoded or self.codec.encode("prices", self.pending_prices, self.pending_seq)
+                    self.pending_prices, self.pending_encoded = {}, None
+                if not await self._send(text):
+                    return
+            self.saturated_since = None
+            self._idle.set()
+
+    async def drain(self):
+        """Wait until everything queued so far has been written (or the channel closed)."""
+        while not self.closed and not self._idle.is_set():
+            waiter = asyncio.ensure_future(self._idle.wait())
+            try:
+                await asyncio.wait({waiter, self._task}, return_when=asyncio.FIRST_COMPLETED)
+            finally:
+                waiter.cancel()
+
+    def close(self):
+        if self.closed:
+            return
+        self.closed = True
+        self._idle.set()
+        if self._task is not asyncio.current_task():
+            self._task.cancel()
+        self._on_close(self.websocket)
 
-app = FastAPI()
 class ConnectionManager:
-    def __init__(self):
+    """
+    Tracks websocket clients and their symbol subscriptions. The manager keeps a
+    reference-counted union of subscribed symbols so a single poller fetches each symbol
+    once per interval, then fans out only changed prices to the sockets that asked for them.
+    Every socket has its own ClientChannel, so broadcasting never waits on a slow client.
+    Each socket also picks a wire codec (see wire.py); every `snapshot_every` publishes,
+    clients get a full snapshot of their symbols instead of a delta so they can resync.
+    Subscriptions are limited to `max_symbols` per client, each at most `max_symbol_len`
+    characters of ticker punctuation (see _SYMBOL_RE).
+    """
+    def __init__(self, max_queue: int=100, send_timeout: float=2.0, max_saturated: float=10.0,
+                 snapshot_every: int=12, max_symbols: int=200, max_symbol_len: int=32):
         self.active_connections: List[WebSocket] = []
-    async def connect(self, websocket: WebSocket):
+        self.channels: Dict[WebSocket, ClientChannel] = {}
+        self.subscriptions: Dict[WebSocket, Set[str]] = {}
+        self.symbol_refcounts: Dict[str, int] = {}
+        self.last_prices: Dict[str, Optional[float]] = {}
+        self.max_queue = max_queue
+        self.send_timeout = send_timeout
+        self.max_saturated = max_saturated
+        self.snapshot_every = snapshot_every
+        self.max_symbols = max_symbols
+        self.max_symbol_len = max_symbol_len
+        self.seq = 0
+        self.autostart_poller = True
+        self._poller_task: Optional[asyncio.Task] = None
+    async def connect(self, websocket: WebSocket, protocol: Optional[str]=None):
         await websocket.accept()
         self.active_connections.append(websocket)
+        codec = get_codec(protocol)
+        self.channels[websocket] = ClientChannel(websocket, self._channel_closed, self.max_queue,
+                                                 self.send_timeout, self.max_saturated, codec=codec)
+        if codec.name != "json":
+            self.send(websocket, json.dumps({"type": "hello", "protocol": codec.name}))
+    def _channel_closed(self, websocket: WebSocket):
+        self.disconnect(websocket)
+        asyncio.ensure_future(self._close_socket(websocket))
+    async def _close_socket(self, websocket: WebSocket):
+        try:
+            await websocket.close()
+        except Exception:
+            pass
     def disconnect(self, websocket: WebSocket):
         if websocket in self.active_connections:
             self.active_connections.remove(websocket)
-    async def broadcast(self, message: str):
-        to_remove = []
-        for connection in list(self.active_connections):
+        channel = self.channels.pop(websocket, None)
+        if channel is not None:
+            channel.close()
+        self.unsubscribe(websocket, list(self.subscriptions.get(websocket, ())))
+        self.subscriptions.pop(websocket, None)
+    def subscribe(self, websocket: WebSocket, symbols: List[str]) -> List[str]:
+        subs = self.subscriptions.setdefault(websocket, set())
+        added = [s for s in dict.fromkeys(symbols) if s not in subs]
+        for s in added:
+            subs.add(s)
+            self.symbol_refcounts[s] = self.symbol_refcounts.get(s, 0) + 1
+        return added
+    def unsubscribe(self, websocket: WebSocket, symbols: List[str]):
+        subs = self.subscriptions.get(websocket, set())
+        for s in symbols:
+            if s not in subs:
+                continue
+            subs.discard(s)
+            self.symbol_refcounts[s] -= 1
+            if self.symbol_refcounts[s] <= 0:
+                del self.symbol_refcounts[s]
+                self.last_prices.pop(s, None)
+    def symbols(self) -> List[str]:
+        """Union of all subscribed symbols."""
+        return list(self.symbol_refcounts)
+    async def handle_message(self, websocket: WebSocket, data: str) -> bool:
+        """
+        Apply a client control message; returns False if it was not one.
+        {"action": "subscribe"|"unsubscribe", "symbols": [...]} (a bare {"symbols": [...]}
+        subscribes). New subscribers immediately receive the last known prices. Invalid
+        symbols, or symbols beyond the client's cap, are refused with an "error" message.
+        """
+        try:
+            msg = json.loads(data)
+        except ValueError:
+            return False
+        if not isinstance(msg, dict) or "symbols" not in msg:
+            return False
+        raw = msg.get("symbols") or []
+        if not isinstance(raw, list):
+            raw = [raw]
+        symbols = [str(s) for s in raw]
+        if msg.get("action", "subscribe") == "unsubscribe":
+            self.unsubscribe(websocket, symbols)
+        else:
+            valid = [s for s in symbols if len(s) <= self.max_symbol_len and _SYMBOL_RE.match(s)]
+            current = self.subscriptions.get(websocket, set())
+            room = max(0, self.max_symbols - len(current))
+            new = [s for s in dict.fromkeys(valid) if s not in current]
+            refused = [s for s in symbols if s not in valid] + new[room:]
+            if refused:
+                self.send(websocket, json.dumps({"type": "error", "error": "subscription refused",
+                                                 "symbols": [s[:self.max_symbol_len] for s in refused[:20]],
+                                                 "max_symbols": self.max_symbols,
+                                                 "max_symbol_len": self.max_symbol_len}))
+            added = self.subscribe(websocket, new[:room])
+            known = {s: self.last_prices[s] for s in added if s in self.last_prices}
+            channel = self.channels.get(websocket)
+            if known and channel is not None:
+                channel.send(channel.codec.encode("prices", known, self.seq))
+        return True
+    def send(self, websocket: WebSocket, message: Union[str, bytes]):
+        """Queue a message for one client without waiting for it to be written."""
+        channel = self.channels.get(websocket)
+        if channel is not None:
+            channel.send(message)
+    async def broadcast(self, message: str, json_only: bool=False):
+        for channel in list(self.channels.values()):
+            if json_only and channel.codec.name != "json":
+                continue
+            channel.send(message)
+    async def publish(self, prices: Dict[str, Optional[float]]):
+        """
+        Send each subscriber the prices that changed since the last publish, for its symbols
+        only (or, on snapshot ticks, all of its symbols). Encoding happens once per distinct
+        (codec, symbol set), so clients with the same subscriptions share one payload.
+        """
+        changed = {s: p for s, p in prices.items() if s in self.symbol_refcounts and self.last_prices.get(s, object()) != p}
+        self.last_prices.update(changed)
+        self.seq += 1
+        snapshot = self.snapshot_every > 0 and self.seq % self.snapshot_every == 0
+        if not changed and not snapshot:
+            return
+        source = self.last_prices if snapshot else changed
+        kind = "snapshot" if snapshot else "prices"
+        now = time.time()
+        encoded: Dict[tuple, Union[str, bytes]] = {}
+        for connection, subs in list(self.subscriptions.items()):
+            channel = self.channels.get(connection)
+            keys = frozenset(subs.intersection(source))
+            if channel is None or not keys:
+                continue
+            cache_key = (channel.codec.name, keys)
+            data = {s: source[s] for s in keys}
+            try:
+                if cache_key not in encoded:
+                    encoded[cache_key] = channel.codec.encode(kind, data, self.seq, now)
+                if snapshot:
+                    channel.send_snapshot(encoded[cache_key])
+                else:
+                    channel.send_prices(data, encoded[cache_key], self.seq)
+            except Exception:
+                # one client's bad subscription or broken channel must not stop the others
+                logger.exception("dropping websocket client after publish failed")
+                channel.close()
+
+    async def drain(self):
+        """Wait for every client's queue to be written out."""
+        await asyncio.gather(*(c.drain() for c in list(self.channels.values())))
+    async def poll_prices(self, interval: float=5.0):
+        """Poll the subscribed symbol union once per interval and publish changes."""
+        while True:
             try:
-                await connection.send_text(message)
+                symbols = self.symbols()
+                if symbols:
+                    prices = await market_data.get_prices(symbols)
+                    tick_store.ingest_many(prices)
+                    await self.publish(prices)
             except Exception:
-                to_remove.append(connection)
-        for c in to_remove:
-            self.disconnect(c)
+                # the poller is shared by every client: log and try again next tick
+                logger.exception("price poll failed")
+            await asyncio.sleep(interval)
+    def ensure_poller(self, interval: float=5.0):
+        """Start the shared poller on the running loop unless it is already running (or disabled)."""
+        if not self.autostart_poller:
+            return None
+        if self._poller_task is None or self._poller_task.done():
+            self._poller_task = asyncio.get_running_loop().create_task(self.poll_prices(interval))
+        return self._poller_task
+    async def stop_poller(self):
+        task, self._poller_task = self._poller_task, None
+        if task is not None and not task.done():
+            task.cancel()
+            with contextlib.suppress(asyncio.CancelledError):
+                await task
 
 manager = ConnectionManager()
 
@@ -45,41 +354,31 @@ manager = ConnectionManager()
 def root():
     return {"message": "Cross-P (Px) realtime websocket server"}
 
-@app.websocket("/ws")
-async def websocket_endpoint(websocket: WebSocket):
-    await manager.connect(websocket)
+async def serve_client(websocket: WebSocket):
+    """
+    Serve one websocket client: subscribe/unsubscribe messages update its symbol set,
+    anything else is echoed back. Shared by this app's /ws and main.py's /ws/prices.
+    The wire format is negotiated with ?protocol=json|msgpack|struct (default json).
+    """
+    protocol = websocket.query_params.get("protocol") if hasattr(websocket, "query_params") else None
+    await manager.connect(websocket, protocol)
+    manager.ensure_poller()
     try:
         while True:
-            # keep connection alive; client may send pings
+            # keep connection alive; client may send pings or subscription changes
             data = await websocket.receive_text()
-            # echo back
-            await websocket.send_text(json.dumps({"echo": data}))
+            if not await manager.handle_message(websocket, data):
+                # echo back through the client's channel, the socket's only writer
+                manager.send(websocket, json.dumps({"echo": data}))
     except WebSocketDisconnect:
         manager.disconnect(websocket)
+    except Exception:
+        manager.disconnect(websocket)
+        raise
 
-# Background broadcaster coroutine
-async def broadcaster(loop_interval: float=5.0):
-    """
-    Simple broadcaster that sends sample updates for a set of tickers.
-    In production you'd subscribe to real feeds. This is a demo: it polls yfinance/ccxt periodically.
-    """
-    tickers = ["AAPL","BTC/USDT","GC=F"]  # sample
-    while True:
-        updates = []
-        for s in tickers:
-            try:
-                if "/" in s or "USDT" in s:
-                    t = fetch_ccxt_ticker(s)
-                    last = t.get('last') if isinstance(t, dict) else None
-                else:
-                    snap = fetch_yfinance_ticker_snapshot(s)
-                    last = snap.get('last_price')
-                updates.append({"symbol": s, "last": last, "ts": int(time.time())})
-            except Exception:
-                updates.append({"symbol": s, "last": None, "ts": int(time.time())})
-        payload = json.dumps({"type":"market_updates","data": updates})
-        await manager.broadcast(payload)
-        await asyncio.sleep(loop_interval)
+@app.websocket("/ws")
+async def websocket_endpoint(websocket: WebSocket):
+    await serve_client(websocket)
 
 def run_uvicorn_in_thread(host="127.0.0.1", port: int=8000):
     """Start uvicorn server in a background thread (blocking function starts a thread)."""
@@ -89,10 +388,6 @@ def run_uvicorn_in_thread(host="127.0.0.1", port: int=8000):
     thread.start()
     return thread
 
-# convenience: if executed directly, run uvicorn
+# convenience: if executed directly, run uvicorn (the shared poller starts with the app)
 if __name__ == "__main__":
-    # run broadcaster in event loop along with uvicorn
-    import asyncio
-    threading.Thread(target=lambda: uvicorn.run("realtime:app", host="0.0.0.0", port=8000, log_level="info"), daemon=True).start()
-    loop = asyncio.get_event_loop()
-    loop.run_until_complete(broadcaster(5.0))
+    uvicorn.run("realtime:app", host="0.0.0.0", port=8000, log_level="info")
@@ -0,0 +1,247 @@
+"""
+symbol_index.py
+
+Local symbol index behind search_symbol / smart_symbol_resolve. Known symbols (ccxt
+markets, forex pairs, and equities learned from earlier lookups) are persisted and held
+in memory as a sorted key array searched with bisect, so prefix search and resolution
+never touch the network once warm. Unknown queries fall through to one upstream lookup
+and, if upstream says the symbol does not exist, are remembered in a negative cache for a
+while. The sources are only pulled by refresh(), which start_background_refresh() runs
+off the request path.
+"""
+import bisect
+import difflib
+import re
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+Record = Dict[str, Optional[str]]
+Source = Callable[[], Iterable[Record]]
+
+_SEPARATORS = re.compile(r"[^A-Z0-9]")
+# key ranks: lower sorts first among equally good matches
+_RANK_SYMBOL, _RANK_COMPACT, _RANK_NAME = 0, 1, 2
+# add() inserts up to this many records into the sorted keys; larger batches rebuild them
+_INSERT_MAX = 64
+
+def _compact(text: str) -> str:
+    return _SEPARATORS.sub("", text.upper())
+
+class SymbolIndex:
+    """
+    `lookup(symbol)` is the slow upstream resolver (returns a record or None); `sources`
+    are callables yielding records to (re)load on each refresh; `load`/`save` persist
+    records between processes. The searchable arrays are rebuilt off to the side and
+    swapped in, so readers never take a lock.
+    """
+    def __init__(self, lookup: Optional[Callable[[str], Optional[Record]]]=None,
+                 sources: Iterable[Source]=(), load: Optional[Callable[[], Iterable]]=None,
+                 save: Optional[Callable[[List[Record]], object]]=None,
+                 refresh_interval: float=6 * 3600.0, negative_ttl: float=900.0,
+                 negative_max: int=10000):
+        self.lookup = lookup
+        self.sources = list(sources)
+        self.load = load
+        self.save = save
+        self.refresh_interval = refresh_interval
+        self.negative_ttl = negative_ttl
+        self.negative_max = negative_max
+        self._records: Dict[str, Record] = {}
+        self._keys: List[Tuple[str, int, str]] = []   # (key, rank, symbol), sorted
+        self._compact: Dict[str, str] = {}            # compact form -> symbol
+        self._negative: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._loaded = False
+        self._refresher: Optional[threading.Thread] = None
+        self._stop = threading.Event()
+        self.stats = {"hits": 0, "lookups": 0, "negative_hits": 0, "refreshes": 0, "refresh_errors": 0}
+
+    # --- building ---
+    @staticmethod
+    def _keys_for(sym: str, rec: Record) -> List[Tuple[str, int, str]]:
+        up = sym.upper()
+        keys = [(up, _RANK_SYMBOL, sym)]
+        c = _compact(up)
+        if c != up:
+            keys.append((c, _RANK_COMPACT, sym))
+        for word in (rec.get("name") or "").upper().split():
+            keys.append((_compact(word) or word, _RANK_NAME, sym))
+        return keys
+
+    def _rebuild(self):
+        keys, compact = [], {}
+        for sym, rec in self._records.items():
+            keys.extend(self._keys_for(sym, rec))
+            compact.setdefault(_compact(sym.upper()), sym)
+        keys.sort()
+        self._keys, self._compact = keys, compact
+
+    def add(self, records: Iterable[Record], persist: bool=True) -> int:
+        """Merge records into the index (and the persistent store)."""
+        records = [dict(r) for r in records if r.get("symbol")]
+        if not records:
+            return 0
+        with self._lock:
+            if len(records) > _INSERT_MAX:
+                for r in records:
+                    self._records[r["symbol"]] = r
+                    self._negative.pop(r["symbol"].upper(), None)
+                self._rebuild()
+            else:
+                # a few records (a resolved lookup): insert into a copy of the sorted keys
+                keys = list(self._keys)
+                for r in records:
+                    sym = r["symbol"]
+                    old = self._records.get(sym)
+                    if old is not None:
+                        for k in self._keys_for(sym, old):
+                            i = bisect.bisect_left(keys, k)
+                            if i < len(keys) and keys[i] == k:
+                                del keys[i]
+                    for k in self._keys_for(sym, r):
+                        bisect.insort(keys, k)
+                    self._records[sym] = r
+                    self._compact.setdefault(_compact(sym.upper()), sym)
+                    self._negative.pop(sym.upper(), None)
+                self._keys = keys
+        if persist and self.save:
+            self.save(records)
+        return len(records)
+
+    def _ensure_loaded(self):
+        if self._loaded:
+            return
+        with self._lock:
+            if self._loaded:
+                return
+            if self.load:
+                try:
+                    for row in self.load():
+                        rec = dict(row)
+                        self._records[rec["symbol"]] = rec
+                except Exception:
+                    pass
+            self._rebuild()
+            self._loaded = True
+
+    def refresh(self) -> int:
+        """Pull every source once; a failing source is skipped, not fatal."""
+        added = 0
+        for source in self.sources:
+            try:
+                added += self.add(list(source()))
+            except Exception:
+                self.stats["refresh_errors"] += 1
+        self.stats["refreshes"] += 1
+        return added
+
+    def start_background_refresh(self):
+        """
+        Refresh from the sources on a daemon thread: right away if nothing was loaded from
+        the persistent store, then every refresh_interval seconds.
+        """
+        if self._refresher and self._refresher.is_alive():
+            return
+        def run():
+            self._ensure_loaded()
+            if not self._records:
+                self.refresh()
+            while not self._stop.wait(self.refresh_interval):
+                self.refresh()
+        self._refresher = threading.Thread(target=run, name="symbol-index-refresh", daemon=True)
+        self._refresher.start()
+
+    def stop(self):
+        self._stop.set()
+
+    # --- queries ---
+    def get(self, symbol: str) -> Optional[Record]:
+        self._ensure_loaded()
+        return self._records.get(symbol) or self._records.get(symbol.upper())
+
+    def search(self, query: str, limit: int=10, fuzzy: bool=True) -> List[Record]:
+        """Prefix matches on symbol, compact symbol (btcusdt) or any name word; fuzzy fallback."""
+        self._ensure_loaded()
+        q = query.strip().upper()
+        if not q:
+            return []
+        keys, records = self._keys, self._records
+        words = q.split()
+        if len(words) > 1:
+            # multi-word name query: prefix-match the first word, then require the rest
+            hits = self.search(words[0], limit * 10, fuzzy=False)
+            return [r for r in hits if all(w in (r.get("name") or "").upper() for w in words[1:])][:limit]
+        found: Dict[str, tuple] = {}
+        for prefix in dict.fromkeys((q, _compact(q))):
+            if not prefix:
+                continue
+            i = bisect.bisect_left(keys, (prefix,))
+            scanned = 0
+            while i < len(keys) and keys[i][0].startswith(prefix) and scanned < limit * 50:
+                key, rank, sym = keys[i]
+                score = (key != prefix, rank, len(sym), sym)
+                if sym not in found or score < found[sym]:
+                    found[sym] = score
+                i += 1
+                scanned += 1
+        if not found and fuzzy:
+            first = _compact(q)[:1]
+            lo = bisect.bisect_left(keys, (first,))
+            hi = bisect.bisect_left(keys, (first + "\uffff",))
+            pool = {k[0]: k[2] for k in keys[lo:hi]}
+            for key in difflib.get_close_matches(_compact(q), list(pool), n=limit, cutoff=0.75):
+                found.setdefault(pool[key], (True, _RANK_NAME, len(pool[key]), pool[key]))
+        ordered = sorted(found, key=found.get)[:limit]
+        return [records[s] for s in ordered if s in records]
+
+    def _candidates(self, q: str) -> List[str]:
+        """Spellings a user might mean: AAPL, BTC -> BTC/USDT, BTCUSDT, EURUSD -> EURUSD=X."""
+        c = _compact(q)
+        out = [q, self._compact.get(c)]
+        if "/" not in q and "-" not in q:
+            out += [f"{q}/USDT", f"{q}=X", self._compact.get(c + "X")]
+        if "-" in q:
+            out.append(q.replace("-", "/"))
+        return [s for s in dict.fromkeys(out) if s]
+
+    def _negative_hit(self, key: str) -> bool:
+        expires = self._negative.get(key)
+        if expires is None:
+            return False
+        if expires < time.monotonic():
+            self._negative.pop(key, None)
+            return False
+        return True
+
+    def resolve(self, query: str) -> Optional[Record]:
+        """Best single record for `query`; the upstream lookup runs only on a full miss."""
+        self._ensure_loaded()
+        q = query.strip().upper()
+        if not q:
+            return None
+        for sym in self._candidates(q):
+            rec = self._records.get(sym)
+            if rec:
+                self.stats["hits"] += 1
+                return rec
+        if self._negative_hit(q):
+            self.stats["negative_hits"] += 1
+            return None
+        if not self.lookup:
+            return None
+        self.stats["lookups"] += 1
+        try:
+            rec = self.lookup(q)
+        except Exception:
+            return None  # transient upstream failure: not evidence the symbol is unknown
+        if rec:
+            self.add([rec])
+            return rec
+        with self._lock:
+            self._negative[q] = time.monotonic() + self.negative_ttl
+            self._negative.move_to_end(q)
+            while len(self._negative) > self.negative_max:
+                self._negative.popitem(last=False)
+        return None
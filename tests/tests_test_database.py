@@ -15,3 +15,184 @@ def test_create_user_and_balance(tmp_path, monkeypatch):
     assert u['id'] == uid
     bal = dbmod.get_balance(uid, "USD")
     assert bal == 100000.0
+
+def test_pooled_connection_reused_and_wal(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "pool.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    with dbmod.db_cursor() as cur:
+        cur.execute("PRAGMA journal_mode")
+        assert cur.fetchone()[0] == "wal"
+        first = cur.connection
+    with dbmod.db_cursor() as cur:
+        assert cur.connection is first
+    uid = dbmod.create_user("pooluser", b"hash")
+    dbmod.update_balance(uid, "USD", -500.0)
+    assert dbmod.get_balance(uid, "USD") == 99500.0
+    dbmod.close_connections()
+
+def test_execute_order_atomic(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "orders.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("trader", b"hash")
+    res = dbmod.execute_order(uid, "AAPL", "stock", "Buy", 10, 100.0, "USD", "USD", 1.0)
+    assert res['side'] == "BUY"
+    assert dbmod.get_balance(uid, "USD") == 99000.0
+    assert dbmod.get_holding(uid, "AAPL", "stock")['quantity'] == 10
+    with pytest.raises(dbmod.OrderError):
+        dbmod.execute_order(uid, "AAPL", "stock", "SELL", 11, 100.0, "USD", "USD", 1.0)
+    with pytest.raises(dbmod.OrderError):
+        dbmod.execute_order(uid, "TSLA", "stock", "BUY", 1000, 1000.0, "USD", "USD", 1.0)
+    # rejected orders leave no trace
+    assert len(dbmod.get_transactions(uid)) == 1
+    assert dbmod.get_balance(uid, "USD") == 99000.0
+    dbmod.execute_order(uid, "AAPL", "stock", "SELL", 10, 110.0, "USD", "USD", 1.0)
+    assert dbmod.get_holding(uid, "AAPL", "stock") is None
+    assert dbmod.get_balance(uid, "USD") == 100100.0
+    dbmod.close_connections()
+
+def test_execute_orders_bulk(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "bulk.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("bulk", b"hash")
+    orders = [{"user_id": uid, "symbol": "AAPL", "asset_type": "stock", "side": "BUY", "qty": 1, "price": 100.0, "tx_currency": "USD"}
+              for _ in range(25)]
+    orders.append({"user_id": uid, "symbol": "AAPL", "asset_type": "stock", "side": "SELL", "qty": 30, "price": 100.0, "tx_currency": "USD"})
+    orders.append({"user_id": uid, "symbol": "AAPL", "asset_type": "stock", "side": "SELL", "qty": 5, "price": 120.0, "tx_currency": "USD"})
+    stats = dbmod.execute_orders_bulk(orders, batch_size=10)
+    assert stats == {"accepted": 26, "rejected": 1, "batches": 3}
+    assert dbmod.get_holding(uid, "AAPL", "stock")['quantity'] == 20
+    assert dbmod.get_balance(uid, "USD") == 100000.0 - 2500.0 + 600.0
+    assert len(dbmod.get_transactions(uid)) == 26
+    dbmod.close_connections()
+
+def test_csv_orders_with_blank_asset_type_default_to_stock(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "csv.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    from ingest_orders import read_orders
+    uid = dbmod.create_user("csv", b"hash")
+    path = tmp_path / "orders.csv"
+    path.write_text("user_id,symbol,asset_type,side,qty,price,tx_currency\n"
+                    f"{uid},AAPL,,BUY,2,100.0,USD\n{uid},AAPL,stock,BUY,1,100.0,USD\n")
+    assert dbmod.execute_orders_bulk(read_orders(str(path)))["accepted"] == 2
+    assert [(h["symbol"], h["asset_type"], h["quantity"]) for h in dbmod.get_holdings(uid)] == [("AAPL", "stock", 3.0)]
+    dbmod.close_connections()
+
+def test_transactions_keyset_pagination(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "pages.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    with dbmod.db_cursor() as cur:
+        cur.execute("PRAGMA user_version")
+        assert cur.fetchone()[0] == len(dbmod.MIGRATIONS)
+    uid = dbmod.create_user("pager", b"hash")
+    orders = [{"user_id": uid, "symbol": "AAPL" if i % 2 else "MSFT", "side": "BUY", "qty": 1, "price": 1.0}
+              for i in range(25)]
+    dbmod.execute_orders_bulk(orders, batch_size=100)  # one batch: all fills share a timestamp
+    seen, before_ts, before_id = [], None, None
+    while True:
+        page = dbmod.get_transactions_page(uid, before_ts=before_ts, before_id=before_id, limit=10)
+        if not page:
+            break
+        seen.extend(r['id'] for r in page)
+        before_ts, before_id = page[-1]['timestamp'], page[-1]['id']
+    assert seen == sorted(seen, reverse=True) and len(seen) == 25
+    assert len(dbmod.get_transactions_page(uid, limit=100, symbol="AAPL")) == 12
+    dbmod.close_connections()
+
+def test_ohlcv_cache_merge(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "ohlcv.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    assert dbmod.get_ohlcv_meta("BTC/USDT", "1h") is None
+    dbmod.upsert_ohlcv_bars("BTC/USDT", "1h", [(0, 1, 2, 0.5, 1.5, 10), (3600, 1.5, 2, 1, 1.8, 5)], 100.0, 2)
+    # the tail refetch replaces the still-forming last bar and appends a new one
+    dbmod.upsert_ohlcv_bars("BTC/USDT", "1h", [(3600, 1.5, 3, 1, 2.5, 9), (7200, 2.5, 2.6, 2.4, 2.6, 1)], 200.0, 0)
+    meta = dbmod.get_ohlcv_meta("BTC/USDT", "1h")
+    assert (meta['fetched_at'], meta['max_limit'], meta['last_ts']) == (200.0, 2, 7200)
+    bars = dbmod.get_ohlcv_bars("BTC/USDT", "1h", 2)
+    assert [(b['ts'], b['close']) for b in bars] == [(3600, 2.5), (7200, 2.6)]
+    dbmod.close_connections()
+
+def test_history_cache_remembers_empty_series(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "negative.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    import history_cache
+    calls = []
+    def fetch(symbol, interval, limit):
+        calls.append(symbol)
+        return None
+    assert history_cache.cached_history("DELISTED", "1d", 30, fetch).empty
+    assert history_cache.cached_history("DELISTED", "1d", 30, fetch).empty
+    assert calls == ["DELISTED"]
+    monkeypatch.setattr(history_cache.time, "time", lambda: 10 ** 10)  # past NEGATIVE_TTL
+    history_cache.cached_history("DELISTED", "1d", 30, fetch)
+    assert calls == ["DELISTED", "DELISTED"]
+    dbmod.close_connections()
+
+def test_user_cache_hits_and_invalidation(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "users.db"))
+    import importlib
+    import database as dbmod
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("cached", b"hash")
+    first = dbmod.get_user_by_id(uid)
+    assert dbmod.get_user_by_id(uid) is first
+    assert dbmod.get_user_by_username("cached") is first
+    assert dbmod.user_cache.stats["hits"] == 2
+    dbmod.set_preferred_currency(uid, "EUR")
+    assert dbmod.get_user_by_username("cached")["preferred_currency"] == "EUR"
+    dbmod.set_email_verification(uid)
+    dbmod.set_user_role(uid, "admin")
+    fresh = dbmod.get_user_by_id(uid)
+    assert (fresh["is_verified"], fresh["role"]) == (1, "admin")
+    # a row read before an invalidation is not cached afterwards
+    generation = dbmod.user_cache.generation
+    dbmod.user_cache.invalidate(uid)
+    dbmod.user_cache.put(first, generation)
+    assert dbmod.get_user_by_id(uid)["role"] == "admin"
+
+def test_pool_closes_connections_of_finished_threads(tmp_path, monkeypatch):
+    import gc
+    import importlib
+    import threading
+    import database as dbmod
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "threads.db"))
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("threaded", b"hash")
+    before = dbmod._pool.open_count()
+    def rerun():
+        assert dbmod.get_balance(uid, "USD") == 100000.0
+    for _ in range(50):
+        t = threading.Thread(target=rerun)
+        t.start()
+        t.join()
+    gc.collect()
+    assert dbmod._pool.open_count() == before
+    dbmod.close_connections()
+
+def test_nested_writing_cursor_is_refused(tmp_path, monkeypatch):
+    import importlib
+    import database as dbmod
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "nested.db"))
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("nested", b"hash")
+    with pytest.raises(RuntimeError):
+        with dbmod.db_cursor(immediate=True) as cur:
+            cur.execute("UPDATE balances SET amount = 1 WHERE user_id = ?", (uid,))
+            with dbmod.db_cursor(immediate=True):
+                pass
+    # the outer block rolled back as a whole; nothing was committed behind its back
+    assert dbmod.get_balance(uid, "USD") == 100000.0
+    dbmod.close_connections()
@@ -0,0 +1,43 @@
+import json
+import numpy as np
+import pytest
+from fx_rates import FxRateService
+
+def test_fixture_matrix_cross_rates(tmp_path):
+    path = tmp_path / "fx.json"
+    path.write_text(json.dumps({"base": "USD", "rates": {"EUR": 0.8, "GBP": 0.5}, "crypto_usd": {"BTC": 50000}}))
+    fx = FxRateService(fixture_path=str(path), pegs={"USDT": "USD"})
+    assert fx.rate("EUR", "GBP") == pytest.approx(0.625)
+    assert fx.rate("BTC", "EUR") == pytest.approx(40000)
+    assert fx.rate("USDT", "USD") == 1.0
+    assert fx.rate("XXX", "USD") is None
+    out = fx.convert_many([10, 10, 1, 5], ["EUR", "GBP", "BTC", "XXX"], "USD")
+    assert np.allclose(out[:3], [12.5, 20.0, 50000.0]) and np.isnan(out[3])
+
+def test_table_fetched_once_per_ttl_and_kept_on_error():
+    calls = []
+    def fiat(base):
+        calls.append(base)
+        if len(calls) > 1:
+            raise RuntimeError("upstream down")
+        return {"EUR": 0.5}
+    fx = FxRateService(ttl=3600, fiat_fetcher=fiat)
+    for _ in range(100):
+        assert fx.convert(10, "EUR", "USD") == pytest.approx(20.0)
+    assert calls == ["USD"]
+    fx._expires_at = 0  # force expiry: a failed refresh keeps serving the old table
+    assert fx.rate("EUR", "USD") == pytest.approx(2.0)
+    assert fx.stats["refresh_errors"] == 1
+
+def test_currency_missing_from_a_refresh_keeps_its_last_rate():
+    fetches = iter([({"EUR": 0.5, "USD": 1.0}, {"BTC": 50000}), ({"EUR": 0.8}, {"BTC": None})])
+    current = {}
+    def fiat(base):
+        current["fiat"], current["crypto"] = next(fetches)
+        return current["fiat"]
+    fx = FxRateService(ttl=3600, fiat_fetcher=fiat, crypto_fetcher=lambda codes: current["crypto"],
+                       crypto_codes=["BTC"])
+    assert fx.rate("BTC", "USD") == pytest.approx(50000)
+    assert fx.refresh()
+    assert fx.rate("EUR", "USD") == pytest.approx(1.25)
+    assert fx.rate("BTC", "USD") == pytest.approx(50000)
@@ -0,0 +1,55 @@
+import numpy as np
+import pandas as pd
+import indicators as ind
+
+def _frame(n=120, seed=0):
+    rng = np.random.default_rng(seed)
+    close = 100 + np.cumsum(rng.normal(size=n))
+    return pd.DataFrame({"Open": close, "High": close + rng.random(n), "Low": close - rng.random(n),
+                         "Close": close, "Volume": rng.random(n) * 100},
+                        index=pd.date_range("2024-01-01", periods=n, freq="h"))
+
+def test_kernels_match_pandas():
+    close = _frame()["Close"]
+    assert np.allclose(ind.sma(close.values, 10), close.rolling(10).mean(), equal_nan=True)
+    assert np.allclose(ind.ema(close.values, 20), close.ewm(span=20, adjust=False).mean())
+    # many symbols at once
+    matrix = np.column_stack([close.values, close.values * 2])
+    assert ind.rsi(matrix, 14).shape == matrix.shape
+
+def test_cache_is_incremental_and_matches_kernels():
+    df = _frame()
+    cache = ind.IndicatorCache()
+    cache.compute("AAPL", "1h", df.iloc[:100], "rsi", n=14)
+    out = cache.compute("AAPL", "1h", df, "rsi", n=14)
+    assert cache.stats == {"rebuilds": 1, "incremental": 1}
+    assert np.allclose(out["rsi"], ind.rsi(df["Close"].values, 14), equal_nan=True)
+    # a forming last bar can change without disturbing committed state
+    moved = df.copy()
+    moved.iloc[-1, moved.columns.get_loc("Close")] += 5
+    out = cache.compute("AAPL", "1h", moved, "rsi", n=14)
+    assert np.allclose(out["rsi"], ind.rsi(moved["Close"].values, 14), equal_nan=True)
+
+def test_missing_bars_do_not_poison_later_values():
+    df = _frame(60, seed=3)
+    gappy = df.copy()
+    gappy.iloc[[5, 30, 31], :] = np.nan
+    close = gappy["Close"]
+    assert np.allclose(ind.sma(close.values, 10), close.rolling(10).mean(), equal_nan=True)
+    assert np.allclose(ind.ema(close.values, 20), close.ewm(span=20, adjust=False, ignore_na=True).mean(),
+                       equal_nan=True)
+    mid, _, _ = ind.bollinger(close.values, 10)
+    assert np.allclose(mid, close.rolling(10).mean(), equal_nan=True)
+    # one symbol with a gap, one without: the gap stays in its own column
+    matrix = np.column_stack([close.values, df["Close"].values])
+    assert np.allclose(ind.sma(matrix, 10)[:, 1], df["Close"].rolling(10).mean(), equal_nan=True)
+    for name in ("sma", "ema", "rsi", "macd", "bollinger", "vwap", "atr"):
+        out = ind.IndicatorCache().compute("GAP", "1h", gappy, name)
+        assert not out.iloc[-5:].isna().any().any(), name
+    kernels = {"sma": ind.sma(close.values, 10), "ema": ind.ema(close.values, 20), "rsi": ind.rsi(close.values, 14),
+               "atr": ind.atr(gappy["High"].values, gappy["Low"].values, close.values, 14),
+               "vwap": ind.vwap(gappy["High"].values, gappy["Low"].values, close.values,
+                                gappy["Volume"].fillna(0).values)}
+    for name, expected in kernels.items():
+        out = ind.IndicatorCache().compute("GAP", "1h", gappy, name)
+        assert np.allclose(out.iloc[:, 0], expected, equal_nan=True), name
@@ -0,0 +1,221 @@
+import importlib
+import os
+import pytest
+
+def _setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "ledger.db"))
+    import database as dbmod
+    importlib.reload(dbmod)
+    import ledger
+    return dbmod, ledger, str(tmp_path / "ledger.journal")
+
+def _rows(dbmod, sql, *params):
+    with dbmod.db_cursor() as cur:
+        cur.execute(sql, params)
+        return [tuple(r) for r in cur.fetchall()]
+
+def test_orders_apply_in_memory_and_flush_in_one_batch(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("hft", b"hash")
+    led = ledger.Ledger(journal)
+    assert led.open() == 0
+    res = led.execute_order(uid, "AAPL", "stock", "buy", 10, 100.0, "USD", "USD")
+    led.execute_order(uid, "AAPL", "stock", "BUY", 10, 120.0, "USD", "USD")
+    led.execute_order(uid, "AAPL", "stock", "SELL", 5, 130.0, "USD", "USD")
+    with pytest.raises(dbmod.OrderError):
+        led.execute_order(uid, "AAPL", "stock", "SELL", 100, 130.0, "USD", "USD")
+    assert res["transaction_id"] == 1 and res["balance"] == 99000.0
+    assert led.get_balance(uid, "USD") == 100000.0 - 1000.0 - 1200.0 + 650.0
+    assert led.get_holding(uid, "AAPL", "stock")["quantity"] == 15
+    assert led.get_holding(uid, "AAPL", "stock")["avg_price"] == pytest.approx(110.0)
+    # nothing has reached the tables yet
+    assert _rows(dbmod, "SELECT COUNT(*) FROM transactions") == [(0,)]
+    assert led.flush() == 3
+    assert dbmod.get_balance(uid, "USD") == 100000.0 - 1000.0 - 1200.0 + 650.0
+    assert dbmod.get_holding(uid, "AAPL", "stock")["quantity"] == 15
+    assert [t["id"] for t in dbmod.get_transactions(uid)] == [3, 2, 1]
+    assert dbmod.get_ledger_checkpoint() == 3
+    assert not os.path.exists(journal + ".%020d" % 3)
+    led.execute_order(uid, "AAPL", "stock", "SELL", 15, 100.0, "USD", "USD")
+    led.close()
+    assert dbmod.get_holding(uid, "AAPL", "stock") is None
+    dbmod.close_connections()
+
+def test_crash_recovery_replays_unflushed_journal(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uids = [dbmod.create_user(f"u{i}", b"hash") for i in range(3)]
+    led = ledger.Ledger(journal)
+    led.open()
+    led.execute_order(uids[0], "BTC/USDT", "crypto", "BUY", 1, 50000.0, "USDT", "USD")
+    led.flush()
+    stats = led.apply_orders([dict(user_id=u, symbol="AAPL", side="buy", qty=1, price=10.0) for u in uids]
+                             + [dict(user_id=uids[1], symbol="AAPL", side="sell", qty=5, price=10.0)])
+    assert stats == {"accepted": 3, "rejected": 1, "batches": 1}
+    led.update_balance(uids[2], "EUR", 25.0)
+    led._journal.close()  # crash: no final flush, and the process lock dies with it
+    led._lock_file.close()
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"seq": 99, "op": "bal')  # torn tail from a write cut short
+
+    recovered = ledger.Ledger(journal)
+    assert recovered.open() == 4
+    assert dbmod.get_ledger_checkpoint() == 5
+    assert dbmod.get_balance(uids[0], "USD") == 100000.0 - 50000.0 - 10.0
+    assert dbmod.get_balance(uids[2], "EUR") == 25.0
+    assert _rows(dbmod, "SELECT COUNT(*) FROM transactions") == [(4,)]
+    assert _rows(dbmod, "SELECT user_id, quantity FROM holdings WHERE symbol = 'AAPL' ORDER BY user_id") == \
+        [(u, 1.0) for u in uids]
+    recovered.close()
+    # a clean restart has nothing left to replay
+    again = ledger.Ledger(journal)
+    assert again.open() == 0
+    assert again.execute_order(uids[0], "AAPL", "stock", "BUY", 1, 10.0, "USD", "USD")["transaction_id"] == 5
+    again.close()
+    dbmod.close_connections()
+
+def test_failed_journal_write_rolls_batch_back(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("disk-full", b"hash")
+    led = ledger.Ledger(journal)
+    led.open()
+    led.execute_order(uid, "AAPL", "stock", "BUY", 1, 100.0, "USD", "USD")
+    def boom(lines):
+        raise OSError("No space left on device")
+    monkeypatch.setattr(led, "_append", boom)
+    with pytest.raises(OSError):
+        led.apply_orders([dict(user_id=uid, symbol="MSFT", side="buy", qty=2, price=50.0)])
+    with pytest.raises(OSError):
+        led.update_balance(uid, "USD", 1.0)
+    assert led.get_balance(uid, "USD") == 99900.0
+    assert led.get_holding(uid, "MSFT", "stock") is None
+    monkeypatch.undo()
+    led.close()
+    assert _rows(dbmod, "SELECT COUNT(*) FROM transactions") == [(1,)]
+    assert dbmod.get_balance(uid, "USD") == 99900.0
+    dbmod.close_connections()
+
+def test_failed_journal_write_leaves_no_trace_in_the_journal(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("half-write", b"hash")
+    led = ledger.Ledger(journal, flush_interval=60)
+    led.open()
+    led.update_balance(uid, "EUR", 1.0)
+    class FailingWriter:
+        """Writes part of the first chunk to disk, then fails, like a disk filling up."""
+        def __init__(self, f):
+            self.f = f
+        def write(self, data):
+            self.f.write(data[:10])
+            raise OSError("No space left on device")
+        def __getattr__(self, name):
+            return getattr(self.f, name)
+    led._journal = FailingWriter(led._journal)
+    with pytest.raises(OSError):
+        led.apply_orders([dict(user_id=uid, symbol="AAPL", side="buy", qty=1, price=10.0)])
+    assert not isinstance(led._journal, FailingWriter)  # reopened
+    led._journal = FailingWriter(led._journal)
+    with pytest.raises(OSError):
+        led.update_balance(uid, "EUR", 100.0)
+    led.update_balance(uid, "EUR", 2.0)
+    with open(journal, encoding="utf-8") as f:
+        lines = f.read().splitlines()
+    assert [l.count('"seq"') for l in lines] == [1, 1]
+    led._journal.close()  # crash before any flush
+    led._lock_file.close()
+    recovered = ledger.Ledger(journal)
+    assert recovered.open() == 2
+    recovered.close()
+    assert dbmod.get_balance(uid, "EUR") == 3.0
+    assert dbmod.get_holding(uid, "AAPL", "stock") is None
+    dbmod.close_connections()
+
+def test_replay_skips_repeated_seqs(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("dup", b"hash")
+    entry = '{"seq":1,"op":"balance","ts":"t","user_id":%d,"currency":"EUR","amount":%s}\n'
+    with open(journal, "w", encoding="utf-8") as f:
+        f.write(entry % (uid, "5.0") + entry % (uid, "7.0"))
+    led = ledger.Ledger(journal)
+    assert led.open() == 1
+    led.close()
+    assert dbmod.get_balance(uid, "EUR") == 5.0
+    dbmod.close_connections()
+
+def test_database_functions_route_through_attached_ledger(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("routed", b"hash")
+    led = ledger.Ledger(journal, flush_interval=60)
+    led.open()
+    dbmod.set_ledger(led)
+    try:
+        dbmod.execute_order(uid, "AAPL", "stock", "BUY", 2, 100.0, "USD", "USD")
+        dbmod.upsert_holding(uid, "GC=F", "commodity", 1, 2000.0)
+        assert dbmod.get_balance(uid, "USD") == 99800.0
+        assert {h["symbol"] for h in dbmod.get_holdings(uid)} == {"AAPL", "GC=F"}
+        assert _rows(dbmod, "SELECT COUNT(*) FROM holdings") == [(0,)]
+    finally:
+        led.close()
+        dbmod.set_ledger(None)
+    assert {h["symbol"] for h in dbmod.get_holdings(uid)} == {"AAPL", "GC=F"}
+    dbmod.close_connections()
+
+def test_second_ledger_on_same_journal_is_refused(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("single-writer", b"hash")
+    first = ledger.Ledger(journal)
+    first.open()
+    with pytest.raises(RuntimeError):
+        ledger.Ledger(journal).open()
+    first.execute_order(uid, "AAPL", "stock", "BUY", 1000, 100.0, "USD", "USD")
+    first.close()
+    second = ledger.Ledger(journal)
+    second.open()
+    with pytest.raises(dbmod.OrderError):
+        second.execute_order(uid, "AAPL", "stock", "BUY", 1000, 100.0, "USD", "USD")
+    second.close()
+    dbmod.close_connections()
+
+def test_accounts_in_a_flush_are_not_evicted(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    a, b, c = (dbmod.create_user(n, b"hash") for n in ("a", "b", "c"))
+    led = ledger.Ledger(journal, max_accounts=1)
+    led.open()
+    led.execute_order(a, "AAPL", "stock", "BUY", 10, 100.0, "USD", "USD")
+    real_write = dbmod.write_ledger_batch
+    def failing_write(*args):
+        led.get_balance(b, "USD")  # would evict `a` while its write is in flight
+        raise dbmod.sqlite3.OperationalError("database is locked")
+    monkeypatch.setattr(dbmod, "write_ledger_batch", failing_write)
+    with pytest.raises(dbmod.sqlite3.OperationalError):
+        led.flush()
+    led.get_balance(c, "USD")
+    assert led.get_balance(a, "USD") == 99000.0
+    monkeypatch.setattr(dbmod, "write_ledger_batch", real_write)
+    assert led.flush() == 1
+    led.close()
+    assert dbmod.get_balance(a, "USD") == 99000.0
+    assert dbmod.get_holding(a, "AAPL", "stock")["quantity"] == 10
+    dbmod.close_connections()
+
+def test_torn_line_mid_journal_keeps_later_entries(tmp_path, monkeypatch):
+    dbmod, ledger, journal = _setup(tmp_path, monkeypatch)
+    uid = dbmod.create_user("torn", b"hash")
+    led = ledger.Ledger(journal)
+    led.open()
+    led.update_balance(uid, "EUR", 1.0)
+    led._journal.write(b'{"seq": 2, "op": "bal\n')  # cut short, then the process kept going
+    led.update_balance(uid, "EUR", 2.0)
+    led._journal.close()
+    led._lock_file.close()
+    with open(journal, "a", encoding="utf-8") as f:
+        f.write('{"seq": 9')  # and a torn tail on top
+    recovered = ledger.Ledger(journal)
+    assert recovered.open() == 2
+    recovered.update_balance(uid, "EUR", 4.0)
+    recovered._journal.close()
+    recovered._lock_file.close()
+    again = ledger.Ledger(journal)
+    assert again.open() == 1
+    again.close()
+    assert dbmod.get_balance(uid, "EUR") == 7.0
+    dbmod.close_connections()
@@ -0,0 +1,45 @@
+import asyncio
+import threading
+from market_data import AsyncMarketData
+
+def _classify(sym):
+    return "ccxt" if "/" in sym else "yfinance"
+
+def test_batches_run_concurrently():
+    # each batch waits for the other two: run one after another, they would all fail
+    barrier = threading.Barrier(3, timeout=5)
+    def fetch(symbols):
+        barrier.wait()
+        return {s: 1.0 for s in symbols}
+    md = AsyncMarketData(fetcher=fetch, classifier=_classify, batch_sizes={"ccxt": 10, "yfinance": 2})
+    symbols = ["BTC/USDT", "AAPL", "MSFT", "GC=F", "TSLA"]
+    prices = asyncio.run(md.get_prices(symbols))
+    assert prices == {s: 1.0 for s in symbols}
+    assert md.stats["requests"] == 3 and md.stats["errors"] == 0
+    md.close()
+
+def test_timed_out_fetch_keeps_its_slot_until_it_returns():
+    release = threading.Event()
+    calls = []
+    def hung_fetch(symbols):
+        calls.append(symbols)
+        release.wait(5)
+        return {s: 1.0 for s in symbols}
+    md = AsyncMarketData(fetcher=hung_fetch, classifier=_classify, timeout=0.05,
+                         source_limits={"yfinance": 1})
+
+    async def scenario():
+        first = await md.get_prices(["AAPL"])
+        # the only yfinance slot is still held by the hung worker: no second upstream call
+        second = await md.get_prices(["MSFT"])
+        assert len(calls) == 1
+        release.set()
+        md.timeout = 5
+        third = await md.get_prices(["TSLA"])
+        return first, second, third
+
+    first, second, third = asyncio.run(scenario())
+    assert first == {"AAPL": None} and second == {"MSFT": None} and third == {"TSLA": 1.0}
+    assert calls == [["AAPL"], ["TSLA"]]
+    assert md.stats["timeouts"] == 2
+    md.close()
@@ -0,0 +1,74 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+import pytest
+from news_cache import NewsCache
+
+class _StubNewsAPI(BaseHTTPRequestHandler):
+    calls = []
+    def do_GET(self):
+        q = parse_qs(urlsplit(self.path).query)["q"][0]
+        _StubNewsAPI.calls.append(q)
+        articles = [{"title": f"{q} {i}", "description": "d", "url": f"https://news.test/{i}?utm_source=x",
+                     "publishedAt": f"2024-01-{i + 1:02d}T00:00:00Z", "source": {"name": "Stub"}} for i in range(25)]
+        articles.append(dict(articles[0], url="https://news.test/0#comments"))  # syndicated copy
+        body = json.dumps({"articles": articles}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.end_headers()
+        self.wfile.write(body)
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_url():
+    _StubNewsAPI.calls = []
+    server = HTTPServer(("127.0.0.1", 0), _StubNewsAPI)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_port}/v2/everything"
+    server.shutdown()
+
+def test_cached_paginated_and_deduplicated(stub_url):
+    cache = NewsCache("key", base_url=stub_url, ttl=60)
+    first = cache.get(" Apple ", page=1, page_size=10)
+    assert first["total"] == 25 and len(first["articles"]) == 10
+    assert first["articles"][0]["publishedAt"].startswith("2024-01-25")
+    assert cache.get("apple", page=3, page_size=10)["articles"][-1]["title"] == "Apple 0"
+    assert _StubNewsAPI.calls == ["Apple"]
+    cache.get("tesla")
+    assert len(cache._articles) == 25  # same urls across queries are stored once
+    assert cache.stats["duplicates_dropped"] == 2
+
+def test_quota_serves_stale_and_prefetch(stub_url):
+    budget = [2]
+    def quota():
+        budget[0] -= 1
+        return budget[0] >= 0
+    cache = NewsCache("key", base_url=stub_url, ttl=60, quota_check=quota)
+    assert cache.prefetch(["AAPL", "aapl", "BTC", "ETH"]) == 2
+    assert _StubNewsAPI.calls == ["AAPL", "BTC"]
+    cache._entries["aapl"] = (0.0, cache._entries["aapl"][1])  # expire it
+    assert cache.get("aapl")["total"] == 25
+    assert cache.stats["stale_served"] == 1 and cache.stats["quota_rejections"] == 2
+    assert cache.get("eth")["articles"] == []
+
+def test_per_keyword_state_is_bounded(stub_url):
+    cache = NewsCache("key", base_url=stub_url, ttl=60, max_popular=5, quota_check=lambda: False)
+    for i in range(50):
+        cache.get(f"random search {i}")  # quota spent: every fetch fails
+    cache.get("random search 0")
+    assert cache._key_locks == {}
+    assert len(cache.popularity) <= 10
+    assert cache.popularity.most_common(1)[0] == ("random search 0", 2)
+
+def test_operators_reach_upstream_and_reads_keep_keywords_cached(stub_url):
+    cache = NewsCache("key", base_url=stub_url, ttl=60, max_keywords=2)
+    cache.get("tesla  OR rivian")
+    cache.get("TESLA or Rivian")  # same cache key
+    assert _StubNewsAPI.calls == ["tesla OR rivian"]
+    cache.get("apple")
+    cache.get("tesla or rivian")  # read: now the most recently used
+    cache.get("nvidia")
+    assert list(cache._entries) == ["tesla or rivian", "nvidia"]
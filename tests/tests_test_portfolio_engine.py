@@ -0,0 +1,54 @@
+import numpy as np
+import pytest
+from portfolio_engine import PortfolioEngine, realized_pnl
+
+HOLDINGS = [
+    {"symbol": "AAPL", "asset_type": "stock", "quantity": 10, "avg_price": 100.0},
+    {"symbol": "SAP", "asset_type": "stock", "quantity": 4, "avg_price": 50.0},
+    {"symbol": "BTC/USDT", "asset_type": "crypto", "quantity": 0.5, "avg_price": 20000.0},
+]
+
+def test_valuation_and_fx():
+    engine = PortfolioEngine(HOLDINGS, currencies={"SAP": "EUR"}, fx_rates={"EUR": 2.0})
+    engine.set_prices({"AAPL": 110.0, "SAP": 60.0, "UNKNOWN": 1.0})
+    totals = engine.totals()
+    assert totals["market_value"] == pytest.approx(1100 + 4 * 60 * 2)
+    assert totals["unrealized_pnl"] == pytest.approx(100 + 4 * 10 * 2)
+    assert totals["priced"] == 2
+    assert np.isclose(engine.weights.sum(), 1.0)
+
+def test_single_symbol_update_matches_full_recompute():
+    engine = PortfolioEngine(HOLDINGS)
+    engine.set_prices({"AAPL": 110.0, "SAP": 60.0})
+    engine.update_price("BTC/USDT", 30000.0)
+    engine.update_price("AAPL", 90.0)
+    incremental = engine.totals()
+    engine.set_fx_rates({})  # forces a full recompute
+    assert engine.totals() == pytest.approx(incremental)
+    assert incremental["market_value"] == pytest.approx(900 + 240 + 15000)
+
+def test_realized_pnl_average_cost():
+    txs = [
+        {"symbol": "AAPL", "asset_type": "stock", "side": "buy", "quantity": 10, "price": 100.0, "currency": "USD"},
+        {"symbol": "AAPL", "asset_type": "stock", "side": "buy", "quantity": 10, "price": 200.0, "currency": "USD"},
+        {"symbol": "AAPL", "asset_type": "option", "side": "buy", "quantity": 5, "price": 1.0, "currency": "USD"},
+        {"symbol": "AAPL", "asset_type": "stock", "side": "sell", "quantity": 5, "price": 170.0, "currency": "USD"},
+        {"symbol": "AAPL", "asset_type": "option", "side": "sell", "quantity": 5, "price": 3.0, "currency": "USD"},
+    ]
+    realized, currency = realized_pnl(txs)
+    # each asset type keeps its own cost basis
+    assert realized == {("AAPL", "stock"): pytest.approx(5 * 20.0), ("AAPL", "option"): pytest.approx(5 * 2.0)}
+    assert currency == {"AAPL": "USD"}
+
+def test_from_user_realized_pnl_on_executed_orders(tmp_path, monkeypatch):
+    import importlib
+    import database as dbmod
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "engine.db"))
+    importlib.reload(dbmod)
+    uid = dbmod.create_user("pnl", b"hash")
+    dbmod.execute_order(uid, "AAPL", "stock", "Buy", 10, 100.0, "USD", "USD")
+    dbmod.execute_order(uid, "AAPL", "stock", "SELL", 4, 130.0, "USD", "USD")
+    engine = PortfolioEngine.from_user(uid)
+    assert engine.totals()["realized_pnl"] == pytest.approx(4 * 30.0)
+    assert engine.quantity.tolist() == [6.0]
+    dbmod.close_connections()
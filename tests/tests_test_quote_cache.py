@@ -0,0 +1,51 @@
+import threading
+import time
+from quote_cache import QuoteCache
+
+def test_ttl_and_hits():
+    calls = []
+    def fetcher(symbols):
+        calls.append(list(symbols))
+        return {s: 1.0 for s in symbols}
+    cache = QuoteCache(ttl=0.05)
+    assert cache.get_many(["AAPL", "MSFT"], fetcher) == {"AAPL": 1.0, "MSFT": 1.0}
+    assert cache.get_many(["AAPL"], fetcher) == {"AAPL": 1.0}
+    assert calls == [["AAPL", "MSFT"]]
+    time.sleep(0.06)
+    cache.get("AAPL", fetcher)
+    assert calls[-1] == ["AAPL"]
+    stats = cache.snapshot()
+    assert stats["hits"] == 1 and stats["misses"] == 3
+
+def test_concurrent_misses_coalesce():
+    calls = []
+    def slow_fetcher(symbols):
+        calls.append(list(symbols))
+        time.sleep(0.1)
+        return {s: 42.0 for s in symbols}
+    cache = QuoteCache(ttl=10)
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(cache.get("AAPL", slow_fetcher))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert results == [42.0] * 8
+    assert len(calls) == 1
+
+def test_redis_hit_keeps_its_remaining_ttl():
+    import pytest
+    fakeredis = pytest.importorskip("fakeredis")
+    client = fakeredis.FakeStrictRedis()
+    client.set("quote:AAPL", "1.5", px=300)  # written by another process 4.7 s ago
+    calls = []
+    def fetcher(symbols):
+        calls.append(list(symbols))
+        return {s: 2.0 for s in symbols}
+    cache = QuoteCache(ttl=5.0, redis_client=client)
+    assert cache.get("AAPL", fetcher) == 1.5
+    assert cache._data["AAPL"][0] - time.monotonic() <= 0.3
+    time.sleep(0.31)
+    assert cache.get("AAPL", fetcher) == 2.0
+    assert calls == [["AAPL"]]
+    assert 4000 < client.pttl("quote:AAPL") <= 5000
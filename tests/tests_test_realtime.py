@@ -0,0 +1,185 @@
+import asyncio
+import json
+import pytest
+from realtime import ConnectionManager
+
+class FakeWebSocket:
+    def __init__(self):
+        self.sent = []
+    async def accept(self):
+        pass
+    async def send_text(self, text):
+        self.sent.append(json.loads(text))
+
+def test_hub_refcounts_and_fans_out_changes_only():
+    async def scenario():
+        hub = ConnectionManager()
+        a, b = FakeWebSocket(), FakeWebSocket()
+        await hub.connect(a)
+        await hub.connect(b)
+        await hub.handle_message(a, json.dumps({"action": "subscribe", "symbols": ["AAPL", "MSFT"]}))
+        await hub.handle_message(b, json.dumps({"symbols": ["AAPL"]}))
+        assert sorted(hub.symbols()) == ["AAPL", "MSFT"]
+        await hub.publish({"AAPL": 1.0, "MSFT": 2.0})
+        await hub.drain()
+        await hub.publish({"AAPL": 1.0, "MSFT": 2.5})  # only MSFT changed
+        await hub.drain()
+        assert a.sent == [{"type": "prices", "data": {"AAPL": 1.0, "MSFT": 2.0}},
+                          {"type": "prices", "data": {"MSFT": 2.5}}]
+        assert b.sent == [{"type": "prices", "data": {"AAPL": 1.0}}]
+        await hub.handle_message(a, json.dumps({"action": "unsubscribe", "symbols": ["MSFT"]}))
+        hub.disconnect(b)
+        assert hub.symbols() == ["AAPL"]
+        assert not await hub.handle_message(a, "hello from client")
+    asyncio.run(scenario())
+
+class SlowWebSocket(FakeWebSocket):
+    async def send_text(self, text):
+        await asyncio.sleep(0.05)
+        await super().send_text(text)
+    async def close(self):
+        pass
+
+def test_slow_client_does_not_stall_others_and_is_coalesced():
+    async def scenario():
+        hub = ConnectionManager()
+        fast, slow = FakeWebSocket(), SlowWebSocket()
+        for ws in (fast, slow):
+            await hub.connect(ws)
+            await hub.handle_message(ws, json.dumps({"symbols": ["AAPL"]}))
+        for i in range(5):
+            await hub.publish({"AAPL": float(i)})
+            # the fast client keeps up even while the slow one is mid-send
+            await asyncio.wait_for(hub.channels[fast].drain(), 0.04)
+        assert [m["data"]["AAPL"] for m in fast.sent] == [0.0, 1.0, 2.0, 3.0, 4.0]
+        await hub.drain()
+        # the slow client got the first price, then only the latest coalesced one
+        assert [m["data"]["AAPL"] for m in slow.sent] == [0.0, 4.0]
+    asyncio.run(scenario())
+
+class BinaryWebSocket(FakeWebSocket):
+    async def send_bytes(self, data):
+        self.sent.append(data)
+
+def test_struct_protocol_deltas_and_snapshots():
+    from wire import get_codec
+    codec = get_codec("struct")
+
+    async def scenario():
+        hub = ConnectionManager(snapshot_every=3)
+        ws = BinaryWebSocket()
+        await hub.connect(ws, protocol="struct")
+        await hub.handle_message(ws, json.dumps({"symbols": ["AAPL", "MSFT"]}))
+        await hub.publish({"AAPL": 1.0, "MSFT": 2.0})
+        await hub.drain()
+        await hub.publish({"AAPL": 1.5, "MSFT": 2.0})
+        await hub.drain()
+        await hub.publish({"AAPL": 1.5, "MSFT": 2.0})  # third tick: full snapshot
+        await hub.drain()
+        return ws.sent
+
+    hello, first, delta, snap = asyncio.run(scenario())
+    assert hello == {"type": "hello", "protocol": "struct"}
+    assert codec.decode(first) == ("prices", 1, {"AAPL": 1.0, "MSFT": 2.0})
+    assert codec.decode(delta) == ("prices", 2, {"AAPL": 1.5})
+    kind, seq, data = codec.decode(snap)
+    assert (kind, seq, data) == ("snapshot", 3, {"AAPL": 1.5, "MSFT": 2.0})
+
+class BrokenCodec:
+    name = "broken"
+    def encode(self, kind, prices, seq=0, ts=None):
+        raise ValueError("cannot encode")
+
+def test_publish_error_drops_only_the_failing_client():
+    async def scenario():
+        hub = ConnectionManager()
+        good, bad = FakeWebSocket(), SlowWebSocket()
+        for ws in (good, bad):
+            await hub.connect(ws)
+            await hub.handle_message(ws, json.dumps({"symbols": ["AAPL"]}))
+        hub.channels[bad].codec = BrokenCodec()
+        await hub.publish({"AAPL": 1.0})
+        await hub.drain()
+        assert good.sent == [{"type": "prices", "data": {"AAPL": 1.0}}]
+        assert bad not in hub.channels and hub.symbols() == ["AAPL"]
+    asyncio.run(scenario())
+
+def test_poller_survives_a_failing_tick(monkeypatch):
+    import realtime
+    calls = []
+    async def get_prices(symbols):
+        calls.append(symbols)
+        if len(calls) == 1:
+            raise RuntimeError("upstream down")
+        return {"AAPL": 2.0}
+    monkeypatch.setattr(realtime.market_data, "get_prices", get_prices)
+
+    async def scenario():
+        hub = ConnectionManager()
+        ws = FakeWebSocket()
+        await hub.connect(ws)
+        await hub.handle_message(ws, json.dumps({"symbols": ["AAPL"]}))
+        task = asyncio.ensure_future(hub.poll_prices(interval=0.01))
+        await asyncio.sleep(0.05)
+        assert not task.done()
+        task.cancel()
+        await hub.drain()
+        return ws.sent
+    assert asyncio.run(scenario())[0] == {"type": "prices", "data": {"AAPL": 2.0}}
+    assert len(calls) >= 2
+
+def test_echo_goes_through_the_client_channel(monkeypatch):
+    import realtime
+    from fastapi import WebSocketDisconnect
+    hub = ConnectionManager()
+    hub.autostart_poller = False
+    monkeypatch.setattr(realtime, "manager", hub)
+    class ChattyWebSocket(FakeWebSocket):
+        inbox = ["ping"]
+        async def receive_text(self):
+            if self.inbox:
+                return self.inbox.pop()
+            await hub.channels[self].drain()
+            raise WebSocketDisconnect()
+    ws = ChattyWebSocket()
+    sends = []
+    async def scenario():
+        real = hub.send
+        monkeypatch.setattr(hub, "send", lambda w, m: (sends.append(m), real(w, m)))
+        await realtime.serve_client(ws)
+    asyncio.run(scenario())
+    assert ws.sent == [{"echo": "ping"}] and sends == ['{"echo": "ping"}']
+    assert ws not in hub.channels
+
+def test_lifespan_starts_and_stops_the_poller(monkeypatch):
+    import realtime
+    hub = ConnectionManager()
+    monkeypatch.setattr(realtime, "manager", hub)
+    async def scenario():
+        async with realtime.lifespan(realtime.app):
+            task = hub._poller_task
+            assert task is not None and not task.done()
+        return task
+    assert asyncio.run(scenario()).cancelled()
+    assert hub._poller_task is None
+
+def test_subscriptions_are_validated_and_capped():
+    from wire import CodecError, get_codec
+
+    async def scenario():
+        hub = ConnectionManager(max_symbols=2)
+        ws = BinaryWebSocket()
+        await hub.connect(ws, protocol="struct")
+        await hub.handle_message(ws, json.dumps({"symbols": ["X" * 300, "BTC/USDT", "bad symbol"]}))
+        await hub.handle_message(ws, json.dumps({"symbols": ["GC=F", "^GSPC"]}))
+        await hub.publish({"BTC/USDT": 1.0, "GC=F": 2.0, "^GSPC": 3.0})
+        await hub.drain()
+        return hub, ws.sent
+
+    hub, sent = asyncio.run(scenario())
+    assert sorted(hub.symbols()) == ["BTC/USDT", "GC=F"]
+    errors = [m for m in sent if isinstance(m, dict) and m.get("type") == "error"]
+    assert [e["symbols"] for e in errors] == [["X" * 32, "bad symbol"], ["^GSPC"]]
+    assert get_codec("struct").decode(sent[-1])[2] == {"BTC/USDT": 1.0, "GC=F": 2.0}
+    with pytest.raises(CodecError):
+        get_codec("struct").encode("prices", {"X" * 300: 1.0})
@@ -0,0 +1,55 @@
+from symbol_index import SymbolIndex
+
+RECORDS = [
+    {"symbol": "BTC/USDT", "name": "BTC / USDT", "currency": "USDT", "exchange": "binance", "asset_type": "crypto", "source": "ccxt"},
+    {"symbol": "ETH/USDT", "name": "ETH / USDT", "currency": "USDT", "exchange": "binance", "asset_type": "crypto", "source": "ccxt"},
+    {"symbol": "EURUSD=X", "name": "EUR/USD", "currency": "USD", "exchange": "CCY", "asset_type": "forex", "source": "yfinance"},
+    {"symbol": "AAPL", "name": "Apple Inc.", "currency": "USD", "exchange": "NMS", "asset_type": "equity", "source": "yfinance"},
+    {"symbol": "AMZN", "name": "Amazon.com, Inc.", "currency": "USD", "exchange": "NMS", "asset_type": "equity", "source": "yfinance"},
+]
+
+def test_search_prefix_name_and_fuzzy():
+    index = SymbolIndex(sources=[lambda: RECORDS])
+    assert index.search("a") == []  # sources are only pulled by refresh(), never on a request
+    index.refresh()
+    assert [r["symbol"] for r in index.search("a")] == ["AAPL", "AMZN"]
+    assert index.search("apple")[0]["symbol"] == "AAPL"
+    assert index.search("btcusdt")[0]["symbol"] == "BTC/USDT"
+    assert index.search("amazon com")[0]["symbol"] == "AMZN"
+    assert index.search("APPL")[0]["symbol"] == "AAPL"  # fuzzy fallback
+
+def test_resolve_variants_lookup_and_negative_cache():
+    calls, saved = [], []
+    def lookup(symbol):
+        calls.append(symbol)
+        return {"symbol": "MSFT", "name": "Microsoft", "source": "yfinance"} if symbol == "MSFT" else None
+    index = SymbolIndex(lookup=lookup, load=lambda: RECORDS, save=saved.extend)
+    assert index.resolve("btc")["symbol"] == "BTC/USDT"
+    assert index.resolve("EURUSD")["symbol"] == "EURUSD=X"
+    assert index.resolve("eth-usdt")["symbol"] == "ETH/USDT"
+    assert calls == []
+    assert index.resolve("msft")["symbol"] == "MSFT"
+    assert index.resolve("MSFT")["symbol"] == "MSFT"
+    assert [r["symbol"] for r in saved] == ["MSFT"]
+    assert index.resolve("NOPE") is None and index.resolve("nope") is None
+    assert calls == ["MSFT", "NOPE"]
+    assert index.stats["negative_hits"] == 1
+
+def test_added_records_are_inserted_in_order_and_lookup_errors_are_not_cached():
+    calls = []
+    def lookup(symbol):
+        calls.append(symbol)
+        if len(calls) == 1:
+            raise TimeoutError("upstream slow")
+        return {"symbol": symbol, "name": "Nvidia Corp", "source": "yfinance"}
+    index = SymbolIndex(lookup=lookup, load=lambda: RECORDS)
+    assert index.resolve("NVDA") is None
+    assert index.resolve("NVDA")["symbol"] == "NVDA"
+    assert calls == ["NVDA", "NVDA"]
+    index.add([{"symbol": "AAPL", "name": "Apple Computer"}], persist=False)
+    assert index._keys == sorted(index._keys)
+    keys = list(index._keys)
+    index._rebuild()
+    assert keys == index._keys
+    assert index.search("nvidia")[0]["symbol"] == "NVDA"
+    assert index.search("computer")[0]["symbol"] == "AAPL"
@@ -0,0 +1,49 @@
+import pandas as pd
+from tick_store import TickStore, TickRing
+
+def test_ring_keeps_fixed_capacity():
+    ring = TickRing(capacity=3)
+    for i in range(5):
+        ring.append(float(i), float(i), 0.0)
+    assert ring.last()[:, 0].tolist() == [2.0, 3.0, 4.0]
+
+def test_incremental_bars():
+    store = TickStore()
+    for ts, price in [(0, 10.0), (20, 12.0), (40, 9.0), (59, 11.0), (60, 11.5), (130, 13.0)]:
+        store.ingest("AAPL", price, ts=ts)
+    bars = store.get_bars("AAPL", "1m")
+    assert bars[["Open", "High", "Low", "Close"]].values.tolist() == [
+        [10.0, 12.0, 9.0, 11.0], [11.5, 11.5, 11.5, 11.5], [13.0, 13.0, 13.0, 13.0]]
+    assert len(store.get_bars("AAPL", "5m")) == 1
+
+def test_backfill_only_on_miss():
+    store = TickStore()
+    calls = []
+    def backfill(symbol, interval, limit):
+        calls.append(limit)
+        idx = pd.to_datetime([0, 60, 120], unit="s", utc=True)
+        return pd.DataFrame({"Open": [1.0, 2.0, 3.0], "High": [1.0, 2.0, 3.0], "Low": [1.0, 2.0, 3.0],
+                             "Close": [1.0, 2.0, 3.0], "Volume": [0.0, 0.0, 0.0]}, index=idx)
+    store.ingest("BTC/USDT", 3.5, ts=150)
+    store.ingest("BTC/USDT", 4.0, ts=190)
+    df = store.get_bars_or_backfill("BTC/USDT", "1m", 4, backfill)
+    # upstream wins for the partial first in-memory bar at t=120
+    assert df["Close"].tolist() == [1.0, 2.0, 3.0, 4.0]
+    store.get_bars_or_backfill("BTC/USDT", "1m", 4, backfill)
+    assert calls == [4]
+
+def test_backfill_cache_is_bounded_and_serves_processes_without_ticks():
+    store = TickStore(max_history=2)
+    calls = []
+    def backfill(symbol, interval, limit):
+        calls.append(symbol)
+        idx = pd.to_datetime([0, 86400], unit="s", utc=True)
+        return pd.DataFrame({"Close": [1.0, 2.0]}, index=idx)
+    # no ingested ticks, as in the Streamlit process: served from the cached backfill
+    assert store.get_bars_or_backfill("AAPL", "1d", 2, backfill)["Close"].tolist() == [1.0, 2.0]
+    store.get_bars_or_backfill("AAPL", "1d", 2, backfill)
+    assert calls == ["AAPL"]
+    store.get_bars_or_backfill("MSFT", "1d", 2, backfill)
+    store.get_bars_or_backfill("AAPL", "1d", 2, backfill)  # AAPL is now the most recent
+    store.get_bars_or_backfill("NVDA", "1d", 2, backfill)
+    assert list(store._history) == [("AAPL", "1d"), ("NVDA", "1d")]
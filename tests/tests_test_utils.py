@@ -18,3 +18,126 @@ def test_email_token():
     token = generate_email_token(1)
     uid = confirm_email_token(token)
     assert uid == 1
+
+def test_streaming_csv_export():
+    import gzip
+    from utils import iter_portfolio_csv, portfolio_to_csv
+    rows = ({"id": i, "symbol": "AAPL", "asset_type": "stock", "side": "BUY", "quantity": 1, "price": 10.0,
+             "currency": "USD", "timestamp": "t"} for i in range(25))
+    holdings = [{"id": 1, "symbol": "AAPL", "asset_type": "stock", "quantity": 25, "avg_price": 10.0, "last_updated": "t"}]
+    balances = [{"id": 1, "currency": "USD", "amount": 99750.0, "updated_at": "t"}]
+    chunks = list(iter_portfolio_csv(rows, holdings, balances, chunk_rows=10))
+    assert len(chunks) > 1
+    data = b"".join(chunks).decode("utf-8")
+    assert data.count("AAPL") == 26
+    assert "Balances" in data
+    _, whole = portfolio_to_csv([], holdings, balances)
+    gz = b"".join(iter_portfolio_csv([], holdings, balances, compress=True))
+    assert gzip.decompress(gz) == whole
+
+@pytest.mark.parametrize("algorithm", ["sliding", "gcra"])
+def test_rate_limit_redis_script(algorithm):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")  # fakeredis needs it to run Lua scripts
+    from utils import check_rate_limit
+    client = fakeredis.FakeStrictRedis()
+    results = [check_rate_limit("burst", 5, 10, algorithm, client=client) for _ in range(7)]
+    assert [r.allowed for r in results] == [True] * 5 + [False] * 2
+    assert [r.remaining for r in results[:5]] == [4, 3, 2, 1, 0]
+    assert 0 < results[-1].retry_after <= 10
+
+@pytest.mark.parametrize("algorithm", ["sliding", "gcra"])
+def test_rate_limit_redis_ignores_app_host_clock_skew(algorithm, monkeypatch):
+    fakeredis = pytest.importorskip("fakeredis")
+    pytest.importorskip("lupa")
+    import utils
+    import time, types
+    client = fakeredis.FakeStrictRedis()
+    allowed = []
+    for skew in (0, 3600, 0, -3600):  # four hosts, an hour apart, sharing one limit
+        host_clock = types.SimpleNamespace(time=lambda skew=skew: time.time() + skew, monotonic=time.monotonic)
+        monkeypatch.setattr(utils, "time", host_clock)
+        allowed.append(utils.check_rate_limit("skew", 2, 60, algorithm, client=client).allowed)
+    assert allowed == [True, True, False, False]
+
+@pytest.mark.parametrize("algorithm", ["sliding", "gcra"])
+def test_rate_limit_memory_fallback(algorithm):
+    import utils
+    results = [utils.check_rate_limit(f"mem-{algorithm}", 3, 60, algorithm) for _ in range(4)]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert not results[-1].allowed and results[-1].retry_after > 0
+
+def test_memory_limiter_bounded_and_expires_idle_keys():
+    from utils import MemoryRateLimiter
+    now = [1000.0]
+    limiter = MemoryRateLimiter(max_keys=50, clock=lambda: now[0])
+    for i in range(200):
+        limiter.check(f"ip{i}", 5, 10)
+    assert len(limiter) == 50 and limiter.stats["evicted"] == 150
+    now[0] += 25  # every window has fully decayed
+    for i in range(10):
+        limiter.check("fresh", 5, 10, "gcra")
+    assert len(limiter) < 50 and limiter.stats["expired"] > 0
+
+def test_memory_sliding_window_carries_over_non_binary_windows():
+    from utils import MemoryRateLimiter
+    now = [0.25]
+    limiter = MemoryRateLimiter(clock=lambda: now[0])
+    assert [limiter.check("tenth", 2, 0.1).allowed for _ in range(2)] == [True, True]
+    now[0] = 0.301  # just past the boundary: most of the previous window still counts
+    assert not limiter.check("tenth", 2, 0.1).allowed
+
+def test_memory_limiter_thread_safe():
+    import threading
+    from utils import MemoryRateLimiter
+    limiter = MemoryRateLimiter()
+    allowed = []
+    def worker():
+        allowed.extend(r.allowed for r in (limiter.check("shared", 100, 3600, "gcra") for _ in range(50)))
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(allowed) == 100
+
+def test_async_verify_and_rehash_on_login(tmp_path, monkeypatch):
+    import asyncio, importlib
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "auth.db"))
+    import database as dbmod
+    importlib.reload(dbmod)
+    import utils
+    old = utils.hash_password("hunter22", rounds=4)
+    uid = dbmod.create_user("alice", old)
+    monkeypatch.setattr(utils, "BCRYPT_ROUNDS", 5)
+    assert asyncio.run(utils.check_password_async("hunter22", old))
+    assert asyncio.run(utils.authenticate("alice", "nope")) is None
+    assert utils.bcrypt_cost(dbmod.get_user_by_id(uid)['password_hash']) == 4
+    assert asyncio.run(utils.authenticate("alice", "hunter22"))['id'] == uid
+    upgraded = dbmod.get_user_by_id(uid)['password_hash']
+    assert utils.bcrypt_cost(upgraded) == 5 and utils.check_password("hunter22", upgraded)
+    assert not utils.needs_rehash(upgraded)
+    dbmod.close_connections()
+
+def test_authenticate_keeps_database_calls_off_the_loop(tmp_path, monkeypatch):
+    import asyncio, importlib, threading
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "auth_loop.db"))
+    import database as dbmod
+    importlib.reload(dbmod)
+    import utils
+    uid = dbmod.create_user("bob", utils.hash_password("pw", rounds=4))
+    monkeypatch.setattr(utils, "BCRYPT_ROUNDS", 5)
+    threads = []
+    for name in ("get_user_by_username", "update_password_hash"):
+        real = getattr(dbmod, name)
+        def spy(*args, _real=real):
+            threads.append(threading.get_ident())
+            return _real(*args)
+        monkeypatch.setattr(dbmod, name, spy)
+
+    async def login():
+        return threading.get_ident(), await utils.authenticate("bob", "pw")
+    loop_thread, user = asyncio.run(login())
+    assert user['id'] == uid
+    assert len(threads) == 2 and loop_thread not in threads
+    dbmod.close_connections()
@@ -0,0 +1,65 @@
+import importlib
+import pytest
+
+def _setup(tmp_path, monkeypatch):
+    monkeypatch.setenv("CROSSP_DB", str(tmp_path / "valuation.db"))
+    import database as dbmod
+    import valuation_job
+    importlib.reload(dbmod)
+    return dbmod, importlib.reload(valuation_job)
+
+def test_shard_ranges_cover_ids():
+    from valuation_job import shard_ranges
+    assert shard_ranges(1, 10, 3) == [(1, 4), (5, 8), (9, 10)]
+    assert shard_ranges(0, -1, 4) == []
+
+def test_run_valuation_snapshots_every_account(tmp_path, monkeypatch):
+    dbmod, vj = _setup(tmp_path, monkeypatch)
+    orders = []
+    for i in range(20):
+        uid = dbmod.create_user(f"user{i}", b"hash", preferred_currency="EUR" if i % 2 else "USD")
+        orders.append(dict(user_id=uid, symbol="AAPL", asset_type="stock", side="buy", qty=2, price=100.0,
+                           tx_currency="USD", pref_currency="USD"))
+    orders.append(dict(user_id=1, symbol="SAP", asset_type="stock", side="buy", qty=1, price=50.0,
+                       tx_currency="EUR", pref_currency="USD", fx_rate=2.0))
+    dbmod.execute_orders_bulk(orders)
+    fetched = []
+    def fetcher(symbols):
+        fetched.append(symbols)
+        return {"AAPL": 110.0, "SAP": None}
+    stats = vj.run_valuation("2024-01-01", workers=2, shards=4, price_fetcher=fetcher,
+                             usd_rates={"USD": 1.0, "EUR": 2.0})
+    assert stats["accounts"] == 20 and stats["unpriced"] == 1
+    assert fetched == [["AAPL", "SAP"]]  # each distinct symbol priced once
+    usd = dbmod.get_valuation_snapshot(1, "2024-01-01")
+    assert usd["holdings_value"] == pytest.approx(220.0)
+    assert usd["cash_value"] == pytest.approx(100000 - 200 - 100)
+    assert usd["unpriced"] == 1
+    eur = dbmod.get_valuation_snapshot(2)
+    assert eur["currency"] == "EUR"
+    assert eur["total_value"] == pytest.approx((100000 - 200 + 220) / 2)
+    # re-running the same day replaces rather than duplicates
+    again = vj.run_valuation("2024-01-01", workers=1, prices={"AAPL": 110.0}, usd_rates={"USD": 1.0, "EUR": 2.0})
+    assert again["accounts"] == 20
+    assert dbmod.get_valuation_snapshot(2)["total_value"] == pytest.approx(eur["total_value"])
+
+def test_unknown_currencies_are_counted_not_converted_at_par(tmp_path, monkeypatch):
+    dbmod, vj = _setup(tmp_path, monkeypatch)
+    a = dbmod.create_user("known", b"hash")
+    b = dbmod.create_user("unknown-pref", b"hash", preferred_currency="XYZ")
+    dbmod.update_balance(a, "GBP", 10.0)  # no GBP rate
+    dbmod.execute_orders_bulk([
+        dict(user_id=a, symbol="7203.T", asset_type="stock", side="buy", qty=1, price=100.0,
+             tx_currency="JPY", pref_currency="USD"),  # no JPY rate either
+        dict(user_id=a, symbol="AAPL", asset_type="stock", side="buy", qty=1, price=100.0,
+             tx_currency="USD", pref_currency="USD")])
+    assert dbmod.get_held_symbols() == {"7203.T": "JPY", "AAPL": "USD"}
+    stats = vj.run_valuation("2024-01-02", workers=1, prices={"7203.T": 2000.0, "AAPL": 100.0},
+                             usd_rates={"USD": 1.0})
+    snap = dbmod.get_valuation_snapshot(a, "2024-01-02")
+    assert snap["holdings_value"] == pytest.approx(100.0)
+    assert snap["cash_value"] == pytest.approx(100000 - 200)
+    assert snap["unpriced"] == 2
+    other = dbmod.get_valuation_snapshot(b, "2024-01-02")
+    assert other["total_value"] == 0.0 and other["unpriced"] == 1
+    assert stats["unpriced"] == 3
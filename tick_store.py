@@ -0,0 +1,183 @@
+"""
+tick_store.py
+
+In-memory tick store. Quotes polled by the realtime hub's poller are appended to a
+fixed-size NumPy ring buffer per symbol and folded incrementally into 1m/5m/1h/1d OHLCV
+bars, so charts can be served from memory; older history is backfilled from upstream
+only when memory does not cover the requested number of bars.
+
+The store is per process and is only fed where the realtime poller runs (the uvicorn
+process). In the two-process deployment the Streamlit process never ingests ticks, so its
+charts always take the backfill path, with each backfill reused for one bar interval.
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+INTERVALS = {"1m": 60, "5m": 300, "1h": 3600, "1d": 86400}
+BAR_COLUMNS = ["Open", "High", "Low", "Close", "Volume"]
+
+class TickRing:
+    """Fixed-capacity ring of (ts, price, volume) ticks; the oldest tick is overwritten when full."""
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.data = np.full((capacity, 3), np.nan)
+        self.count = 0  # total ticks ever appended
+
+    def append(self, ts: float, price: float, volume: float):
+        self.data[self.count % self.capacity] = (ts, price, volume)
+        self.count += 1
+
+    def last(self, n: Optional[int]=None) -> np.ndarray:
+        """Most recent n ticks in time order, as an (n, 3) array."""
+        size = min(self.count, self.capacity)
+        n = size if n is None else min(n, size)
+        if n == 0:
+            return self.data[:0].copy()
+        end = self.count % self.capacity
+        idx = (np.arange(end - n, end)) % self.capacity
+        return self.data[idx]
+
+class BarRing:
+    """
+    Fixed-capacity ring of OHLCV bars for one interval, updated in O(1) per tick:
+    a tick inside the current bar updates high/low/close/volume, a later tick opens a new bar.
+    Columns: bar start ts, open, high, low, close, volume.
+    """
+    def __init__(self, seconds: int, capacity: int):
+        self.seconds = seconds
+        self.capacity = capacity
+        self.data = np.full((capacity, 6), np.nan)
+        self.count = 0
+
+    def add(self, ts: float, price: float, volume: float):
+        start = ts - (ts % self.seconds)
+        if self.count:
+            cur = self.data[(self.count - 1) % self.capacity]
+            if cur[0] == start:
+                cur[2] = max(cur[2], price)
+                cur[3] = min(cur[3], price)
+                cur[4] = price
+                cur[5] += volume
+                return
+            if start < cur[0]:
+                return  # out-of-order tick for an already closed bar
+        self.data[self.count % self.capacity] = (start, price, price, price, price, volume)
+        self.count += 1
+
+    def last(self, n: Optional[int]=None) -> np.ndarray:
+        size = min(self.count, self.capacity)
+        n = size if n is None else min(n, size)
+        if n == 0:
+            return self.data[:0].copy()
+        end = self.count % self.capacity
+        return self.data[np.arange(end - n, end) % self.capacity]
+
+Backfill = Callable[[str, str, int], pd.DataFrame]
+
+class TickStore:
+    def __init__(self, tick_capacity: int=10000, bar_capacity: int=500, max_history: int=256):
+        self.tick_capacity = tick_capacity
+        self.bar_capacity = bar_capacity
+        self.max_history = max_history
+        self._ticks: Dict[str, TickRing] = {}
+        self._bars: Dict[str, Dict[str, BarRing]] = {}
+        # (symbol, interval) -> (fetched_at, backfill), least recently used first
+        self._history: "OrderedDict[Tuple[str, str], Tuple[float, pd.DataFrame]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"ticks": 0, "memory_hits": 0, "backfills": 0}
+
+    def ingest(self, symbol: str, price: Optional[float], ts: Optional[float]=None, volume: float=0.0):
+        if price is None or price != price:  # skip failed lookups / NaN
+            return
+        ts = time.time() if ts is None else ts
+        with self._lock:
+            ring = self._ticks.get(symbol)
+            if ring is None:
+                ring = self._ticks[symbol] = TickRing(self.tick_capacity)
+                self._bars[symbol] = {name: BarRing(sec, self.bar_capacity) for name, sec in INTERVALS.items()}
+            ring.append(ts, price, volume)
+            for bars in self._bars[symbol].values():
+                bars.add(ts, price, volume)
+            self.stats["ticks"] += 1
+
+    def ingest_many(self, prices: Dict[str, Optional[float]], ts: Optional[float]=None):
+        ts = time.time() if ts is None else ts
+        for symbol, price in prices.items():
+            self.ingest(symbol, price, ts)
+
+    def ticks(self, symbol: str, n: Optional[int]=None) -> np.ndarray:
+        with self._lock:
+            ring = self._ticks.get(symbol)
+            return ring.last(n) if ring is not None else np.empty((0, 3))
+
+    def get_bars(self, symbol: str, interval: str="1m", limit: int=100) -> pd.DataFrame:
+        """In-memory OHLCV bars as a DataFrame (Open/High/Low/Close/Volume, UTC DatetimeIndex)."""
+        if interval not in INTERVALS:
+            raise ValueError(f"Unsupported interval: {interval}")
+        with self._lock:
+            bars = self._bars.get(symbol, {}).get(interval)
+            arr = bars.last(limit) if bars is not None else np.empty((0, 6))
+        return _bars_frame(arr)
+
+    def get_bars_or_backfill(self, symbol: str, interval: str, limit: int, backfill: Backfill) -> pd.DataFrame:
+        """
+        Serve `limit` bars from memory; if memory is short, prepend older bars from
+        backfill(symbol, interval, limit). A backfill is reused while it still reaches the
+        first in-memory bar, or for one interval when this process has no ticks for the
+        symbol (always the case outside the poller process). At most max_history backfills
+        are kept, least recently used evicted first.
+        """
+        mem = self.get_bars(symbol, interval, limit)
+        if len(mem) >= limit:
+            self.stats["memory_hits"] += 1
+            return mem
+        key = (symbol, interval)
+        with self._lock:
+            cached = self._history.get(key)
+            if cached is not None:
+                self._history.move_to_end(key)
+        fresh = cached is not None and (
+            (not mem.empty and not cached[1].empty and cached[1].index[-1] >= mem.index[0])
+            or (mem.empty and time.time() - cached[0] < INTERVALS[interval]))
+        if fresh:
+            self.stats["memory_hits"] += 1
+            history = cached[1]
+        else:
+            self.stats["backfills"] += 1
+            history = _normalize_history(backfill(symbol, interval, limit))
+            with self._lock:
+                self._history[key] = (time.time(), history)
+                self._history.move_to_end(key)
+                while len(self._history) > self.max_history:
+                    self._history.popitem(last=False)
+        if mem.empty:
+            return history.tail(limit)
+        if history.empty:
+            return mem
+        # the first in-memory bar is usually partial (ingestion began mid-bar), so upstream wins for it
+        first = mem.index[0]
+        if first in history.index:
+            merged = pd.concat([history[history.index <= first], mem.iloc[1:]])
+        else:
+            merged = pd.concat([history[history.index < first], mem])
+        return merged.tail(limit)
+
+def _normalize_history(df: Optional[pd.DataFrame]) -> pd.DataFrame:
+    """Upstream frames -> BAR_COLUMNS with a sorted UTC DatetimeIndex."""
+    if df is None or df.empty:
+        return pd.DataFrame(columns=BAR_COLUMNS, index=pd.DatetimeIndex([], tz="UTC"))
+    df = df.reindex(columns=BAR_COLUMNS)
+    index = pd.DatetimeIndex(df.index)
+    df.index = index.tz_localize("UTC") if index.tz is None else index.tz_convert("UTC")
+    return df.sort_index()
+
+def _bars_frame(arr: np.ndarray) -> pd.DataFrame:
+    index = pd.to_datetime(arr[:, 0], unit="s", utc=True)
+    return pd.DataFrame(arr[:, 1:], index=index, columns=BAR_COLUMNS)
+
+tick_store = TickStore()
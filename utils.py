@@ -5,28 +5,103 @@ Helpers: password hashing, validation, rate limiting (Redis-backed optional), CS
 2FA (TOTP) helpers, email token generation using itsdangerous.
 """
 
+import asyncio
 import bcrypt
-#from typing import Tuple, Optional
+from concurrent.futures import ThreadPoolExecutor
+from typing import Tuple, Optional, Iterable, Iterator, NamedTuple
+import threading
+from collections import OrderedDict
 import re
 import time
 import csv
 import io
 import os
 import redis
+import uuid
 import base64
+import zlib
 import pyotp
 from itsdangerous import URLSafeTimedSerializer
 
 # --- Password hashing ---
-def hash_password(password: str) -> bytes:
-    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt())
+# Cost factor for new hashes; stored hashes with a different cost are upgraded on login.
+BCRYPT_ROUNDS = int(os.environ.get("CROSSP_BCRYPT_ROUNDS", "12"))
+# bcrypt releases the GIL, so a thread pool runs verifications in parallel across cores.
+BCRYPT_WORKERS = int(os.environ.get("CROSSP_BCRYPT_WORKERS", str(os.cpu_count() or 1)))
+
+_bcrypt_pool: Optional[ThreadPoolExecutor] = None
+_bcrypt_pool_lock = threading.Lock()
+
+def _to_bytes(value) -> bytes:
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+def hash_password(password: str, rounds: Optional[int]=None) -> bytes:
+    return bcrypt.hashpw(password.encode('utf-8'), bcrypt.gensalt(rounds or BCRYPT_ROUNDS))
 
 def check_password(password: str, password_hash: bytes) -> bool:
     try:
-        return bcrypt.checkpw(password.encode('utf-8'), password_hash)
+        return bcrypt.checkpw(password.encode('utf-8'), _to_bytes(password_hash))
     except Exception:
         return False
 
+def bcrypt_cost(password_hash: bytes) -> Optional[int]:
+    """Cost factor encoded in a bcrypt hash ($2b$12$...), or None if it is not one."""
+    parts = _to_bytes(password_hash).split(b'$')
+    try:
+        return int(parts[2])
+    except (IndexError, ValueError):
+        return None
+
+def needs_rehash(password_hash: bytes, rounds: Optional[int]=None) -> bool:
+    return bcrypt_cost(password_hash) != (rounds or BCRYPT_ROUNDS)
+
+def verify_and_upgrade(password: str, password_hash: bytes) -> Tuple[bool, Optional[bytes]]:
+    """
+    Check a password; when it matches a hash made with a different cost factor, also
+    return a fresh hash at BCRYPT_ROUNDS for the caller to store (else None).
+    """
+    if not check_password(password, password_hash):
+        return False, None
+    return True, hash_password(password) if needs_rehash(password_hash) else None
+
+def _get_bcrypt_pool() -> ThreadPoolExecutor:
+    global _bcrypt_pool
+    if _bcrypt_pool is None:
+        with _bcrypt_pool_lock:
+            if _bcrypt_pool is None:
+                _bcrypt_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+    return _bcrypt_pool
+
+async def _in_bcrypt_pool(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(_get_bcrypt_pool(), fn, *args)
+
+async def hash_password_async(password: str, rounds: Optional[int]=None) -> bytes:
+    """hash_password on the bounded bcrypt pool, keeping the event loop free."""
+    return await _in_bcrypt_pool(hash_password, password, rounds)
+
+async def check_password_async(password: str, password_hash: bytes) -> bool:
+    return await _in_bcrypt_pool(check_password, password, password_hash)
+
+async def verify_and_upgrade_async(password: str, password_hash: bytes) -> Tuple[bool, Optional[bytes]]:
+    return await _in_bcrypt_pool(verify_and_upgrade, password, password_hash)
+
+async def authenticate(username: str, password: str):
+    """
+    The user row if username/password match, else None. A hash made with a different
+    cost factor is transparently replaced with one at BCRYPT_ROUNDS. The SQLite read and
+    write run in worker threads too, so a busy database never stalls the event loop.
+    """
+    from database import get_user_by_username, update_password_hash
+    user = await asyncio.to_thread(get_user_by_username, username)
+    if not user:
+        return None
+    ok, new_hash = await verify_and_upgrade_async(password, user['password_hash'])
+    if not ok:
+        return None
+    if new_hash is not None:
+        await asyncio.to_thread(update_password_hash, user['id'], new_hash)
+    return user
+
 # --- Input validation ---
 def valid_username(u: str) -> bool:
     return bool(re.match(r'^[A-Za-z0-9_.-]{3,40}$', u))
@@ -44,56 +119,324 @@ if REDIS_URL:
     except Exception:
         _redis_client = None
 
-_mem_buckets = {}
+
+def get_redis_client():
+    """The shared Redis client configured from REDIS_URL, or None if unavailable."""
+    return _redis_client
+
+class RateLimitResult(NamedTuple):
+    allowed: bool
+    remaining: int       # requests still allowed right now
+    retry_after: float   # seconds until the next request would be allowed (0 if allowed)
+
+RATE_LIMIT_ALGORITHMS = ("sliding", "gcra")
+
+# Both scripts read the clock with Redis TIME, so every app host shares one clock, and do
+# the whole check-and-record server-side, so a check is one atomic round trip.
+_NOW_MS_LUA = """
+if redis.replicate_commands then redis.replicate_commands() end
+local t = redis.call('TIME')
+local now = tonumber(t[1]) * 1000 + math.floor(tonumber(t[2]) / 1000)
+"""
+
+_SLIDING_WINDOW_LUA = _NOW_MS_LUA + """
+local key = KEYS[1]
+local window = tonumber(ARGV[1])
+local limit = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', key, '-inf', now - window)
+local count = redis.call('ZCARD', key)
+if count < limit then
+    redis.call('ZADD', key, now, ARGV[3])
+    redis.call('PEXPIRE', key, window)
+    return {1, limit - count - 1, 0}
+end
+local oldest = redis.call('ZRANGE', key, 0, 0, 'WITHSCORES')
+local retry = window
+if oldest[2] then retry = tonumber(oldest[2]) + window - now end
+return {0, 0, retry}
+"""
+
+# GCRA: one stored value (the theoretical arrival time) per key; `burst` requests may
+# arrive back to back, after which they are spaced `interval` ms apart.
+_GCRA_LUA = _NOW_MS_LUA + """
+local key = KEYS[1]
+local interval = tonumber(ARGV[1])
+local burst = tonumber(ARGV[2])
+local tat = now
+local stored = redis.call('GET', key)
+if stored then tat = math.max(tonumber(stored), now) end
+local allow_at = tat + interval - burst * interval
+if now < allow_at then
+    return {0, 0, math.ceil(allow_at - now)}
+end
+local new_tat = tat + interval
+redis.call('SET', key, new_tat, 'PX', math.ceil(new_tat - now))
+return {1, math.floor((now - (new_tat - burst * interval)) / interval), 0}
+"""
+
+_scripts = {}
+
+def _script(client, name: str, source: str):
+    script = _scripts.get(name)
+    if script is None:
+        script = _scripts[name] = client.register_script(source)
+    return script
+
+def _redis_check(client, key: str, limit: int, per_seconds: float, algorithm: str, burst: int) -> RateLimitResult:
+    window_ms = int(per_seconds * 1000)
+    if algorithm == "gcra":
+        allowed, remaining, retry_ms = _script(client, "gcra", _GCRA_LUA)(
+            keys=[f"rl:gcra:{key}"], args=[window_ms / limit, burst], client=client)
+    else:
+        # unique member per request across hosts, so bursts within one millisecond all count
+        allowed, remaining, retry_ms = _script(client, "sliding", _SLIDING_WINDOW_LUA)(
+            keys=[f"rl:{key}"], args=[window_ms, limit, uuid.uuid4().hex], client=client)
+    return RateLimitResult(bool(allowed), int(remaining), int(retry_ms) / 1000.0)
+
+class _WindowCounter:
+    """Sliding-window counter: this fixed window's count plus the previous one's, weighted."""
+    __slots__ = ("index", "current", "previous", "expires")
+    def __init__(self):
+        self.index = 0  # now // window, kept as an int so consecutive windows compare exactly
+        self.current = 0
+        self.previous = 0
+        self.expires = 0.0
+
+class _GcraState:
+    __slots__ = ("tat", "expires")
+    def __init__(self, now: float):
+        self.tat = now
+        self.expires = now
+
+class MemoryRateLimiter:
+    """
+    In-process limiter used when Redis is unavailable. Every check is O(1): "sliding" is
+    approximated with a two-window weighted counter and "gcra" stores one timestamp per key.
+    Keys live in an LRU capped at `max_keys`; keys whose state has fully decayed are dropped
+    as they reach the cold end, so idle clients cost nothing. Safe to share between threads.
+    """
+    def __init__(self, max_keys: int=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._states: "OrderedDict[tuple, object]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"evicted": 0, "expired": 0}
+
+    def __len__(self) -> int:
+        return len(self._states)
+
+    def _evict(self, now: float):
+        # drop decayed keys from the LRU end; one per check keeps the sweep O(1) amortised
+        states = self._states
+        for _ in range(2):
+            if not states:
+                return
+            key, state = next(iter(states.items()))
+            if state.expires > now:
+                break
+            del states[key]
+            self.stats["expired"] += 1
+        while len(states) > self.max_keys:
+            states.popitem(last=False)
+            self.stats["evicted"] += 1
+
+    def check(self, key: str, limit: int, per_seconds: float, algorithm: str="sliding",
+              burst: Optional[int]=None) -> RateLimitResult:
+        now = self.clock()
+        with self._lock:
+            if algorithm == "gcra":
+                result = self._gcra(("gcra", key), now, per_seconds / limit, burst or limit)
+            else:
+                result = self._sliding(("sliding", key), now, limit, per_seconds)
+            self._evict(now)
+        return result
+
+    def _state(self, skey: tuple, factory):
+        state = self._states.get(skey)
+        if state is None:
+            state = self._states[skey] = factory()
+        else:
+            self._states.move_to_end(skey)
+        return state
+
+    def _gcra(self, skey: tuple, now: float, interval: float, burst: int) -> RateLimitResult:
+        state = self._state(skey, lambda: _GcraState(now))
+        tat = max(state.tat, now)
+        allow_at = tat + interval - burst * interval
+        if now < allow_at:
+            return RateLimitResult(False, 0, allow_at - now)
+        state.tat = state.expires = tat + interval
+        return RateLimitResult(True, int((now - (state.tat - burst * interval)) / interval + 1e-9), 0.0)
+
+    def _sliding(self, skey: tuple, now: float, limit: int, window: float) -> RateLimitResult:
+        state = self._state(skey, _WindowCounter)
+        index = int(now // window)
+        if index != state.index:
+            state.previous = state.current if index - state.index == 1 else 0
+            state.current = 0
+            state.index = index
+        start = index * window
+        weight = 1.0 - (now - start) / window
+        estimate = state.previous * weight + state.current
+        if estimate + 1 > limit:
+            if state.current + 1 > limit or not state.previous:
+                retry = start + window - now
+            else:
+                # when the previous window's share has decayed enough for one more request
+                retry = start + window * (1.0 - (limit - 1 - state.current) / state.previous) - now
+            return RateLimitResult(False, 0, max(retry, 0.0))
+        state.current += 1
+        state.expires = start + 2 * window
+        return RateLimitResult(True, max(int(limit - estimate - 1 + 1e-9), 0), 0.0)
+
+_memory_limiter = MemoryRateLimiter(max_keys=int(os.environ.get("CROSSP_RATE_LIMIT_MAX_KEYS", "100000")))
+
+def check_rate_limit(key: str, limit: int=10, per_seconds: float=60, algorithm: str="sliding",
+                     burst: Optional[int]=None, client=None) -> RateLimitResult:
+    """
+    Allow at most `limit` requests per `per_seconds` for `key`.
+    algorithm="sliding" keeps an exact sliding-window log; "gcra" is a token bucket that
+    allows `burst` (default: limit) back-to-back requests and then spaces them evenly.
+    Uses Redis (one atomic script call) when available, else the bounded in-process
+    MemoryRateLimiter; a Redis error also falls back rather than failing the request.
+    """
+    if algorithm not in RATE_LIMIT_ALGORITHMS:
+        raise ValueError(f"Unknown rate limit algorithm: {algorithm}")
+    burst = burst or limit
+    client = client or _redis_client
+    if client is not None:
+        try:
+            return _redis_check(client, key, limit, per_seconds, algorithm, burst)
+        except redis.RedisError:
+            pass
+    return _memory_limiter.check(key, limit, per_seconds, algorithm, burst)
 
 def rate_limit(key: str, limit: int=10, per_seconds: int=60) -> bool:
+    """Sliding window rate limiter. Returns True if allowed (see check_rate_limit)."""
+    return check_rate_limit(key, limit, per_seconds).allowed
+
+# --- CSV export ---
+TRANSACTION_FIELDS = ["id","symbol","asset_type","side","quantity","price","currency","timestamp"]
+HOLDING_FIELDS = ["id","symbol","asset_type","quantity","avg_price","last_updated"]
+BALANCE_FIELDS = ["id","currency","amount","updated_at"]
+
+def iter_portfolio_csv(rows: Iterable, holdings: Iterable, balances: Iterable,
+                       chunk_rows: int=1000, compress: bool=False) -> Iterator[bytes]:
     """
-    Redis sliding window rate limiter. Returns True if allowed.
-    If Redis not available, fallback to in-memory bucket (not shared between processes).
+    Yield the portfolio CSV as encoded chunks of ~chunk_rows lines, so only one chunk is in
+    memory at a time. `rows` may be a generator such as database.iter_transactions.
+    compress=True yields a gzip stream instead of plain CSV.
     """
-    now = int(time.time())
-    if _redis_client:
-        redis_key = f"rl:{key}"
-        pipe = _redis_client.pipeline()
-        # trim older than window
-        pipe.zremrangebyscore(redis_key, 0, now - per_seconds)
-        pipe.zcard(redis_key)
-        pipe.execute()
-        # add now
-        _redis_client.zadd(redis_key, {str(now): now})
-        _redis_client.expire(redis_key, per_seconds + 5)
-        count = _redis_client.zcard(redis_key)
-        return count <= limit
-    else:
-        # in-memory fallback
-        bucket = _mem_buckets.get(key, [])
-        bucket = [t for t in bucket if t > time.time() - per_seconds]
-        if len(bucket) >= limit:
-            _mem_buckets[key] = bucket
-            return False
-        bucket.append(time.time())
-        _mem_buckets[key] = bucket
+    gz = zlib.compressobj(wbits=31) if compress else None
+    buf = io.StringIO()
+    writer = csv.writer(buf)
+    pending = 0
+
+    def drain() -> bytes:
+        data = buf.getvalue().encode('utf-8')
+        buf.seek(0)
+        buf.truncate()
+        return gz.compress(data) if gz else data
+
+    sections = (("Transactions", TRANSACTION_FIELDS, rows),
+                ("Holdings", HOLDING_FIELDS, holdings),
+                ("Balances", BALANCE_FIELDS, balances))
+    for i, (title, fields, items) in enumerate(sections):
+        if i:
+            writer.writerow([])
+        writer.writerow([title])
+        writer.writerow(fields)
+        for r in items:
+            writer.writerow([r[f] for f in fields])
+            pending += 1
+            if pending >= chunk_rows:
+                pending = 0
+                chunk = drain()
+                if chunk:
+                    yield chunk
+    tail = drain()
+    if gz:
+        tail += gz.flush()
+    if tail:
+        yield tail
+
+class _ChunkSink(io.RawIOBase):
+    """Write-only file object that hands written bytes back to the caller in chunks."""
+    def __init__(self):
+        self._chunks = []
+        self._pos = 0
+    def writable(self):
         return True
+    def write(self, b):
+        self._chunks.append(bytes(b))
+        self._pos += len(b)
+        return len(b)
+    def tell(self):
+        return self._pos
+    def take(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks = []
+        return data
+
+def iter_transactions_parquet(rows: Iterable, chunk_rows: int=50000) -> Iterator[bytes]:
+    """
+    Yield transactions as a Parquet file, one row group per chunk_rows rows.
+    Requires pyarrow; raises RuntimeError if it is not installed.
+    """
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise RuntimeError("Parquet export requires pyarrow")
+    schema = pa.schema([("id", pa.int64()), ("symbol", pa.string()), ("asset_type", pa.string()),
+                        ("side", pa.string()), ("quantity", pa.float64()), ("price", pa.float64()),
+                        ("currency", pa.string()), ("timestamp", pa.string())])
+    sink = _ChunkSink()
+    writer = pq.ParquetWriter(sink, schema)
+    batch = []
+
+    def write_batch():
+        cols = {f: [r[f] for r in batch] for f in TRANSACTION_FIELDS}
+        writer.write_table(pa.Table.from_pydict(cols, schema=schema))
+        batch.clear()
 
-# --- CSV export ---
-def portfolio_to_csv(rows, holdings, balances) -> Tuple[str, bytes]:
-    output = io.StringIO()
-    writer = csv.writer(output)
-    writer.writerow(["Transactions"])
-    writer.writerow(["id","symbol","asset_type","side","quantity","price","currency","timestamp"])
     for r in rows:
-        writer.writerow([r['id'], r['symbol'], r['asset_type'], r['side'], r['quantity'], r['price'], r['currency'], r['timestamp']])
-    writer.writerow([])
-    writer.writerow(["Holdings"])
-    writer.writerow(["id","symbol","asset_type","quantity","avg_price","last_updated"])
-    for h in holdings:
-        writer.writerow([h['id'], h['symbol'], h['asset_type'], h['quantity'], h['avg_price'], h['last_updated']])
-    writer.writerow([])
-    writer.writerow(["Balances"])
-    writer.writerow(["id","currency","amount","updated_at"])
-    for b in balances:
-        writer.writerow([b['id'], b['currency'], b['amount'], b['updated_at']])
-    data = output.getvalue().encode('utf-8')
+        batch.append(r)
+        if len(batch) >= chunk_rows:
+            write_batch()
+            data = sink.take()
+            if data:
+                yield data
+    if batch:
+        write_batch()
+    writer.close()
+    data = sink.take()
+    if data:
+        yield data
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv", "csv"),
+    "csv.gz": ("application/gzip", "csv.gz"),
+    "parquet": ("application/vnd.apache.parquet", "parquet"),
+}
+
+def stream_portfolio_export(rows: Iterable, holdings: Iterable, balances: Iterable,
+                            fmt: str="csv") -> Tuple[str, str, Iterator[bytes]]:
+    """
+    Return (filename, media_type, chunk iterator) for a streaming download
+    (e.g. FastAPI StreamingResponse). Parquet output contains transactions only.
+    """
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unsupported export format: {fmt}")
+    media_type, ext = EXPORT_FORMATS[fmt]
+    filename = f"crossp_portfolio_{int(time.time())}.{ext}"
+    if fmt == "parquet":
+        return filename, media_type, iter_transactions_parquet(rows)
+    return filename, media_type, iter_portfolio_csv(rows, holdings, balances, compress=(fmt == "csv.gz"))
+
+def portfolio_to_csv(rows, holdings, balances) -> Tuple[str, bytes]:
+    """Whole-file CSV export (for st.download_button); prefer stream_portfolio_export for large accounts."""
+    data = b"".join(iter_portfolio_csv(rows, holdings, balances))
     filename = f"crossp_portfolio_{int(time.time())}.csv"
     return filename, data
 
@@ -0,0 +1,139 @@
+"""
+valuation_job.py
+
+End-of-day batch valuation of every account. The user id space is split into contiguous
+shards valued in a process pool; each shard streams its users, holdings and balances in
+three range queries and values them with pandas, using one price per distinct symbol
+(fetched once up front) and one USD-pivot rate table for all currency conversion.
+Results land in the valuation_snapshots table, in each user's preferred currency.
+
+    python valuation_job.py --workers 4 --shards 32
+    python valuation_job.py --as-of 2024-06-28 --rates eod_rates.json
+"""
+import argparse
+import datetime
+import json
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
+
+import pandas as pd
+
+from database import (get_user_id_bounds, get_held_symbols, get_account_currencies, iter_users_range,
+                      iter_holdings_range, iter_balances_range, save_valuation_snapshots)
+
+def fetch_usd_rates(currencies: Iterable[str]) -> Dict[str, float]:
+    """USD value of one unit of each currency, from the shared FX rate matrix."""
+    from api_integrations import fx_rates
+    return fx_rates.rates_to("USD", currencies)
+
+def shard_ranges(lo: int, hi: int, shards: int) -> List[Tuple[int, int]]:
+    """Split [lo, hi] into at most `shards` contiguous, non-empty id ranges."""
+    if hi < lo:
+        return []
+    size = max(1, -(-(hi - lo + 1) // max(1, shards)))
+    return [(start, min(start + size - 1, hi)) for start in range(lo, hi + 1, size)]
+
+def value_shard(lo: int, hi: int, prices: Dict[str, Optional[float]], symbol_currency: Dict[str, str],
+                usd_rates: Dict[str, float]) -> List[tuple]:
+    """
+    Snapshot rows for users lo..hi (see database.save_valuation_snapshots for the layout).
+    A holding without a price, or a holding or balance whose currency (or the user's
+    preferred currency) is missing from usd_rates, is left out of the values and counted
+    in `unpriced`, so one bad symbol never drops a whole account or is silently misvalued.
+    """
+    users = pd.DataFrame([tuple(r) for r in iter_users_range(lo, hi)], columns=["user_id", "currency"])
+    if users.empty:
+        return []
+    users = users.set_index("user_id")
+    pref_usd = users["currency"].map(usd_rates)
+
+    h = pd.DataFrame([tuple(r) for r in iter_holdings_range(lo, hi)],
+                     columns=["user_id", "symbol", "quantity", "avg_price"])
+    h["price"] = h["symbol"].map(prices).astype(float)
+    h["factor"] = (h["symbol"].map(symbol_currency).map(usd_rates).to_numpy(dtype=float)
+                   / pref_usd.reindex(h["user_id"]).to_numpy(dtype=float))
+    priced = h["price"].notna() & h["factor"].notna()
+    h["value"] = (h["quantity"] * h["price"] * h["factor"]).where(priced, 0.0)
+    h["cost"] = (h["quantity"] * h["avg_price"] * h["factor"]).where(priced, 0.0)
+    h["unpriced"] = (~priced).astype(int)
+    per_user = h.groupby("user_id").agg(holdings_value=("value", "sum"), cost=("cost", "sum"),
+                                        positions=("symbol", "size"), unpriced=("unpriced", "sum"))
+
+    b = pd.DataFrame([tuple(r) for r in iter_balances_range(lo, hi)], columns=["user_id", "currency", "amount"])
+    b["cash"] = (b["amount"] * b["currency"].map(usd_rates).to_numpy(dtype=float)
+                 / pref_usd.reindex(b["user_id"]).to_numpy(dtype=float))
+    b["unconverted"] = b["cash"].isna().astype(int)
+    cash = b.groupby("user_id").agg(cash_value=("cash", "sum"), unconverted=("unconverted", "sum"))
+
+    out = users.join(per_user).join(cash).fillna(
+        {"holdings_value": 0.0, "cost": 0.0, "positions": 0, "unpriced": 0, "cash_value": 0.0, "unconverted": 0})
+    out["unpriced"] += out["unconverted"]
+    out["total_value"] = out["holdings_value"] + out["cash_value"]
+    out["unrealized_pnl"] = out["holdings_value"] - out["cost"]
+    return [(int(uid), r.currency, float(r.holdings_value), float(r.cash_value), float(r.total_value),
+             float(r.unrealized_pnl), int(r.positions), int(r.unpriced))
+            for uid, r in out.iterrows()]
+
+def _value_shard_args(args: tuple) -> List[tuple]:
+    return value_shard(*args)
+
+def run_valuation(as_of: Optional[str]=None, workers: Optional[int]=None, shards: Optional[int]=None,
+                  prices: Optional[Dict[str, Optional[float]]]=None,
+                  usd_rates: Optional[Dict[str, float]]=None,
+                  price_fetcher: Optional[Callable[[List[str]], Dict[str, Optional[float]]]]=None) -> Dict:
+    """
+    Value every account and write one snapshot row per user for `as_of` (default: today UTC).
+    `prices` / `usd_rates` may be supplied to pin an end-of-day fix; otherwise each distinct
+    symbol is priced once through price_fetcher (api_integrations.get_current_prices).
+    """
+    t0 = time.perf_counter()
+    as_of = as_of or datetime.datetime.utcnow().date().isoformat()
+    workers = workers or os.cpu_count() or 1
+    shards = shards or workers * 4
+    symbol_currency = get_held_symbols()
+    if prices is None:
+        if price_fetcher is None:
+            from api_integrations import get_current_prices as price_fetcher
+        prices = price_fetcher(sorted(symbol_currency)) if symbol_currency else {}
+    if usd_rates is None:
+        usd_rates = fetch_usd_rates(get_account_currencies() | set(symbol_currency.values()))
+    ranges = shard_ranges(*get_user_id_bounds(), shards)
+    jobs = [(lo, hi, prices, symbol_currency, usd_rates) for lo, hi in ranges]
+    rows: List[tuple] = []
+    if workers <= 1 or len(jobs) <= 1:
+        for job in jobs:
+            rows.extend(_value_shard_args(job))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for shard_rows in pool.map(_value_shard_args, jobs):
+                rows.extend(shard_rows)
+    saved = save_valuation_snapshots(as_of, rows)
+    return {"as_of": as_of, "accounts": saved, "symbols": len(symbol_currency), "shards": len(jobs),
+            "unpriced": sum(r[7] for r in rows), "seconds": time.perf_counter() - t0}
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Value every Cross-P account into valuation_snapshots.")
+    parser.add_argument("--as-of", help="snapshot date (default: today, UTC)")
+    parser.add_argument("--workers", type=int, default=None, help="processes (default: CPU count)")
+    parser.add_argument("--shards", type=int, default=None, help="user id shards (default: 4 per worker)")
+    parser.add_argument("--prices", help="JSON file of symbol -> price instead of live quotes")
+    parser.add_argument("--rates", help="JSON file of currency -> USD value of one unit")
+    args = parser.parse_args(argv)
+    prices = rates = None
+    if args.prices:
+        with open(args.prices, encoding="utf-8") as f:
+            prices = json.load(f)
+    if args.rates:
+        with open(args.rates, encoding="utf-8") as f:
+            rates = json.load(f)
+    stats = run_valuation(args.as_of, args.workers, args.shards, prices, rates)
+    elapsed = stats["seconds"]
+    print(f"{stats['accounts']} accounts valued for {stats['as_of']} in {elapsed:.2f}s "
+          f"({stats['accounts'] / elapsed if elapsed else 0:,.0f} accounts/s; {stats['symbols']} symbols, "
+          f"{stats['shards']} shards, {stats['unpriced']} unpriced holdings/balances)")
+    return stats
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+wire.py
+
+Wire encodings for market update streams. Clients pick one at connect time
+(`?protocol=json|msgpack|struct`); every codec carries the same two message kinds:
+"prices" (a delta of changed symbols) and "snapshot" (all of a client's symbols).
+
+json     {"type": "prices", "data": {symbol: price}} for deltas and
+         {"type": "snapshot", "seq": n, "data": {...}} for snapshots (text frames). Deltas
+         keep the original seq-less shape, so JSON clients cannot detect a gap; they resync
+         on the next snapshot. Use msgpack or struct when gaps must be detectable.
+msgpack  the same mapping, msgpack-encoded (binary frames; requires the msgpack package)
+struct   fixed little-endian layout (binary frames):
+         header  kind:u8 (0=prices, 1=snapshot) | seq:u32 | ts:f64 | count:u16
+         entry   len:u8 | symbol:utf-8[len] | price:f64 (NaN = unknown)
+         so symbols are at most 255 UTF-8 bytes and a frame holds at most 65535 of them.
+"""
+import json
+import math
+import struct
+import time
+from typing import Dict, Optional, Tuple, Union
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
+
+Prices = Dict[str, Optional[float]]
+KINDS = ("prices", "snapshot")
+
+class CodecError(ValueError):
+    """Raised when a message cannot be represented in a codec's wire format."""
+
+class JsonCodec:
+    name = "json"
+    binary = False
+    def encode(self, kind: str, prices: Prices, seq: int=0, ts: Optional[float]=None) -> str:
+        # seq is omitted for plain deltas so the default stream keeps its original shape
+        msg = {"type": kind, "data": prices}
+        if kind == "snapshot":
+            msg["seq"] = seq
+        return json.dumps(msg)
+    def decode(self, data: str) -> Tuple[str, int, Prices]:
+        msg = json.loads(data)
+        return msg["type"], msg.get("seq", 0), msg["data"]
+
+class MsgpackCodec:
+    name = "msgpack"
+    binary = True
+    def __init__(self):
+        if msgpack is None:
+            raise RuntimeError("msgpack protocol requires the msgpack package")
+    def encode(self, kind: str, prices: Prices, seq: int=0, ts: Optional[float]=None) -> bytes:
+        return msgpack.packb({"type": kind, "seq": seq, "ts": ts or time.time(), "data": prices})
+    def decode(self, data: bytes) -> Tuple[str, int, Prices]:
+        msg = msgpack.unpackb(data)
+        return msg["type"], msg["seq"], msg["data"]
+
+_HEADER = struct.Struct("<BIdH")
+_PRICE = struct.Struct("<d")
+
+class StructCodec:
+    name = "struct"
+    binary = True
+    def encode(self, kind: str, prices: Prices, seq: int=0, ts: Optional[float]=None) -> bytes:
+        if len(prices) > 0xFFFF:
+            raise CodecError(f"struct frames hold at most 65535 symbols, got {len(prices)}")
+        parts = [_HEADER.pack(KINDS.index(kind), seq & 0xFFFFFFFF, ts or time.time(), len(prices))]
+        for sym, price in prices.items():
+            raw = sym.encode("utf-8")
+            if len(raw) > 0xFF:
+                raise CodecError(f"struct symbols are at most 255 bytes, got {len(raw)} for {sym[:32]!r}...")
+            parts.append(bytes((len(raw),)))
+            parts.append(raw)
+            parts.append(_PRICE.pack(math.nan if price is None else price))
+        return b"".join(parts)
+    def decode(self, data: bytes) -> Tuple[str, int, Prices]:
+        kind, seq, _ts, count = _HEADER.unpack_from(data, 0)
+        offset = _HEADER.size
+        prices: Prices = {}
+        for _ in range(count):
+            n = data[offset]
+            sym = data[offset + 1:offset + 1 + n].decode("utf-8")
+            offset += 1 + n
+            (price,) = _PRICE.unpack_from(data, offset)
+            offset += _PRICE.size
+            prices[sym] = None if math.isnan(price) else price
+        return KINDS[kind], seq, prices
+
+_CODECS = {"json": JsonCodec, "msgpack": MsgpackCodec, "struct": StructCodec}
+_instances: Dict[str, object] = {}
+
+def get_codec(name: Optional[str]) -> Union[JsonCodec, MsgpackCodec, StructCodec]:
+    """Codec for a protocol name; unknown names (or msgpack without the package) fall back to json."""
+    name = (name or "json").lower()
+    if name not in _instances:
+        try:
+            _instances[name] = _CODECS[name]()
+        except (KeyError, RuntimeError):
+            return get_codec("json")
+    return _instances[name]